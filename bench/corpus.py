@@ -0,0 +1,233 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Deterministic synthetic log corpora for the benchmarks.
+
+Each generator takes a random.Random instance and a number of entries
+and returns the log file data as a string. The same seed always gives
+the same data. A small share of the lines are malformed or contain
+multi-line tracebacks to exercise the slow paths of the parsers.
+"""
+
+import json
+import time
+
+# Start of generated timestamps, 2009-05-15 00:00:00 UTC
+START_TIME = 1242345600
+
+# Client addresses
+IPS = ['10.0.%d.%d' % (num / 250, num % 250 + 1) for num in xrange(500)]
+# Request methods, weighted
+METHODS = ['GET'] * 8 + ['POST', 'HEAD']
+# Request paths
+PATHS = ['/', '/index.html', '/static/css/main.css', '/static/js/app.js',
+         '/api/v1/items', '/api/v1/items/%d', '/search', '/login',
+         '/img/logo.png', '/account/%d/settings']
+# Response status codes, weighted
+STATUSES = [200] * 14 + [302, 302, 304, 404, 500]
+# User agents
+USER_AGENTS = [
+    'Mozilla/5.0 (X11; Linux x86_64; rv:3.5) Gecko/20090615 Firefox/3.5',
+    'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 5.1)',
+    'Mozilla/5.0 (Macintosh; U; Intel Mac OS X 10_5_7; en-us) Safari/530',
+    'Googlebot/2.1 (+http://www.google.com/bot.html)',
+    'curl/7.19.5 (x86_64-pc-linux-gnu) libcurl/7.19.5',
+    'Java/1.6.0_14']
+# Java exception classes used in tracebacks
+EXCEPTIONS = ['java.lang.NullPointerException',
+              'java.lang.IllegalStateException: connection closed',
+              'java.sql.SQLException: Lock wait timeout exceeded']
+# Rails controllers and actions
+CONTROLLERS = ['ItemsController#index', 'ItemsController#show',
+               'SessionsController#create', 'SearchController#index']
+
+def _timestamps(rand, count):
+    """
+    Return iterator over count increasing UTC struct_time values,
+    several entries per second.
+    """
+    now = START_TIME
+    for _ in xrange(count):
+        now += rand.choice((0, 0, 0, 1))
+        yield time.gmtime(now)
+
+def _path(rand):
+    """
+    Get random request path.
+    """
+    path = rand.choice(PATHS)
+    if '%d' in path:
+        path = path % (rand.randint(1, 100000), )
+    if rand.random() < 0.2:
+        path += '?q=%d&page=%d' % (rand.randint(1, 1000), rand.randint(1, 9))
+    return path
+
+def _java_traceback(rand):
+    """
+    Get Java stack trace lines.
+    """
+    lines = [rand.choice(EXCEPTIONS)]
+    for depth in xrange(rand.randint(3, 12)):
+        lines.append('\tat com.example.app.Service%d.call(Service%d.java:%d)'
+                     % (depth, depth, rand.randint(10, 900)))
+    return lines
+
+def apache_access(rand, count):
+    """
+    Apache combined format access log, with some escaped quotes,
+    truncated request lines and garbage lines.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        roll = rand.random()
+        if roll < 0.005:
+            lines.append('%s garbage line without format\n'
+                         % (rand.choice(IPS), ))
+            continue
+        request = '%s %s HTTP/1.1' % (rand.choice(METHODS), _path(rand))
+        user_agent = rand.choice(USER_AGENTS)
+        status = rand.choice(STATUSES)
+        if roll < 0.01:
+            request = '-'
+            status = 408
+        elif roll < 0.015:
+            user_agent = 'Mozilla/5.0 \\"quoted\\" agent'
+        lines.append(
+            '%s - - [%s +0000] "%s" %d %s "%s" "%s"\n'
+            % (rand.choice(IPS),
+               time.strftime('%d/%b/%Y:%H:%M:%S', timestamp), request,
+               status, rand.choice(('-', str(rand.randint(1, 90000)))),
+               rand.choice(('-', 'http://www.example.com/')), user_agent))
+    return ''.join(lines)
+
+def apache_error(rand, count):
+    """
+    Apache error log, client errors mixed with server notices that
+    the parser does not handle.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        time_str = time.strftime('%a %b %d %H:%M:%S %Y', timestamp)
+        if rand.random() < 0.1:
+            lines.append('[%s] [notice] caught SIGTERM, shutting down\n'
+                         % (time_str, ))
+        else:
+            lines.append('[%s] [error] [client %s] File does not exist: '
+                         '/var/www%s\n' % (time_str, rand.choice(IPS),
+                                           _path(rand)))
+    return ''.join(lines)
+
+def glassfish(rand, count):
+    """
+    Glassfish server.log, with multi-line messages carrying stack
+    traces.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        level = rand.choice(('INFO', 'INFO', 'INFO', 'WARNING', 'SEVERE'))
+        prefix = '[#|%s.%03d+0000|%s|glassfish|javax.enterprise.system|' % (
+            time.strftime('%Y-%m-%dT%H:%M:%S', timestamp),
+            rand.randint(0, 999), level)
+        if level == 'SEVERE':
+            trace = '\n'.join(_java_traceback(rand))
+            lines.append('%sThread-%d;|Request failed\n%s\n|#]\n'
+                         % (prefix, rand.randint(1, 64), trace))
+        else:
+            lines.append('%sThread-%d;|Served %s|#]\n'
+                         % (prefix, rand.randint(1, 64), _path(rand)))
+        lines.append('\n')
+    return ''.join(lines)
+
+def tomcat(rand, count):
+    """
+    Tomcat catalina.out, messages and stack traces mixed with stray
+    output from applications.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        level = rand.choice(('INFO', 'INFO', 'INFO', 'WARNING', 'SEVERE'))
+        lines.append('%s org.apache.catalina.core.StandardContext start\n'
+                     % (time.strftime('%b %d, %Y %I:%M:%S %p', timestamp), ))
+        lines.append('%s: Handled request for %s\n' % (level, _path(rand)))
+        if level == 'SEVERE':
+            lines.extend([line + '\n' for line in _java_traceback(rand)])
+        elif rand.random() < 0.05:
+            lines.append('stray application output\n')
+    return ''.join(lines)
+
+def rails(rand, count):
+    """
+    Rails production.log, successful requests and requests failing
+    with a traceback.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        lines.append('\n\nProcessing %s (for %s at %s) [%s]\n'
+                     % (rand.choice(CONTROLLERS), rand.choice(IPS),
+                        time.strftime('%Y-%m-%d %H:%M:%S', timestamp),
+                        rand.choice(METHODS)))
+        lines.append('  Parameters: {"id"=>"%d", "action"=>"show"}\n'
+                     % (rand.randint(1, 100000), ))
+        if rand.random() < 0.05:
+            lines.append('\n\nActiveRecord::RecordNotFound (not found):\n')
+            for depth in xrange(rand.randint(3, 8)):
+                lines.append('    /app/models/item.rb:%d:in `find\'\n'
+                             % (depth * 10 + 3, ))
+            lines.append('\nRendering /public/500.html (500 Error)\n')
+        else:
+            lines.append('Rendering template within layouts/application\n')
+            lines.append('Completed in %dms (View: %d, DB: %d) | %d OK '
+                         '[http://www.example.com%s]\n'
+                         % (rand.randint(5, 900), rand.randint(1, 50),
+                            rand.randint(1, 50), rand.choice((200, 200, 404)),
+                            _path(rand)))
+    lines.append('\n\n')
+    return ''.join(lines)
+
+def json_app(rand, count):
+    """
+    JSON lines application log, with nested request information,
+    exceptions and some lines that are not JSON.
+    """
+    lines = []
+    for timestamp in _timestamps(rand, count):
+        if rand.random() < 0.005:
+            lines.append('Starting application worker\n')
+            continue
+        level = rand.choice(('info', 'info', 'info', 'warn', 'error'))
+        record = {'time': time.strftime('%Y-%m-%dT%H:%M:%S', timestamp)
+                  + '.%03dZ' % (rand.randint(0, 999), ),
+                  'level': level, 'msg': 'Handled request',
+                  'http': {'method': rand.choice(METHODS),
+                           'path': _path(rand),
+                           'status': rand.choice(STATUSES)},
+                  'remote': rand.choice(IPS),
+                  'took': rand.randint(1, 900)}
+        if level == 'error':
+            record['err'] = '\n'.join(_java_traceback(rand))
+        lines.append(json.dumps(record) + '\n')
+    return ''.join(lines)
+
+# List of (name, parser name, generator) of corpora
+CORPORA = [
+    ('apache_access', 'apache', apache_access),
+    ('apache_error', 'apache', apache_error),
+    ('glassfish', 'glassfish', glassfish),
+    ('tomcat', 'tomcat', tomcat),
+    ('rails', 'rails', rails),
+    ('json', 'json', json_app),
+    ('plain', 'plain', apache_access)
+    ]
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Parser and wire format benchmarks.
+
+Runs every stage of the file2log to log2db path over the synthetic
+corpora from corpus.py and reports throughput per stage:
+
+  parse          Parser.feed in read sized chunks and Parser.flush
+  encode_text    Entry.to_syslog through logger.encode
+  encode_binary  binary records packed into binary messages
+  decode_text    Log2DbDaemon._construct_events on syslog messages,
+                 _decode_syslog and PlogEntry.from_syslog
+  decode_binary  codec.decode_message
+
+Each stage is run repeat times and the fastest run is reported. The
+lines column of every stage counts the corpus lines, also for binary
+messages holding many entries each.
+The objects column is the net number of garbage collected objects
+allocated per entry, counted with the collector disabled.
+
+Results are written as JSON with -o and compared to an earlier result
+file with -c, the exit status is 1 if any stage got slower by more
+than the threshold. Example:
+
+  python bench/run.py -o before.json
+  python bench/run.py -c before.json
+"""
+
+import gc
+import json
+import optparse
+import os
+import platform
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import corpus
+import plog
+import plog.codec
+import plog.file_parsers
+import plog.file2log.logger
+import plog.wire
+
+# Result file format version
+RESULT_VERSION = 1
+# Size of data fed to parsers at once, as read by file2log
+FEED_SIZE = 65536
+# Number of records per binary message
+RECORDS_PER_MESSAGE = 32
+# Address entries are decoded as coming from
+ADDR = ('127.0.0.1', 514)
+
+def get_daemon():
+    """
+    Get log2db daemon for decoding without reading configuration,
+    None if log2db dependencies are not installed.
+    """
+    try:
+        import plog.log2db.main
+        import plog.log2db.reassembly
+    except ImportError, exc:
+        print >> sys.stderr, 'skipping decode_text: %s' % (exc, )
+        return None
+    daemon = plog.log2db.main.Log2DbDaemon.__new__(
+        plog.log2db.main.Log2DbDaemon)
+    daemon._reassembler = plog.log2db.reassembly.Reassembler()
+    return daemon
+
+def measure(func, repeat):
+    """
+    Run func repeat times, returns (seconds, objects, result) of the
+    fastest run where objects is the net number of objects allocated.
+    """
+    best = None
+    for _ in xrange(repeat):
+        # The allocation count does not go below zero, release the
+        # result of the last run before counting.
+        result = None
+        gc.collect()
+        gc.disable()
+        try:
+            count = gc.get_count()[0]
+            start = time.time()
+            result = func()
+            seconds = time.time() - start
+            objects = gc.get_count()[0] - count
+        finally:
+            gc.enable()
+        if best is None or seconds < best[0]:
+            best = (seconds, objects, result)
+    return best
+
+def parse(parser_name, data):
+    """
+    Parse data with a new parser, returns list of entries.
+    """
+    parser = plog.file_parsers.get_parser(parser_name, {})
+    entries = []
+    for pos in xrange(0, len(data), FEED_SIZE):
+        entries.extend(parser.feed(data[pos:pos + FEED_SIZE]))
+    entries.extend(parser.flush())
+    return entries
+
+def encode_text(name, entries):
+    """
+    Encode entries in the text format, returns list of syslog
+    messages.
+    """
+    return [plog.wire.encode_syslog(facility, priority, msg)
+            for facility, priority, msg
+            in plog.file2log.logger.encode(name, entries)]
+
+def encode_binary(name, entries):
+    """
+    Encode entries in binary messages, returns list of syslog
+    messages.
+    """
+    messages = []
+    records = []
+    table = plog.codec.StringTable()
+    for _, _, record in plog.file2log.logger.encode(name, entries, True):
+        records.append(plog.codec.encode_record(record, table))
+        if len(records) == RECORDS_PER_MESSAGE or table.is_full():
+            messages.append(plog.codec.encode_message(records))
+            records = []
+            table = plog.codec.StringTable()
+    if records:
+        messages.append(plog.codec.encode_message(records))
+    return [plog.wire.encode_syslog(plog.DEFAULT_FACILITY, 6, msg)
+            for msg in messages]
+
+def decode_text(daemon, messages):
+    """
+    Decode text syslog messages, returns list of entries.
+    """
+    entries = []
+    for data in messages:
+        entries.extend(daemon._construct_events(data, ADDR))
+    return entries
+
+def decode_binary(messages):
+    """
+    Decode binary syslog messages, returns list of entries.
+    """
+    entries = []
+    for data in messages:
+        msg = data[data.find('>') + 1:]
+        entries.extend(plog.codec.decode_message(msg, ADDR))
+    return entries
+
+def get_stats(seconds, objects, num_bytes, lines, entries):
+    """
+    Get result dictionary of a stage.
+    """
+    seconds = max(seconds, 1e-9)
+    return {'seconds': seconds, 'bytes': num_bytes, 'lines': lines,
+            'entries': entries, 'lines_per_s': lines / seconds,
+            'entries_per_s': entries / seconds,
+            'mb_per_s': num_bytes / seconds / 1048576.0,
+            'objects': float(objects) / max(entries, 1)}
+
+def run_corpus(name, parser_name, generator, options, daemon):
+    """
+    Run all stages on corpus, returns map from stage to result.
+    """
+    data = generator(random.Random(options.seed), options.entries)
+    lines = data.count('\n')
+    results = {}
+
+    seconds, objects, entries = measure(
+        lambda: parse(parser_name, data), options.repeat)
+    results['parse'] = get_stats(seconds, objects, len(data), lines,
+                                 len(entries))
+    if not entries:
+        return results
+
+    for stage, encoder, decoder in (
+        ('text', encode_text,
+         daemon and (lambda messages: decode_text(daemon, messages))),
+        ('binary', encode_binary, decode_binary)):
+        seconds, objects, messages = measure(
+            lambda: encoder(name, entries), options.repeat)
+        size = sum([len(msg) for msg in messages])
+        results['encode_' + stage] = get_stats(
+            seconds, objects, size, lines, len(entries))
+        if decoder is None:
+            continue
+        seconds, objects, decoded = measure(
+            lambda: decoder(messages), options.repeat)
+        results['decode_' + stage] = get_stats(
+            seconds, objects, size, lines, len(decoded))
+    return results
+
+def print_results(results, baseline, threshold):
+    """
+    Print results table, compared to baseline results if given.
+    Returns list of (corpus, stage, change) of regressions.
+    """
+    regressions = []
+    print '%-14s %-14s %11s %11s %8s %8s %s' % (
+        'corpus', 'stage', 'lines/s', 'entries/s', 'MB/s', 'objects',
+        baseline and 'change' or '')
+    for name in sorted(results):
+        for stage in sorted(results[name]):
+            result = results[name][stage]
+            change = ''
+            old = baseline and baseline.get(name, {}).get(stage)
+            if old and old['entries_per_s']:
+                ratio = result['entries_per_s'] / old['entries_per_s'] - 1
+                change = '%+.1f%%' % (ratio * 100, )
+                if ratio < -threshold:
+                    regressions.append((name, stage, ratio))
+                    change += ' REGRESSION'
+            print '%-14s %-14s %11.0f %11.0f %8.1f %8.1f %s' % (
+                name, stage, result['lines_per_s'], result['entries_per_s'],
+                result['mb_per_s'], result['objects'], change)
+    return regressions
+
+def main():
+    """
+    Parse options, run benchmarks and write and compare results.
+    """
+    option_parser = optparse.OptionParser(
+        usage='%prog [options]', description=__doc__.split('\n\n')[0])
+    option_parser.add_option('-n', '--entries', type='int', default=20000,
+                             help='entries per corpus [%default]')
+    option_parser.add_option('-r', '--repeat', type='int', default=3,
+                             help='runs per stage, fastest counts '
+                             '[%default]')
+    option_parser.add_option('-s', '--seed', type='int', default=1,
+                             help='corpus random seed [%default]')
+    option_parser.add_option('-k', '--corpus', action='append',
+                             help='only run named corpus, may be repeated')
+    option_parser.add_option('-o', '--output',
+                             help='write JSON results to file')
+    option_parser.add_option('-c', '--compare',
+                             help='compare to JSON results in file')
+    option_parser.add_option('-t', '--threshold', type='float', default=10.0,
+                             help='percent slowdown counted as regression '
+                             '[%default]')
+    options = option_parser.parse_args()[0]
+
+    baseline = None
+    if options.compare:
+        f_obj = open(options.compare, 'r')
+        try:
+            baseline = json.load(f_obj)['results']
+        finally:
+            f_obj.close()
+
+    daemon = get_daemon()
+    results = {}
+    for name, parser_name, generator in corpus.CORPORA:
+        if options.corpus and name not in options.corpus:
+            continue
+        results[name] = run_corpus(name, parser_name, generator, options,
+                                   daemon)
+
+    regressions = print_results(results, baseline,
+                                options.threshold / 100.0)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print 'peak RSS %d kB' % (max_rss, )
+
+    if options.output:
+        f_obj = open(options.output, 'w')
+        try:
+            json.dump({'version': RESULT_VERSION,
+                       'created': time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                time.gmtime()),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'plog': plog.VERSION,
+                       'seed': options.seed, 'entries': options.entries,
+                       'repeat': options.repeat, 'max_rss_kb': max_rss,
+                       'results': results}, f_obj, indent=2, sort_keys=True)
+            f_obj.write('\n')
+        finally:
+            f_obj.close()
+
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
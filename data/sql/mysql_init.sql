@@ -70,6 +70,7 @@ CREATE TABLE logs (
        re_status INTEGER ,
        re_ms_time INTEGER DEFAULT 0,
        re_uri VARCHAR(255),
+       weight INTEGER NOT NULL DEFAULT 1, -- Entries a sampled entry stands for
        FULLTEXT (msg,msg_extra), -- Index log data for searching
        PRIMARY KEY(id)
 );
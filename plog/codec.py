@@ -0,0 +1,331 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Binary wire format for entries, an alternative to the pipe delimited
+text format of Entry.to_syslog.
+
+A binary message is the binary signature, a version byte, a sequence
+of items and an end marker protecting the last item from syslog zero
+terminator stripping. Items are either string definitions or records,
+one per entry. Records have a fixed layout per log type, the log
+type, syslog priority, timestamp, dictionary coded strings, integers
+and lengths of the literal strings followed by the literal strings.
+
+Strings likely to repeat, the source name and some extra values, are
+dictionary coded. The first use of a string in a message is preceded
+by a definition assigning it the next id, records only refer to the
+id. The dictionary is scoped to a single message so every message
+decodes on its own, messages may be lost, reordered, spooled and
+replayed and the receiver may restart at any time. Short extra values
+are cheaper to send than to look up, they are given the literal id
+and follow the fixed part of the record with a one byte length.
+
+Entries kept by sampling are preceded by a weight item giving the
+number of entries they stand for, other entries have weight 1.
+
+Timestamps are sent as seconds of the sender wall clock time, as
+calendar.timegm of the entry timestamp, keeping the text format
+semantics of not depending on the receiver time zone.
+"""
+
+import struct
+import time
+import plog
+import plog.entry
+import plog.timestamp
+
+# Signature of binary messages
+BINARY_SIGNATURE = '!!BN '
+# Binary format version
+BINARY_VERSION = 2
+# Versions decoded, version 1 has no literal extra values
+BINARY_VERSIONS = (1, 2)
+# End of binary message marker
+BINARY_END = '\n'
+
+# Extra fields sent dictionary coded
+DICT_FIELDS = frozenset(('re_ip', 're_method', 're_user_agent'))
+
+# Map from log type to entry class
+LOG_TYPE_CLASSES = {
+    plog.LOG_ENTRY_PLAIN: plog.entry.Entry,
+    plog.LOG_ENTRY_REQUEST: plog.entry.RequestEntry,
+    plog.LOG_ENTRY_APPSERVER: plog.entry.AppserverEntry
+    }
+
+# Log type of string definitions
+_TYPE_DEFINE = 0xff
+# String definition, type and length
+_DEFINE = struct.Struct('!BI')
+# Log type of weights of the following record
+_TYPE_WEIGHT = 0xfe
+# Weight, type and weight
+_WEIGHT = struct.Struct('!BI')
+# Maximum number of strings in the dictionary
+_TABLE_MAX = 0xffff
+# Id of dictionary coded values sent as literals, not a valid string
+# id as the dictionary holds at most _TABLE_MAX strings
+_LITERAL_ID = 0xffff
+# Maximum length of dictionary coded values sent as literals
+_LITERAL_MAX = 15
+# One byte lengths of literal dictionary coded values, by length
+_LITERAL_LENGTHS = tuple([chr(size) for size in xrange(_LITERAL_MAX + 1)])
+
+class _Layout(object):
+    """
+    Record layout of a log type.
+    """
+
+    def __init__(self, entry_class):
+        """
+        Initialize layout from the extra fields of entry_class.
+        """
+        # Positions of dictionary coded, integer and literal string
+        # extra values
+        self.dict_pos = []
+        self.int_pos = []
+        self.str_pos = []
+        for pos, (field_name, field_type) in enumerate(
+            entry_class.get_extra_fields()):
+            if field_name in DICT_FIELDS:
+                self.dict_pos.append(pos)
+            elif field_type is int:
+                self.int_pos.append(pos)
+            else:
+                self.str_pos.append(pos)
+        # Number of extra values
+        self.num_extra = len(entry_class.get_extra_fields())
+        # Class of decoded entries
+        self.entry_class = entry_class
+
+        # Log type, priority and timestamp, name and dictionary coded
+        # values, integers and lengths of literal strings including
+        # the message and extra message.
+        self.struct = struct.Struct(
+            '!BBIH%s%s%s' % ('H' * len(self.dict_pos),
+                             'q' * len(self.int_pos),
+                             'I' * (len(self.str_pos) + 2)))
+        # Function encoding records of the layout, see encode_record
+        self.encode = self._compile_encoder()
+
+    def _compile_encoder(self):
+        """
+        Compile function encoding records with the extra values of the
+        layout unrolled, saving the per field loops of a generic
+        encoder.
+        """
+        lines = [
+            'def encode(record, table, _pack=_pack):',
+            '    log_type, priority, timestamp, name, extra_values, msg, '
+            'msg_extra, weight = record',
+            '    ids = table.ids',
+            '    # Definitions preceding the record',
+            '    out = []',
+            '    if weight != 1:',
+            '        out.append(_WEIGHT.pack(_TYPE_WEIGHT, weight))',
+            '    ref = ids.get(name)',
+            '    if ref is None:',
+            '        ref = table.define(name, out)']
+        refs = []
+        for pos in self.dict_pos:
+            lines.extend([
+                '    v%d = extra_values[%d]' % (pos, pos),
+                '    if v%d.__class__ is not str:' % (pos, ),
+                '        v%d = str(v%d)' % (pos, pos),
+                '    if len(v%d) <= _LITERAL_MAX:' % (pos, ),
+                '        r%d = _LITERAL_ID' % (pos, ),
+                '        l%d = _LITERAL_LENGTHS[len(v%d)] + v%d'
+                % (pos, pos, pos),
+                '    else:',
+                "        l%d = ''" % (pos, ),
+                '        r%d = ids.get(v%d)' % (pos, pos),
+                '        if r%d is None:' % (pos, ),
+                '            r%d = table.define(v%d, out)' % (pos, pos)])
+            refs.append('r%d' % (pos, ))
+        ints = ['extra_values[%d]' % (pos, ) for pos in self.int_pos]
+        # Extra message is sent as formatted by the text format.
+        strings = ['v%d' % (pos, ) for pos in self.str_pos]
+        strings.extend(['msg', 'msg_extra'])
+        for pos in self.str_pos:
+            lines.append('    v%d = extra_values[%d]' % (pos, pos))
+        for name in strings:
+            lines.extend(['    if %s.__class__ is not str:' % (name, ),
+                          '        %s = str(%s)' % (name, name)])
+        lengths = ['len(%s)' % (name, ) for name in strings]
+        pack_args = ', '.join(['log_type, priority, timestamp, ref']
+                              + refs + ints + lengths)
+        # Integer extra values given as strings are converted.
+        int_args = ', '.join(['log_type, priority, timestamp, ref']
+                             + refs + ['_to_int(%s)' % (value, )
+                                       for value in ints] + lengths)
+        parts = ', '.join(['packed'] + ['l%d' % (pos, )
+                                         for pos in self.dict_pos]
+                          + strings)
+        lines.extend([
+            '    try:',
+            '        packed = _pack(%s)' % (pack_args, ),
+            '    except struct.error:',
+            '        packed = _pack(%s)' % (int_args, ),
+            '    if out:',
+            '        out.extend((%s))' % (parts, ),
+            "        return ''.join(out)",
+            "    return ''.join((%s))" % (parts, )])
+
+        namespace = {'_pack': self.struct.pack}
+        exec '\n'.join(lines) in globals(), namespace
+        return namespace['encode']
+
+# Map from log type to record layout
+_LAYOUTS = dict([(log_type, _Layout(entry_class))
+                 for log_type, entry_class in LOG_TYPE_CLASSES.iteritems()])
+# Maximum number of strings defined by a record
+_RECORD_STRINGS_MAX = 1 + max([len(layout.dict_pos)
+                               for layout in _LAYOUTS.itervalues()])
+
+def get_record(entry, name):
+    """
+    Get record tuple for entry from source name, the record is encoded
+    by encode_record once the message it goes in is known.
+    """
+    timestamp = entry.timestamp
+    if timestamp is None:
+        timestamp = time.localtime()
+    return (entry.get_log_type(), (entry.facility << 3) | entry.level,
+            plog.timestamp.to_seconds(timestamp), name,
+            entry.extra_values, entry.msg, entry.msg_extra, entry.weight)
+
+def _to_int(value):
+    """
+    Convert extra value to integer, defaulting to 0.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+def encode_record(record, table):
+    """
+    Encode record using the string dictionary table of the message it
+    goes in.
+    """
+    return _LAYOUTS[record[0]].encode(record, table)
+
+def encode_message(records):
+    """
+    Encode binary message from list of encoded records.
+    """
+    return '%s%c%s%s' % (BINARY_SIGNATURE, BINARY_VERSION, ''.join(records),
+                         BINARY_END)
+
+def decode_message(msg, addr):
+    """
+    Decode binary message from addr, returns list of entries. Raises
+    ValueError on unsupported versions and invalid records.
+    """
+    pos = len(BINARY_SIGNATURE)
+    if len(msg) <= pos or ord(msg[pos]) not in BINARY_VERSIONS:
+        raise ValueError('unsupported binary message version')
+    if msg[-1] != BINARY_END:
+        raise ValueError('truncated binary message')
+    pos += 1
+    end = len(msg) - len(BINARY_END)
+
+    strings = []
+    entries = []
+    weight = 1
+    try:
+        while pos < end:
+            log_type = ord(msg[pos])
+            if log_type == _TYPE_DEFINE:
+                size = _DEFINE.unpack_from(msg, pos)[1]
+                pos += _DEFINE.size
+                if len(strings) < _TABLE_MAX:
+                    strings.append(msg[pos:pos + size])
+                pos += size
+                continue
+            elif log_type == _TYPE_WEIGHT:
+                weight = _WEIGHT.unpack_from(msg, pos)[1]
+                pos += _WEIGHT.size
+                continue
+
+            layout = _LAYOUTS[log_type]
+            values = layout.struct.unpack_from(msg, pos)
+            pos += layout.struct.size
+
+            extra_values = [None] * layout.num_extra
+            num_dict = len(layout.dict_pos)
+            for num, field_pos in enumerate(layout.dict_pos):
+                ref = values[4 + num]
+                if ref == _LITERAL_ID:
+                    size = ord(msg[pos])
+                    extra_values[field_pos] = msg[pos + 1:pos + 1 + size]
+                    pos += 1 + size
+                else:
+                    extra_values[field_pos] = strings[ref]
+            num = 4 + num_dict
+            for field_pos in layout.int_pos:
+                extra_values[field_pos] = values[num]
+                num += 1
+            literals = []
+            for size in values[num:]:
+                literals.append(msg[pos:pos + size])
+                pos += size
+            for num, field_pos in enumerate(layout.str_pos):
+                extra_values[field_pos] = literals[num]
+            if pos > end:
+                raise ValueError('record at %d out of range' % (pos, ))
+
+            entry = layout.entry_class(
+                literals[-2], literals[-1],
+                plog.timestamp.from_seconds(values[2]),
+                values[1] >> 3, values[1] & 0x07, extra_values, addr,
+                strings[values[3]])
+            entry.weight = weight
+            weight = 1
+            entries.append(entry)
+    except (struct.error, KeyError, IndexError):
+        raise ValueError('invalid record at %d' % (pos, ))
+    return entries
+
+class StringTable(object):
+    """
+    Dictionary of strings sent in a binary message.
+    """
+
+    def __init__(self):
+        """
+        Initialize empty dictionary.
+        """
+        # Map from string to id
+        self.ids = {}
+
+    def is_full(self):
+        """
+        Check if the dictionary has no room for the strings of another
+        record.
+        """
+        return len(self.ids) > _TABLE_MAX - _RECORD_STRINGS_MAX
+
+    def define(self, value, defines):
+        """
+        Assign value the next id, adding its definition to defines.
+        Returns the id.
+        """
+        ref = len(self.ids)
+        self.ids[value] = ref
+        defines.append(_DEFINE.pack(_TYPE_DEFINE, len(value)))
+        defines.append(value)
+        return ref
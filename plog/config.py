@@ -128,7 +128,20 @@ class Config(object):
                 % (section, key, default))
             value = int(default)
         return value
-        
+
+    def get_float(self, section, key, default):
+        """
+        Get float value from configuration file.
+        """
+        value = self.get(section, key, default)
+        try:
+            value = float(value)
+        except ValueError:
+            logging.warning(
+                'invalid float in configuration %s.%s, setting default %s'
+                % (section, key, default))
+            value = float(default)
+        return value
 
     def get_db_config(self):
         """
@@ -144,20 +157,24 @@ class Config(object):
 
         return db_config
 
-    def get_log_files(self):
+    def get_log_files(self, checkpoints=None):
         """
-        Return all files specified in the configuration file.
+        Return all files specified in the configuration file, files
+        resume reading from checkpoints if a checkpoint store is given.
+        Sections with glob or directory paths are returned by
+        get_log_sources.
         """
         import plog.file_parsers
         import plog.file2log.file
+        import plog.file2log.filter
 
         files = []
 
-        sections = [s for s in self.cfg.sections() if s.startswith('file2log-')]
-        for section in sections:
+        for name, section in self._get_source_sections():
             # Get file options
-            name = section[len('file-'):]
             path = self.cfg.get(section, plog.CFG_OPT_PATH)
+            if self._is_source_path(path):
+                continue
 
             # Setup parser
             parser_name = self.cfg.get(
@@ -167,7 +184,75 @@ class Config(object):
             parser = plog.file_parsers.get_parser(
                 parser_name, parser_options)
 
+            # Scheduling weight
+            weight = self.get_float(section, plog.CFG_OPT_WEIGHT, 1.0)
+
+            # Drop and sampling rules
+            entry_filter = plog.file2log.filter.EntryFilter.from_options(
+                self.cfg.get_options_with_prefix(
+                    section, plog.CFG_OPT_FILTER + '-'))
+
             # Construct and append
-            files.append(plog.file2log.file.File(name, path, parser))
+            files.append(plog.file2log.file.File(
+                name, path, parser, checkpoints, weight,
+                entry_filter=entry_filter))
             
         return files
+
+    def get_log_sources(self, checkpoints=None):
+        """
+        Return sources for all sections with glob or directory paths,
+        the sources discover the files to read.
+        """
+        import plog.file2log.discovery
+
+        sources = []
+
+        for name, section in self._get_source_sections():
+            path = self.cfg.get(section, plog.CFG_OPT_PATH)
+            if not self._is_source_path(path):
+                continue
+
+            parser_name = self.cfg.get(
+                section, plog.CFG_OPT_PARSER, plog.DEFAULT_PARSER)
+            parser_options = self.cfg.get_options_with_prefix(
+                section, plog.CFG_OPT_PARSER + '-')
+            weight = self.get_float(section, plog.CFG_OPT_WEIGHT, 1.0)
+            filter_options = self.cfg.get_options_with_prefix(
+                section, plog.CFG_OPT_FILTER + '-')
+
+            sources.append(plog.file2log.discovery.GlobSource(
+                name, path, parser_name, parser_options, checkpoints, weight,
+                filter_options))
+
+        return sources
+
+    def get_source_rates(self):
+        """
+        Return dictionary mapping source name to (rate, burst) for all
+        sources with a rate limit.
+        """
+        rates = {}
+        for name, section in self._get_source_sections():
+            rate = self.get_float(section, plog.CFG_OPT_RATE, 0)
+            if rate > 0:
+                rates[name] = (
+                    rate, self.get_float(section, plog.CFG_OPT_RATE_BURST, 0))
+        return rates
+
+    def _get_source_sections(self):
+        """
+        Return list of (source name, section) for all file2log-*
+        sections.
+        """
+        return [(s[len('file-'):], s) for s in self.cfg.sections()
+                if s.startswith('file2log-')]
+
+    def _is_source_path(self, path):
+        """
+        Check if path is a glob pattern or directory.
+        """
+        import plog.file2log.discovery
+
+        return (plog.file2log.discovery.has_magic(path)
+                or path.endswith('/') or os.path.isdir(path))
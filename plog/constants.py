@@ -24,15 +24,109 @@ VERSION = '0.1.0'
 EXIT_USAGE = 1
 # Time in seconds to sleep between stat sweeps in the reader
 READ_INTERVAL = 0.01
-# Time in seconds to sleep between sending log entries.
-SYSLOG_INTERVAL = 0.0001
-# Maximum amount of data to read in a single iteration
+# Maximum time in seconds event based watchers sleep before checking
+# all files
+WATCH_TIMEOUT = 1.0
+# Minimum and initial amount of data to read in a single read
 READ_MAX = 8192
+# Maximum amount of data to read in a single read
+READ_CHUNK_MAX = 262144
+# Bytes each file is allowed to read per scheduler round at weight 1.0
+READ_BUDGET = 1048576
+# Time in seconds a rotated file is kept open after it was last written
+# to, if the file replacing it is still empty
+ROTATE_WAIT = 5.0
+# Time in seconds between expansions of glob and directory sources
+DISCOVER_INTERVAL = 5
+# Maximum number of read chunks queued by file2log workers
+WORKER_QUEUE_MAX = 1024
+# Maximum number of read chunks queued for the file2log sender thread
+SEND_QUEUE_MAX = 1024
+# Time in seconds between statistics reports
+STATS_INTERVAL = 60
+# Maximum number of parsed and formatted timestamps cached
+TIMESTAMP_CACHE_MAX = 4096
+# Number of lines sampled when detecting the timestamp format of a file
+TIMESTAMP_DETECT_LINES = 20
 # Maximum log event size
 READ_LOG_MAX = 32768
+# Maximum size of multi-line log events, longer events are truncated
+MULTILINE_MAX_SIZE = 262144
+# Time in seconds an incomplete multi-line event waits for more lines
+MULTILINE_IDLE_TIMEOUT = 5.0
+
+# Default maximum size of batch datagrams, fits an ethernet frame
+BATCH_SIZE = 1472
+# Default time in seconds a batch may wait for more messages
+BATCH_LINGER = 0.05
+# Bytes added to batch frames by the batch syslog header
+BATCH_OVERHEAD = 16
+# Maximum size of UDP datagrams, the IPv4 payload limit. Received
+# datagrams are never truncated and batch_size is capped to it.
+DATAGRAM_MAX = 65507
+
+# Default syslog transport
+DEFAULT_TRANSPORT = 'udp'
+# Number of points per receiver on the consistent hash ring
+RING_REPLICAS = 100
+# Default batch compression, none, zlib or zstd
+DEFAULT_COMPRESSION = 'none'
+# Default minimum size in bytes of payloads to compress
+COMPRESS_MIN = 256
+# Default compression level
+COMPRESS_LEVEL = 6
+# Maximum factor datagrams are packed beyond batch_size when compressing
+COMPRESS_PACK_MAX = 8
+# Share of the expected compressed size filled when packing datagrams
+COMPRESS_PACK_MARGIN = 0.9
+# Maximum size of decompressed messages accepted by log2db
+DECOMPRESS_MAX = 16777216
+# Default wire format of entries
+DEFAULT_WIRE_FORMAT = 'text'
+# Default number of bytes written to TCP connections at once
+TCP_COALESCE = 65536
+# Maximum bytes of frames kept while TCP connection is down
+TCP_BUFFER_MAX = 4194304
+# Time in seconds TCP connects may take and writes may block
+TCP_TIMEOUT = 5.0
+# Initial time in seconds between TCP reconnect attempts
+TCP_RECONNECT_MIN = 0.5
+# Maximum time in seconds between TCP reconnect attempts
+TCP_RECONNECT_MAX = 30.0
+# Size in bytes at which a new spool segment is started
+SPOOL_SEGMENT_SIZE = 16777216
+# Default maximum size in bytes of the spool
+SPOOL_MAX_SIZE = 1073741824
+# Default maximum age in seconds of spooled frames
+SPOOL_MAX_AGE = 24 * 3600
+# Default maximum bytes replayed from the spool per flush
+SPOOL_REPLAY_BUDGET = 4194304
+# Time in seconds to wait before retrying a failed UDP send
+SPOOL_RETRY = 1.0
+# Maximum size of TCP frames accepted by log2db
+TCP_FRAME_MAX = 1048576
+# Maximum number of partially received messages in log2db
+FRAGMENT_TABLE_MAX = 1024
+# Time in seconds log2db waits for all fragments of a message
+FRAGMENT_TIMEOUT = 10.0
+# Maximum size of messages reassembled by log2db
+FRAGMENT_MESSAGE_MAX = 1048576
+# Minimum data size of fragments, limits the fragment count accepted
+FRAGMENT_DATA_MIN = 256
+# Maximum number of TCP connections accepted by log2db
+TCP_CLIENTS_MAX = 256
+
+# Time in seconds between writes of read offset checkpoints
+CHECKPOINT_INTERVAL = 5
+# Time in seconds checkpoints are kept after the last update
+CHECKPOINT_MAX_AGE = 7 * 24 * 3600
+# Number of bytes at the start of files hashed to verify checkpoints
+CHECKPOINT_HEAD_SIZE = 1024
 
 # Default parser type
 DEFAULT_PARSER = 'plain'
+# Default file watcher type
+DEFAULT_WATCHER = 'auto'
 # Default logging facility, 1 is LOG_USER
 DEFAULT_FACILITY = 3
 # Default logging priority, 6 is LOG_INFO
@@ -52,6 +146,58 @@ CFG_OPT_PATH = 'path'
 CFG_OPT_PID_PATH = '/var/run'
 # In config file option for setting parser
 CFG_OPT_PARSER = 'parser'
+# In config file option prefix for setting entry filter rules
+CFG_OPT_FILTER = 'filter'
+# In config file option for setting file watcher
+CFG_OPT_WATCHER = 'watcher'
+# In config file option for setting checkpoint file path
+CFG_OPT_CHECKPOINT_PATH = 'checkpoint_path'
+# In config file option for setting seconds between checkpoint writes
+CFG_OPT_CHECKPOINT_INTERVAL = 'checkpoint_interval'
+# In config file option for setting file scheduling weight
+CFG_OPT_WEIGHT = 'weight'
+# In config file option for setting per round read budget
+CFG_OPT_READ_BUDGET = 'read_budget'
+# In config file option for setting seconds between source discovery
+CFG_OPT_DISCOVER_INTERVAL = 'discover_interval'
+# In config file option for setting number of reader worker processes
+CFG_OPT_WORKERS = 'workers'
+# In config file option for sending from a separate thread
+CFG_OPT_SEND_THREAD = 'send_thread'
+# In config file option for setting rate limit in messages per second
+CFG_OPT_RATE = 'rate'
+# In config file option for setting rate limit burst size in messages
+CFG_OPT_RATE_BURST = 'rate_burst'
+# In config file option for setting maximum batch datagram size
+CFG_OPT_BATCH_SIZE = 'batch_size'
+# In config file option for setting seconds batches may wait
+CFG_OPT_BATCH_LINGER = 'batch_linger'
+# In config file option for setting list of host:port receivers
+CFG_OPT_SYSLOG_HOSTS = 'syslog_hosts'
+# In config file option for setting syslog transport, udp or tcp
+CFG_OPT_TRANSPORT = 'syslog_transport'
+# In config file option for setting wire format, text or binary
+CFG_OPT_WIRE_FORMAT = 'wire_format'
+# In config file option for setting compression, none, zlib or zstd
+CFG_OPT_COMPRESSION = 'compression'
+# In config file option for setting minimum size of payloads to compress
+CFG_OPT_COMPRESS_MIN = 'compress_min'
+# In config file option for setting compression level
+CFG_OPT_COMPRESS_LEVEL = 'compress_level'
+# In config file option for setting bytes written to TCP at once
+CFG_OPT_TCP_COALESCE = 'tcp_coalesce'
+# In config file option for setting spool directory
+CFG_OPT_SPOOL_PATH = 'spool_path'
+# In config file option for setting maximum spool size in bytes
+CFG_OPT_SPOOL_MAX_SIZE = 'spool_max_size'
+# In config file option for setting maximum spool age in seconds
+CFG_OPT_SPOOL_MAX_AGE = 'spool_max_age'
+# In config file option for setting bytes replayed from spool per flush
+CFG_OPT_SPOOL_REPLAY_BUDGET = 'spool_replay_budget'
+# In config file option for setting log2db transports, udp, tcp or both
+CFG_OPT_BIND_TRANSPORT = 'bind_transport'
+# In config file option for setting seconds between statistics reports
+CFG_OPT_STATS_INTERVAL = 'stats_interval'
 # In config file option for setting log level
 CFG_OPT_LOG_LEVEL = 'log_level'
 # Default value for log level option
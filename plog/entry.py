@@ -21,6 +21,7 @@ import logging
 import time
 import plog
 import plog.file2log.syslog
+import plog.timestamp
 
 # Log levels
 LEVEL_NONE = plog.file2log.syslog.LOG_INFO
@@ -43,12 +44,25 @@ LEVEL_TO_NAME = {
     LEVEL_NONE: 'UNKNOWN'
     }
 
+# Separator of level and weight in the level field of the text format
+WEIGHT_SEPARATOR = '*'
+
 def get_level(level_str):
     """
     Get log level from string representation.
     """
     return NAME_TO_LEVEL.get(level_str.upper(), LEVEL_NONE)
 
+def get_status_level(status):
+    """
+    Get log level of request with HTTP status code status.
+    """
+    if status in plog.HTTP_CODES_OK:
+        return LEVEL_INFO
+    elif status in plog.HTTP_CODES_WARNING:
+        return LEVEL_WARNING
+    return LEVEL_ERROR
+
 def get_level_str(level):
     """
     Get log level string from level.
@@ -83,6 +97,9 @@ class Entry(object):
         self.ip_addr = None
         # Name of log source
         self.name = name
+        # Number of entries this entry stands for, above 1 for entries
+        # kept by sampling
+        self.weight = 1
 
         if addr is not None:
             self.ip_addr = addr[0]
@@ -117,14 +134,15 @@ class Entry(object):
         """
         if self.timestamp is None:
             self.timestamp = time.localtime()
-        return time.strftime(plog.LOG_TIME_FORMAT, self.timestamp)
+        return plog.timestamp.to_string(self.timestamp)
 
     def _get_timestamp_from_str(self, timestamp_str):
         """
         Get timestamp from string, defaulting to now if parsing fails.
         """
         try:
-            timestamp = time.strptime(timestamp_str, plog.LOG_TIME_FORMAT)
+            timestamp = plog.timestamp.parse(
+                timestamp_str, plog.LOG_TIME_FORMAT)
         except ValueError:
             logging.info('failed to parse timestamp %s, falling back to now'
                          % (timestamp_str, ))
@@ -135,9 +153,14 @@ class Entry(object):
         """
         Formats message for syslog, no special tricks here.
         """
+        level_str = get_level_str(self.level)
+        if self.weight != 1:
+            # The level field is not decoded by older receivers, the
+            # weight goes along without changing the field layout.
+            level_str = '%s%s%d' % (level_str, WEIGHT_SEPARATOR, self.weight)
         return '%s%s|%s|%s|%s|%s|%s' % (
             self.get_signature(), name,
-            self._get_timestamp_str(), get_level_str(self.level),
+            self._get_timestamp_str(), level_str,
             extra_values, self.msg, self.msg_extra)
 
     def to_syslog(self, name):
@@ -185,6 +208,12 @@ class PlogEntry(Entry):
         self.msg = info[num_fields - 2]
         self.msg_extra = info[num_fields - 1]
         self.timestamp = self._get_timestamp_from_str(info[1])
+        weight_pos = info[2].find(WEIGHT_SEPARATOR)
+        if weight_pos != -1:
+            try:
+                self.weight = int(info[2][weight_pos + 1:])
+            except ValueError:
+                logging.warning('invalid weight in message %s' % (self.msg, ))
 
         # Log type specific values
         self.extra_values = []
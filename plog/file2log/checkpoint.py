@@ -0,0 +1,178 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Read offset checkpoints, lets file2log continue where it left off
+after a restart.
+"""
+
+import logging
+import os
+import time
+import zlib
+import plog
+
+def head_hash(data):
+    """
+    Return hash of the first bytes of a file, includes the length so
+    hashes of different lengths never match.
+    """
+    return '%d:%08x' % (len(data), zlib.crc32(data) & 0xffffffff)
+
+class CheckpointStore(object):
+    """
+    On-disk store of read offsets keyed by (device, inode). Each
+    checkpoint holds the last shipped offset and a hash of the first
+    bytes of the file to detect re-used inodes.
+
+    The store is written to disk in batches, flush is cheap to call
+    often as it only writes when flush_interval has passed.
+    """
+
+    def __init__(self, path, flush_interval=plog.CHECKPOINT_INTERVAL):
+        """
+        Initialize store, reading checkpoints from path if it exists.
+        """
+        # Path to checkpoint file
+        self._path = path
+        # Seconds between writes of the checkpoint file
+        self._flush_interval = flush_interval
+        # Map from (device, inode) to [offset, hash, path, updated]
+        self._checkpoints = {}
+        # True if checkpoints have changed since last flush
+        self._dirty = False
+        # Time of last flush
+        self._last_flush = time.time()
+
+        self._load()
+
+    def _load(self):
+        """
+        Load checkpoints from disk, dropping checkpoints not updated
+        for plog.CHECKPOINT_MAX_AGE seconds.
+        """
+        try:
+            f_obj = open(self._path, 'r')
+        except IOError:
+            return
+
+        oldest = time.time() - plog.CHECKPOINT_MAX_AGE
+        try:
+            for line in f_obj:
+                try:
+                    dev, ino, offset, hash_str, updated, path = \
+                        line.rstrip('\n').split(' ', 5)
+                    checkpoint = [int(offset), hash_str, path, int(updated)]
+                    if checkpoint[3] >= oldest:
+                        self._checkpoints[(int(dev), int(ino))] = checkpoint
+                except ValueError:
+                    logging.warning('invalid checkpoint in %s: %s'
+                                    % (self._path, line.rstrip()))
+        finally:
+            f_obj.close()
+
+    def get(self, dev, ino):
+        """
+        Get checkpoint for file, returns (offset, hash) or None.
+        """
+        checkpoint = self._checkpoints.get((dev, ino))
+        if checkpoint is None:
+            return None
+        return checkpoint[0], checkpoint[1]
+
+    def has_path(self, path):
+        """
+        Check if any checkpoint has been stored for path.
+        """
+        for checkpoint in self._checkpoints.values():
+            if checkpoint[2] == path:
+                return True
+        return False
+
+    def set(self, dev, ino, offset, hash_str, path):
+        """
+        Set checkpoint for file.
+        """
+        checkpoint = self._checkpoints.get((dev, ino))
+        if checkpoint is None:
+            self._checkpoints[(dev, ino)] = [
+                offset, hash_str, path, int(time.time())]
+        elif checkpoint[0] != offset or checkpoint[1] != hash_str:
+            checkpoint[0] = offset
+            checkpoint[1] = hash_str
+            checkpoint[2] = path
+            checkpoint[3] = int(time.time())
+        else:
+            return
+        self._dirty = True
+
+    def remove(self, dev, ino):
+        """
+        Remove checkpoint for file.
+        """
+        if self._checkpoints.pop((dev, ino), None) is not None:
+            self._dirty = True
+
+    def is_due(self, force=False):
+        """
+        Check if checkpoints have changed and flush_interval has passed
+        since the last write, or if force is set.
+        """
+        return self._dirty and (
+            force or time.time() - self._last_flush >= self._flush_interval)
+
+    def flush_sent(self, logger, force=False):
+        """
+        Flush checkpoints once the entries they cover are sent, see
+        flush. The batch of logger is sent first and nothing is written
+        while logger holds frames not yet handed to the socket or spool
+        as the checkpoints may cover them.
+        """
+        if not self.is_due(force):
+            return
+        logger.flush()
+        if logger.is_sent():
+            self.flush(force)
+
+    def flush(self, force=False):
+        """
+        Write checkpoints to disk if changed and flush_interval has
+        passed since the last write, or always if force is set.
+        """
+        if not self.is_due(force):
+            return
+        self._last_flush = time.time()
+
+        # Write to temporary file and rename to never leave a
+        # partially written checkpoint file.
+        tmp_path = '%s.tmp' % (self._path, )
+        try:
+            f_obj = open(tmp_path, 'w')
+            try:
+                # Iterate over a copy, checkpoints may be set from the
+                # sender thread.
+                for (dev, ino), checkpoint in self._checkpoints.items():
+                    offset, hash_str, path, updated = checkpoint
+                    f_obj.write('%d %d %d %s %d %s\n' % (
+                        dev, ino, offset, hash_str, updated, path))
+                f_obj.flush()
+                os.fsync(f_obj.fileno())
+            finally:
+                f_obj.close()
+            os.rename(tmp_path, self._path)
+            self._dirty = False
+        except (IOError, OSError), exc:
+            logging.error('failed to write checkpoints to %s: %s'
+                          % (self._path, exc))
@@ -0,0 +1,176 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Discovery of files matching glob patterns and directories.
+"""
+
+import fnmatch
+import os
+import re
+import plog
+import plog.file_parsers
+import plog.file2log.file
+import plog.file2log.filter
+
+# Regular expression matching glob special characters
+RE_MAGIC = re.compile('[*?[]')
+
+def has_magic(path):
+    """
+    Check if path is a glob pattern.
+    """
+    return RE_MAGIC.search(path) is not None
+
+class GlobSource(object):
+    """
+    Source expanding a glob pattern, or all files in a directory, into
+    files sharing one parser definition.
+
+    Expansion is incremental, the matching entries of each directory
+    are cached together with the directory modification time and the
+    directory is only listed again when it has changed.
+    """
+
+    def __init__(self, name, pattern, parser_name, parser_options,
+                 checkpoints=None, weight=1.0, filter_options=None):
+        """
+        Initialize source, pattern ending with / or naming a directory
+        matches all files in the directory. filter_options configure
+        the entry filter of each file.
+        """
+        if pattern.endswith('/') or (not has_magic(pattern)
+                                     and os.path.isdir(pattern)):
+            pattern = os.path.join(pattern, '*')
+        pattern = os.path.abspath(pattern)
+
+        # Name of source, prefix of names of discovered files.
+        self.name = name
+        # Glob pattern
+        self.pattern = pattern
+        # Parser name and options used for each file
+        self._parser_name = parser_name
+        self._parser_options = parser_options
+        # Checkpoint store and weight given to each file
+        self._checkpoints = checkpoints
+        self._weight = weight
+        # Entry filter options used for each file
+        self._filter_options = filter_options or {}
+
+        # Split pattern into the directory without magic and the
+        # components below it.
+        components = pattern.split(os.sep)
+        pos = 0
+        while pos < len(components) and not has_magic(components[pos]):
+            pos += 1
+        # Directory expansion starts from
+        self._base = os.sep.join(components[:pos]) or os.sep
+        # Components matched below base, last one matches files
+        self._components = components[pos:]
+        # Map from directory to ((mtime, inode), matching names)
+        self._dir_cache = {}
+        # Set of paths currently matching
+        self.paths = set()
+
+    def update(self):
+        """
+        Expand the pattern, returns tuple of sets with added and
+        removed paths since the last update.
+        """
+        paths = set()
+        visited = set()
+        if not self._components:
+            # No magic, the pattern is a plain path.
+            if os.path.isfile(self._base):
+                paths.add(self._base)
+        else:
+            self._expand(self._base, 0, paths, visited)
+
+        # Forget directories no longer part of the expansion.
+        for dir_path in set(self._dir_cache) - visited:
+            del self._dir_cache[dir_path]
+
+        added = paths - self.paths
+        removed = self.paths - paths
+        self.paths = paths
+        return added, removed
+
+    def _expand(self, dir_path, level, paths, visited):
+        """
+        Expand pattern component level in dir_path, adding matching
+        files to paths and expanded directories to visited.
+        """
+        try:
+            stat_res = os.stat(dir_path)
+        except OSError:
+            return
+        visited.add(dir_path)
+
+        is_last = level == len(self._components) - 1
+        key = (stat_res.st_mtime, stat_res.st_ino)
+        cached = self._dir_cache.get(dir_path)
+        if cached is not None and cached[0] == key:
+            names = cached[1]
+        else:
+            names = self._list(dir_path, self._components[level], is_last)
+            self._dir_cache[dir_path] = (key, names)
+
+        for name in names:
+            path = os.path.join(dir_path, name)
+            if is_last:
+                paths.add(path)
+            else:
+                self._expand(path, level + 1, paths, visited)
+
+    def _list(self, dir_path, component, is_last):
+        """
+        List entries in dir_path matching component, files if is_last
+        is set and directories otherwise.
+        """
+        try:
+            names = fnmatch.filter(os.listdir(dir_path), component)
+        except OSError:
+            return []
+
+        if is_last:
+            is_type = os.path.isfile
+        else:
+            is_type = os.path.isdir
+        return [name for name in names
+                if is_type(os.path.join(dir_path, name))]
+
+    def get_file_name(self, path):
+        """
+        Get name of file discovered at path, the source name followed
+        by the parts of the path matched by magic components.
+        """
+        parts = path[len(self._base):].strip(os.sep).split(os.sep)
+        wild = [part for part, component in zip(parts, self._components)
+                if has_magic(component)]
+        return '-'.join([self.name] + wild)
+
+    def create_file(self, path, seek_end):
+        """
+        Create file for path discovered by this source, files
+        discovered after startup are read from the beginning.
+        """
+        parser = plog.file_parsers.get_parser(
+            self._parser_name, self._parser_options)
+        # Each file samples on its own, the filter is not shared.
+        entry_filter = plog.file2log.filter.EntryFilter.from_options(
+            self._filter_options)
+        return plog.file2log.file.File(
+            self.get_file_name(path), path, parser, self._checkpoints,
+            self._weight, seek_end, self.name, entry_filter)
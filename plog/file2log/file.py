@@ -17,123 +17,262 @@
 Tail file implementation used to watch files by path.
 """
 
-import fcntl
 import os
+import time
+import plog
+import plog.file2log.checkpoint
 
 class File(object):
     """
     File object containing information about a single file source.
     """
 
-    def __init__(self, name, path, parser):
+    def __init__(self, name, path, parser, checkpoints=None, weight=1.0,
+                 seek_end=True, source=None, entry_filter=None):
         """
-        Initialize file source.
+        Initialize file source, if a checkpoint store is given reading
+        resumes from the stored offset. weight sets the share of read
+        bandwidth given to the file by the scheduler. Without a
+        checkpoint reading starts at the end unless seek_end is False.
+        source is the name of the configured source, defaults to name.
+        entry_filter drops and samples parsed entries if given.
         """
         # Name of the file, used in formatting.
         self.name = name
+        # Name of the configured source the file belongs to.
+        self.source = source or name
         # Path to file, used to keep track of re-names.
         self.path = path
         # Parser for file.
         self.parser = parser
+        # Filter applied to parsed entries, None if all are kept.
+        self.entry_filter = entry_filter
+        # Checkpoint store, None if checkpoints are disabled.
+        self.checkpoints = checkpoints
 
-        # File object, None is not opened.
-        self.f_obj = None
-        # File descriptor of file, -1 is not opened.
+        # Scheduling weight, share of read budget each round.
+        self.weight = weight
+        # Scheduler budget left, in bytes.
+        self.deficit = 0
+        # Current read chunk size, adapted to the write rate.
+        self.chunk_size = plog.READ_MAX
+        # Number of bytes read from the file.
+        self.stats_read = 0
+        # Number of rounds the file had data left after using its budget.
+        self.stats_exhausted = 0
+
+        # File descriptor of file, -1 is not opened. Reads go straight
+        # to the descriptor, a buffered file object could return stale
+        # data after seeking in a truncated file.
         self.fd_num = -1
-        # Inode file is associated with.
+        # Offset of the next read.
+        self.offset = 0
+        # Device and inode file is associated with.
+        self.dev = 0
         self.inode = 0
         # Last reported file size.
         self.size = -1
+        # Hash of the first bytes of the file, used in checkpoints.
+        self.head_hash = None
+        # Time the file size last changed.
+        self.last_growth = 0
 
-        # Fill in inode/size information
-        self.is_changed()
-        
         # Finally, open up the file
-        self.open(True)
+        self.open(seek_end)
 
     def close(self):
         """
         Close file.
         """
-        if self.f_obj is not None:
-            self.f_obj.close()
-            self.f_obj = None
+        if self.fd_num != -1:
+            os.close(self.fd_num)
         self.fd_num = -1
+        self.offset = 0
+        self.dev = 0
         self.inode = 0
         self.size = -1
+        self.head_hash = None
 
     def open(self, seek_end=False):
         """
-        Open file, set it to be non-blocking and seek to the end of
-        it to avoid reading old data.
+        Open file, set it to be non-blocking and seek to the stored
+        checkpoint. Without a valid checkpoint seek to the end of it
+        if seek_end is set to avoid reading old data.
         """
         try:
-            self.f_obj = open(self.path, 'r')
-        except IOError:
+            self.fd_num = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        except OSError:
             return False
 
-        # Open file and seek to end
-        self.fd_num = self.f_obj.fileno()
-        if seek_end:
-            self.f_obj.seek(0, 2)
+        stat_res = os.fstat(self.fd_num)
+        self.dev = stat_res.st_dev
+        self.inode = stat_res.st_ino
+        self.size = stat_res.st_size
+        self.last_growth = time.time()
+
+        offset = self._get_checkpoint_offset()
+        if offset is not None:
+            self._seek(offset)
+        elif seek_end and not self._is_rotated_while_down():
+            self._seek(self.size)
+
+        return True
+
+    def _seek(self, offset):
+        """
+        Move the read offset.
+        """
+        self.offset = os.lseek(self.fd_num, offset, os.SEEK_SET)
+
+    def _get_checkpoint_offset(self):
+        """
+        Get offset stored for the opened file, returns None if no
+        checkpoint exists or it does not match the file content.
+        """
+        if self.checkpoints is None:
+            return None
+        checkpoint = self.checkpoints.get(self.dev, self.inode)
+        if checkpoint is None:
+            return None
+
+        offset, hash_str = checkpoint
+        if offset > self.size:
+            return None
+        self._update_head_hash(offset)
+        if self.head_hash != hash_str:
+            return None
+        return offset
+
+    def _is_rotated_while_down(self):
+        """
+        Check if a checkpoint exists for the path but for another
+        inode, the file has then been replaced while file2log was not
+        running and should be read from the beginning.
+        """
+        return (self.checkpoints is not None
+                and self.checkpoints.has_path(self.path))
+
+    def _update_head_hash(self, offset):
+        """
+        Update hash of the first bytes of the file, the hash only
+        covers data before offset as later data can still change.
+        """
+        head_len = min(offset, plog.CHECKPOINT_HEAD_SIZE)
+        if (self.head_hash is not None
+            and int(self.head_hash.split(':', 1)[0]) == head_len):
+            return
 
-        # Set non-blocking mode
-        flags = fcntl.fcntl(self.fd_num, fcntl.F_GETFL)
-        fcntl.fcntl(self.fd_num, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        os.lseek(self.fd_num, 0, os.SEEK_SET)
+        head = []
+        while head_len > 0:
+            data = os.read(self.fd_num, head_len)
+            if not data:
+                break
+            head.append(data)
+            head_len -= len(data)
+        os.lseek(self.fd_num, self.offset, os.SEEK_SET)
+        head = ''.join(head)
+        self.head_hash = plog.file2log.checkpoint.head_hash(head)
+
+    def get_checkpoint(self, offset=None):
+        """
+        Get checkpoint for offset as (device, inode, offset, hash,
+        path), offset defaults to the current position minus data
+        still pending in the parser. Returns None if not opened.
+        """
+        if self.fd_num == -1:
+            return None
+        if offset is None:
+            offset = self.offset - self.parser.get_pending()
+        self._update_head_hash(offset)
+        return (self.dev, self.inode, offset, self.head_hash, self.path)
+
+    def checkpoint(self, offset=None):
+        """
+        Store offset as shipped in the checkpoint store, see
+        get_checkpoint.
+        """
+        if self.checkpoints is None:
+            return
+        checkpoint = self.get_checkpoint(offset)
+        if checkpoint is not None:
+            self.checkpoints.set(*checkpoint)
 
     def reopen(self):
         """
-        Re-open file.
+        Re-open file reading the new file from the start, the
+        checkpoint of the replaced file is removed.
         """
+        if self.checkpoints is not None and self.fd_num != -1:
+            self.checkpoints.remove(self.dev, self.inode)
         self.close()
         self.open()
 
     def is_changed(self):
         """
-        Check if file was changed since last read.
+        Check if the file has been replaced and should be re-opened.
+
+        Steady state checks only fstat the held descriptor. The path
+        is looked at when the held file has been drained to end of
+        file, a replaced file (rename and create rotation) is reported
+        once the new file has data or the old file has been idle for
+        plog.ROTATE_WAIT seconds as writers may keep writing to the
+        old file until they re-open their logs. A file truncated in
+        place (copytruncate rotation) is rewound and not reported, the
+        partial line pending in the parser is dropped.
         """
-        is_changed = False
+        if self.fd_num == -1:
+            return os.path.exists(self.path)
 
-        # Stat file, check if size is < than last time or if st_ino
-        # has changed.
-        try:
-            stat_res = os.stat(self.path)
-
-            # Check if inode has changed, file has been replaced.
-            if stat_res.st_ino != self.inode:
-                is_changed = True
-                self.inode = stat_res.st_ino
-
-            # Check if size is < than previously recorded, rewind but
-            # do not set as changed
-            if stat_res.st_size < self.size:
-                self.size = stat_res.st_size
-                if self.f_obj is not None:
-                    self.f_obj.seek(0)
+        stat_res = os.fstat(self.fd_num)
+        pos = self.offset
+        if stat_res.st_size < pos:
+            self._seek(0)
+            self.head_hash = None
+            self.parser.discard_pending()
+            pos = 0
+        if stat_res.st_size != self.size:
             self.size = stat_res.st_size
+            self.last_growth = time.time()
 
-        except IOError:
-            # FIXME: File does not exist no access, how to handle?
-            pass
+        # Drain the held file before looking for a replacement.
+        if pos < self.size:
+            return False
+
+        try:
+            path_stat = os.stat(self.path)
         except OSError:
-            # FIXME: File does not exist no access, how to handle?
-            pass
+            # Renamed away and not yet re-created, keep reading the old.
+            return False
 
-        return is_changed
+        if (path_stat.st_dev, path_stat.st_ino) == (self.dev, self.inode):
+            return False
+        return (path_stat.st_size > 0
+                or time.time() - self.last_growth >= plog.ROTATE_WAIT)
 
     def has_data(self):
         """
         Check if file has data to be read.
         """
-        if self.f_obj is None:
+        if self.fd_num == -1:
             return False
-        elif self.f_obj.tell() < self.size:
+        elif self.offset < self.size:
             return True
         else:
             return False
 
+    def get_backlog(self):
+        """
+        Return number of bytes known to be left to read.
+        """
+        if self.fd_num == -1:
+            return 0
+        return max(self.size - self.offset, 0)
+
     def read(self, num):
         """
         Read at max num bytes from file.
         """
-        return self.f_obj.read(num)
+        data = os.read(self.fd_num, num)
+        self.offset += len(data)
+        return data
@@ -0,0 +1,150 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Source side drop and sampling rules applied to parsed entries before
+they are encoded and sent.
+"""
+
+import re
+import plog
+import plog.entry
+
+# Position of the status in request entry extra values
+FIELD_STATUS = 4
+# Lowest status of failed requests, kept regardless of the rules
+ERROR_STATUS_MIN = 500
+
+def _split_list(value):
+    """
+    Split comma separated option value into list of stripped items.
+    """
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+class EntryFilter(object):
+    """
+    Per file drop and sampling rules, configured with the filter-
+    options of the source section:
+
+      drop_levels    comma separated level names, e.g. debug
+      drop_match     regular expression searched in the message
+      drop_status    comma separated HTTP status codes
+      sample         keep one in N of the sampled requests
+      sample_status  comma separated HTTP status codes of sampled
+                     requests, defaults to the OK codes
+
+    Errors are always kept, requests failing with a 5xx status and
+    other entries at error level or above. Sampling keeps every N:th
+    sampled request in file order, kept entries get weight N to stand
+    in for the dropped ones.
+    """
+
+    def __init__(self, options):
+        """
+        Initialize filter from options, raises ValueError on invalid
+        options.
+        """
+        # Levels of dropped entries
+        self._drop_levels = set()
+        for name in _split_list(options.get('drop_levels', '')):
+            if name.upper() not in plog.entry.NAME_TO_LEVEL:
+                raise ValueError('unknown level %s' % (name, ))
+            self._drop_levels.add(plog.entry.NAME_TO_LEVEL[name.upper()])
+        # Expression matching messages of dropped entries, None if not
+        # dropping by message
+        self._drop_match = None
+        if options.get('drop_match'):
+            try:
+                self._drop_match = re.compile(options['drop_match'])
+            except re.error, exc:
+                raise ValueError('invalid drop_match expression %s: %s'
+                                 % (options['drop_match'], exc))
+        # Status codes of dropped request entries
+        self._drop_status = self._get_status(options, 'drop_status', ())
+
+        # Keep one in sample of the sampled requests
+        try:
+            self._sample = int(options.get('sample', 1))
+        except ValueError:
+            raise ValueError('invalid sample %s' % (options['sample'], ))
+        if self._sample < 1:
+            raise ValueError('invalid sample %d' % (self._sample, ))
+        # Status codes of sampled request entries
+        self._sample_status = self._get_status(
+            options, 'sample_status', plog.HTTP_CODES_OK)
+        # Number of sampled requests seen
+        self._sample_count = 0
+
+        # Number of entries dropped by drop rules
+        self.stats_dropped = 0
+        # Number of entries dropped by sampling
+        self.stats_sampled = 0
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Create filter from options, None if no rules are configured.
+        """
+        if not options:
+            return None
+        return cls(options)
+
+    def _get_status(self, options, name, default):
+        """
+        Get set of status codes from comma separated option name.
+        """
+        if name not in options:
+            return frozenset(default)
+        try:
+            return frozenset([int(status)
+                              for status in _split_list(options[name])])
+        except ValueError:
+            raise ValueError('invalid %s %s' % (name, options[name]))
+
+    def apply(self, entries):
+        """
+        Return list of entries kept by the rules.
+        """
+        kept = []
+        for entry in entries:
+            if isinstance(entry, plog.entry.RequestEntry):
+                status = entry.extra_values[FIELD_STATUS]
+                is_error = status >= ERROR_STATUS_MIN
+            else:
+                status = None
+                is_error = entry.level <= plog.entry.LEVEL_ERROR
+            if is_error:
+                kept.append(entry)
+                continue
+
+            if entry.level in self._drop_levels or (
+                self._drop_match is not None
+                and self._drop_match.search(entry.msg) is not None):
+                self.stats_dropped += 1
+                continue
+
+            if status is not None:
+                if status in self._drop_status:
+                    self.stats_dropped += 1
+                    continue
+                if self._sample > 1 and status in self._sample_status:
+                    self._sample_count += 1
+                    if self._sample_count % self._sample != 1:
+                        self.stats_sampled += 1
+                        continue
+                    entry.weight = self._sample
+
+            kept.append(entry)
+        return kept
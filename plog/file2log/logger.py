@@ -18,9 +18,80 @@ Log output wrapper, sends log entries to setup logger.
 """
 
 import errno
+import logging
+import os
+import random
 import socket
 import time
+import plog
+import plog.codec
+import plog.file2log.ratelimit
+import plog.file2log.spool
 import plog.file2log.syslog
+import plog.file2log.transport
+import plog.wire
+
+def encode(name, entries, binary=False):
+    """
+    Encode entries from source name, returns list of (facility,
+    priority, message) tuples ready for Logger.send. With binary set
+    messages are records for the binary wire format.
+    """
+    if binary:
+        return [(entry.facility, entry.level,
+                 plog.codec.get_record(entry, name)) for entry in entries]
+    return [(entry.facility, entry.level, entry.to_syslog(name))
+            for entry in entries]
+
+def get_receivers(config):
+    """
+    Get list of (host, port) receivers, from the syslog_hosts list of
+    host:port if set and otherwise syslog_host and syslog_port.
+    """
+    host = config.get('file2log', 'syslog_host', '127.0.0.1')
+    port = int(config.get('file2log', 'syslog_port', '541'))
+    hosts = config.get('file2log', plog.CFG_OPT_SYSLOG_HOSTS)
+    if not hosts:
+        return [(host, port)]
+
+    receivers = []
+    for receiver in hosts.split(','):
+        receiver = receiver.strip()
+        if ':' in receiver:
+            receiver, receiver_port = receiver.rsplit(':', 1)
+            receivers.append((receiver, int(receiver_port)))
+        elif receiver:
+            receivers.append((receiver, port))
+    return receivers
+
+def get_limiter(config):
+    """
+    Get rate limiter from configuration.
+    """
+    return plog.file2log.ratelimit.RateLimiter(
+        config.get_float('file2log', plog.CFG_OPT_RATE, 0),
+        config.get_float('file2log', plog.CFG_OPT_RATE_BURST, 0),
+        config.get_source_rates())
+
+def is_binary(config):
+    """
+    Check if entries are sent in the binary wire format, the local
+    syslog daemon only understands the text format.
+    """
+    if (config.get('file2log', plog.CFG_OPT_WIRE_FORMAT,
+                   plog.DEFAULT_WIRE_FORMAT) != 'binary'):
+        return False
+    if (config.get('file2log', plog.CFG_OPT_TRANSPORT,
+                   plog.DEFAULT_TRANSPORT) == 'tcp'):
+        return True
+    receivers = get_receivers(config)
+    return len(receivers) > 1 or not _is_local(*receivers[0])
+
+def _is_local(host, port):
+    """
+    Check if address is the local syslog daemon.
+    """
+    return host.lower() in ('localhost', '127.0.0.1') and port == 541
 
 class Logger(object):
     """
@@ -28,26 +99,523 @@ class Logger(object):
     server.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, address=None, limiter=None):
         """
-        Initialize logger.
+        Initialize logger sending to address, defaults to the first
+        configured receiver. Loggers for different receivers share the
+        rate limiter.
         """
-        host = config.get('file2log', 'syslog_host', '127.0.0.1')
-        port = int(config.get('file2log', 'syslog_port', '541'))
+        if address is None:
+            address = get_receivers(config)[0]
+        host, port = address
+        # Receiver name used in statistics
+        self.name = '%s:%d' % (host, port)
+        transport = config.get('file2log', plog.CFG_OPT_TRANSPORT,
+                               plog.DEFAULT_TRANSPORT)
 
-        if host.lower() in ('localhost', '127.0.0.1') and port == 541:
+        # Sending frames over a TCP stream
+        self._tcp = transport == 'tcp'
+        if self._tcp:
+            self.syslog = plog.file2log.transport.TcpClient((host, port))
+        elif _is_local(host, port):
             self.syslog = plog.file2log.syslog.SyslogClient()
         else:
             self.syslog = plog.file2log.syslog.SyslogClient((host, port))
 
-    def log(self, name, entries):
+        # Maximum size of batch datagrams, or bytes written at once to
+        # TCP, 0 disables batching. The local syslog daemon does not
+        # understand batches.
+        if self._tcp:
+            self._batch_size = config.get_int(
+                'file2log', plog.CFG_OPT_TCP_COALESCE, plog.TCP_COALESCE)
+        elif self.syslog.unix:
+            self._batch_size = 0
+        else:
+            self._batch_size = config.get_int(
+                'file2log', plog.CFG_OPT_BATCH_SIZE, plog.BATCH_SIZE)
+            if self._batch_size > plog.DATAGRAM_MAX:
+                logging.warning('batch_size %d larger than a datagram, '
+                                'using %d'
+                                % (self._batch_size, plog.DATAGRAM_MAX))
+                self._batch_size = plog.DATAGRAM_MAX
+        # Seconds a batch may wait for more messages
+        self._batch_linger = config.get_float(
+            'file2log', plog.CFG_OPT_BATCH_LINGER, plog.BATCH_LINGER)
+        # Frames in current batch
+        self._batch = []
+        # Size of frames in current batch
+        self._batch_len = 0
+        # Time first frame was added to current batch
+        self._batch_start = 0.0
+
+        # Sending entries in the binary wire format
+        self._binary = is_binary(config)
+        # Encoded records of the current binary message
+        self._records = []
+        # Size of records of the current binary message
+        self._records_len = 0
+        # Maximum size of records in a binary message
+        if self._tcp:
+            self._records_max = self._batch_size
+        else:
+            self._records_max = self._batch_size - 2 * plog.BATCH_OVERHEAD
+        # String dictionary of the current binary message
+        self._table = None
+
+        # Compression codec identifier, None if not compressing. The
+        # local syslog daemon does not understand compressed messages.
+        compression = config.get('file2log', plog.CFG_OPT_COMPRESSION,
+                                 plog.DEFAULT_COMPRESSION)
+        self._codec = plog.wire.CODEC_NAMES.get(compression)
+        if self._codec is not None and not plog.wire.has_codec(self._codec):
+            logging.warning('compression %s not available, using zlib'
+                            % (compression, ))
+            self._codec = plog.wire.CODEC_ZLIB
+        if not self._batch_size:
+            self._codec = None
+        # Minimum size of payloads to compress
+        self._compress_min = config.get_int(
+            'file2log', plog.CFG_OPT_COMPRESS_MIN, plog.COMPRESS_MIN)
+        # Compression level
+        self._compress_level = config.get_int(
+            'file2log', plog.CFG_OPT_COMPRESS_LEVEL, plog.COMPRESS_LEVEL)
+        # Recent compressed to uncompressed size ratio, used to pack
+        # datagrams
+        self._compress_ratio = 1.0
+        # Maximum size of frames in a batch, batches are split in
+        # datagrams when sent. With compression more frames fit in a
+        # datagram.
+        if self._codec is not None and not self._tcp:
+            self._batch_max = self._batch_size * plog.COMPRESS_PACK_MAX
+        else:
+            self._batch_max = self._batch_size
+
+        # Spool holding frames while the receiver is unreachable, None
+        # if not spooling
+        spool_path = config.get('file2log', plog.CFG_OPT_SPOOL_PATH)
+        if spool_path is not None and len(get_receivers(config)) > 1:
+            spool_path = os.path.join(spool_path, '%s_%d' % (host, port))
+        if spool_path is not None and self._batch_size:
+            self._spool = plog.file2log.spool.Spool(
+                spool_path, plog.SPOOL_SEGMENT_SIZE,
+                config.get_int('file2log', plog.CFG_OPT_SPOOL_MAX_SIZE,
+                               plog.SPOOL_MAX_SIZE),
+                config.get_int('file2log', plog.CFG_OPT_SPOOL_MAX_AGE,
+                               plog.SPOOL_MAX_AGE))
+        else:
+            self._spool = None
+        # Maximum bytes replayed from the spool per flush
+        self._replay_budget = config.get_int(
+            'file2log', plog.CFG_OPT_SPOOL_REPLAY_BUDGET,
+            plog.SPOOL_REPLAY_BUDGET)
+        # Time before which failed UDP sends are not retried
+        self._retry_time = 0.0
+        # Id of the last fragmented message, starts at random to not
+        # reuse ids of a previous run still in the receiver table
+        self._fragment_id = random.getrandbits(32)
+
+        # Global and per source rate limits
+        if limiter is None:
+            limiter = get_limiter(config)
+        self._limiter = limiter
+
+        # Number of messages sent
+        self.stats_sent = 0
+        # Number of batch datagrams sent
+        self.stats_batches = 0
+        # Number of fragments sent
+        self.stats_fragments = 0
+        # Number of bytes compressed and compressed size
+        self.stats_compress_in = 0
+        self.stats_compress_out = 0
+        # Seconds spent compressing
+        self.stats_compress_time = 0.0
+        # Number of payloads below the compression threshold or not
+        # getting smaller
+        self.stats_compress_skipped = 0
+        # Seconds spent waiting for rate limits
+        self.stats_throttled = 0.0
+        # Seconds between statistics reports
+        self._stats_interval = config.get_int(
+            'file2log', plog.CFG_OPT_STATS_INTERVAL, plog.STATS_INTERVAL)
+        # Time of the last statistics report
+        self._last_stats = time.time()
+        # Spooled frames replayed at the last statistics report
+        self._last_replayed = 0
+
+    def log(self, name, entries, source=None, path=None):
+        """
+        Write formatted entry to syslog, source is the configured
+        source the entries belong to and defaults to name. path is the
+        file the entries were read from, used by Router.
+        """
+        self.send(encode(name, entries, self._binary), source or name)
+
+    def send(self, messages, source=None, path=None):
+        """
+        Write encoded messages, list of (facility, priority, message)
+        tuples as returned by encode, from source to syslog. Sleeps
+        when the global or source rate limit is exceeded. path is
+        ignored, see log.
+        """
+        for facility, priority, msg in messages:
+            wait = self._limiter.take(source)
+            if wait > 0.0:
+                time.sleep(wait)
+                self.stats_throttled += wait
+
+            self._write(facility, priority, msg)
+        self.stats_sent += len(messages)
+
+        if ((self._batch or self._records)
+            and time.time() - self._batch_start >= self._batch_linger):
+            self.flush()
+
+        if time.time() - self._last_stats >= self._stats_interval:
+            self.log_stats()
+            self._last_stats = time.time()
+
+    def _write(self, facility, priority, msg):
+        """
+        Add message to the current batch, sending the batch when full.
+        Messages not fitting in a batch are split in fragments, over TCP
+        messages of any size are sent in one frame.
+        """
+        if not self._batch_size:
+            self._log_until_size_ok(facility, priority, msg)
+            return
+
+        if self._binary:
+            self._write_record(msg)
+            return
+
+        frame = plog.wire.encode_frame(
+            plog.wire.encode_syslog(facility, priority, msg))
+        if (not self._tcp
+            and len(frame) + plog.BATCH_OVERHEAD > self._batch_size):
+            self._write_fragments(
+                plog.wire.encode_syslog(facility, priority, msg))
+            return
+
+        self._add_frame(frame)
+
+    def _write_record(self, record):
+        """
+        Add record to the current binary message, the message is
+        added to the batch when full.
+        """
+        if not self._records:
+            self._table = plog.codec.StringTable()
+            if not self._batch:
+                self._batch_start = time.time()
+        elif self._table.is_full():
+            self._close_records()
+            self._table = plog.codec.StringTable()
+        data = plog.codec.encode_record(record, self._table)
+        if (self._records
+            and self._records_len + len(data) > self._records_max):
+            # Strings are sent again in a new message.
+            self._close_records()
+            self._table = plog.codec.StringTable()
+            data = plog.codec.encode_record(record, self._table)
+
+        if not self._tcp and len(data) > self._records_max:
+            self._write_fragments(plog.wire.encode_syslog(
+                plog.DEFAULT_FACILITY, plog.file2log.syslog.LOG_INFO,
+                plog.codec.encode_message([data])))
+            return
+
+        self._records.append(data)
+        self._records_len += len(data)
+        if self._records_len >= self._records_max:
+            self._close_records()
+
+    def _close_records(self):
+        """
+        Add the current binary message to the batch.
+        """
+        msg = plog.codec.encode_message(self._records)
+        self._records = []
+        self._records_len = 0
+        self._add_frame(plog.wire.encode_frame(plog.wire.encode_syslog(
+            plog.DEFAULT_FACILITY, plog.file2log.syslog.LOG_INFO, msg)))
+
+    def _write_fragments(self, data):
+        """
+        Split syslog data too large for a batch datagram in fragments,
+        each sent in a datagram of its own. With compression the data
+        is compressed first, often making it fit a single datagram.
+        """
+        msg = self._compress(plog.wire.encode_frame(data))
+        if msg is not None:
+            data = plog.wire.encode_syslog(
+                plog.DEFAULT_FACILITY, plog.file2log.syslog.LOG_INFO, msg)
+            if len(data) + 2 * plog.BATCH_OVERHEAD <= self._batch_size:
+                self._add_frame(plog.wire.encode_frame(data))
+                return
+
+        self._fragment_id = (self._fragment_id + 1) & 0xffffffff
+        fragments = plog.wire.encode_fragments(
+            self._fragment_id, data,
+            self._batch_size - 2 * plog.BATCH_OVERHEAD)
+        for fragment in fragments:
+            self._add_frame(plog.wire.encode_frame(plog.wire.encode_syslog(
+                plog.DEFAULT_FACILITY, plog.file2log.syslog.LOG_INFO,
+                fragment)))
+        self.stats_fragments += len(fragments)
+
+    def _add_frame(self, frame):
+        """
+        Add frame to the current batch, over UDP sending the batch
+        first if the frame does not fit and over TCP sending it once
+        full.
+        """
+        if (not self._tcp and self._batch_len + len(frame)
+            + plog.BATCH_OVERHEAD > self._batch_max):
+            self.flush()
+        if not self._batch:
+            self._batch_start = time.time()
+        self._batch.append(frame)
+        self._batch_len += len(frame)
+        if self._tcp and self._batch_len >= self._batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the current batch. With a spool frames that can not be
+        sent are spooled, and spooled frames are replayed once the
+        receiver is reachable. Without a spool frames kept while the
+        TCP connection was down are sent as well.
+        """
+        if self._records:
+            self._close_records()
+
+        frames = self._batch
+        self._batch = []
+        self._batch_len = 0
+
+        if self._spool is None:
+            self._send_frames(frames)
+            return
+
+        # Keep order by spooling everything until the spool is empty.
+        if frames and not self._spool.get_depth() and self.is_healthy():
+            frames = frames[self._send_frames(frames):]
+        self._spool.append(frames)
+        self._replay()
+
+    def _replay(self):
+        """
+        Send spooled frames in large sequential batches, at most
+        replay_budget bytes per call.
+        """
+        budget = self._replay_budget
+        while budget > 0 and self._spool.get_depth() and self.is_healthy():
+            frames = self._spool.read(min(budget, plog.TCP_COALESCE))
+            if not frames:
+                break
+            sent = self._send_frames(frames)
+            self._spool.consume(sent)
+            if sent < len(frames):
+                break
+            budget -= sum([len(frame) for frame in frames])
+
+    def is_sent(self):
+        """
+        Check if all messages written have been handed to the socket
+        or the spool, frames kept by the TCP client while it can not
+        send are not.
+        """
+        return (not self._batch and not self._records
+                and not (self._tcp and self.syslog.get_pending()))
+
+    def is_healthy(self):
+        """
+        Check if the receiver is reachable.
+        """
+        if self._tcp:
+            return self.syslog.is_healthy()
+        return time.time() >= self._retry_time
+
+    def _send_frames(self, frames):
+        """
+        Send frames, over UDP packed in batch datagrams and over TCP
+        in a single write, compressed if enabled. Fragments and
+        compressed messages are sent in datagrams of their own. Returns
+        the number of frames sent, frames not sent are left to the
+        caller.
+        """
+        if self._tcp:
+            return self._send_frames_tcp(frames)
+
+        sent = 0
+        while sent < len(frames):
+            msg = plog.wire.get_datagram_message(frames[sent])
+            if msg is not None:
+                end = sent + 1
+            else:
+                end = self._pack_frames(frames, sent)
+                msg = self._encode_batch(frames[sent:end])
+            while msg is None and end - sent > 1:
+                # Compressed less than expected, send fewer frames.
+                end = sent + (end - sent) / 2
+                msg = self._encode_batch(frames[sent:end])
+            if msg is None:
+                msg = plog.wire.BATCH_SIGNATURE + frames[sent]
+            try:
+                self.syslog.log(msg, plog.DEFAULT_FACILITY,
+                                plog.file2log.syslog.LOG_INFO)
+            except socket.error, exc:
+                # Marks the receiver unhealthy, without a spool the
+                # frames are lost.
+                logging.warning('failed to send batch to %s: %s'
+                                % (self.name, exc))
+                self._retry_time = time.time() + plog.SPOOL_RETRY
+                break
+            self.stats_batches += 1
+            sent = end
+        return sent
+
+    def _send_frames_tcp(self, frames):
+        """
+        Send frames over TCP, see _send_frames.
+        """
+        data = frames
+        if frames:
+            self.stats_batches += 1
+            msg = self._compress(''.join(frames))
+            if msg is not None:
+                data = [plog.wire.encode_frame(plog.wire.encode_syslog(
+                    plog.DEFAULT_FACILITY, plog.file2log.syslog.LOG_INFO,
+                    msg))]
+
+        self.syslog.send_frames(data)
+        if self._spool is None:
+            return len(frames)
+        pending = len(self.syslog.take_pending())
+        if not pending:
+            return len(frames)
+        if len(data) != len(frames):
+            # The compressed message holding all frames is not sent.
+            return 0
+        # Frames are sent in order, the pending frames are the last.
+        return max(len(frames) - pending, 0)
+
+    def _pack_frames(self, frames, start):
+        """
+        Get end of frames from start expected to fit a datagram, using
+        the recent compression ratio when compressing.
+        """
+        limit = self._batch_size - plog.BATCH_OVERHEAD
+        if self._codec is not None:
+            limit = min(int(limit * plog.COMPRESS_PACK_MARGIN
+                            / self._compress_ratio),
+                        limit * plog.COMPRESS_PACK_MAX)
+
+        end = start + 1
+        size = len(frames[start])
+        while (end < len(frames) and size + len(frames[end]) <= limit
+               and plog.wire.get_datagram_message(frames[end]) is None):
+            size += len(frames[end])
+            end += 1
+        return end
+
+    def _encode_batch(self, frames):
+        """
+        Encode batch datagram message, compressed if enabled and it
+        helps. Returns None if frames do not fit a datagram.
+        """
+        data = ''.join(frames)
+        msg = self._compress(data)
+        if msg is None:
+            msg = plog.wire.BATCH_SIGNATURE + data
+        if len(msg) + plog.BATCH_OVERHEAD > self._batch_size:
+            return None
+        return msg
+
+    def _compress(self, data):
+        """
+        Compress octet counted frames in data, returns compressed
+        message or None if not compressing, data is below the
+        threshold or does not get smaller.
+        """
+        if self._codec is None:
+            return None
+        if len(data) < self._compress_min:
+            self.stats_compress_skipped += 1
+            return None
+
+        start = time.time()
+        msg = plog.wire.compress(self._codec, data, self._compress_level)
+        self.stats_compress_time += time.time() - start
+
+        ratio = len(msg) / float(len(data))
+        self._compress_ratio = max(
+            0.5 * self._compress_ratio + 0.5 * ratio,
+            1.0 / plog.COMPRESS_PACK_MAX)
+        if len(msg) >= len(data):
+            self.stats_compress_skipped += 1
+            return None
+        self.stats_compress_in += len(data)
+        self.stats_compress_out += len(msg)
+        return msg
+
+    def get_timeout(self):
+        """
+        Get seconds until the current batch must be sent, None if no
+        batch is pending.
+        """
+        if not self._batch and not self._records and (
+            (self._tcp and self.syslog.get_pending())
+            or (self._spool is not None and self._spool.get_depth())):
+            # Retry sending while the receiver is unreachable.
+            return plog.WATCH_TIMEOUT
+        if not self._batch and not self._records:
+            return None
+        return max(self._batch_start + self._batch_linger - time.time(), 0.0)
+
+    def log_stats(self):
+        """
+        Log send statistics.
+        """
+        logging.info('logger %s: sent %d messages in %d batches, '
+                     '%d fragments, throttled %.3f seconds'
+                     % (self.name, self.stats_sent, self.stats_batches,
+                        self.stats_fragments, self.stats_throttled))
+        if self._codec is not None:
+            logging.info('logger %s: compressed %d bytes to %d (%.1f%%) '
+                         'in %.3f seconds, %d payloads not compressed'
+                         % (self.name, self.stats_compress_in,
+                            self.stats_compress_out,
+                            100.0 * self.stats_compress_out
+                            / (self.stats_compress_in or 1),
+                            self.stats_compress_time,
+                            self.stats_compress_skipped))
+        if self._tcp:
+            logging.info('logger %s: %d bytes pending, %d connects, '
+                         '%d messages dropped'
+                         % (self.name, self.syslog.get_pending(),
+                            self.syslog.stats_connects,
+                            self.syslog.stats_dropped))
+        if self._spool is not None:
+            replayed = self._spool.stats_replayed - self._last_replayed
+            self._last_replayed = self._spool.stats_replayed
+            logging.info('logger %s: spool %d bytes in %d segments, '
+                         'spooled %d, replayed %d (%.1f/s), dropped %d bytes'
+                         % (self.name, self._spool.get_depth(),
+                            self._spool.get_segments(),
+                            self._spool.stats_spooled,
+                            self._spool.stats_replayed,
+                            replayed / float(self._stats_interval or 1),
+                            self._spool.stats_dropped))
+
+    def close(self):
         """
-        Write formatted entry to syslog.
+        Send pending frames and close the spool.
         """
-        for entry in entries:
-            msg = entry.to_syslog(name)
-            self._log_until_size_ok(entry.facility, entry.level, msg)
-            time.sleep(plog.SYSLOG_INTERVAL)
+        self.flush()
+        if self._spool is not None:
+            self._spool.close()
 
     def _log_until_size_ok(self, facility, priority, msg):
         """
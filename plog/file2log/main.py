@@ -17,12 +17,16 @@
 file2log main routine.
 """
 
-import time
-import cStringIO
+import logging
 import plog
 import plog.config
 import plog.daemon
+import plog.file2log.checkpoint
 import plog.file2log.logger
+import plog.file2log.pool
+import plog.file2log.reader
+import plog.file2log.router
+import plog.file2log.sender
 
 class File2LogDaemon(plog.daemon.Daemon):
     """
@@ -40,66 +44,160 @@ class File2LogDaemon(plog.daemon.Daemon):
         self._logger = None
         # List of file information objects
         self._files = None
+        # Read offset checkpoints, None if disabled
+        self._checkpoints = None
+        # List of glob and directory sources
+        self._sources = None
+        # Sender thread, None if sending from the main thread
+        self._sender = None
+        # Sending entries in the binary wire format
+        self._binary = False
 
     def _daemon_main(self):
         """
-        Main routine for the reader, runs a select loop waiting for
-        input/errors on the selected files.
+        Main routine for the reader, reads, parses and logs new data
+        either in this process or in a pool of worker processes.
         """
         self._drop_privileges()
 
         # Init and read configuration
-        self._logger = plog.file2log.logger.Logger(self._config)
-        self._files = self._config.get_log_files()
+        self._logger = plog.file2log.router.get_logger(self._config)
+        self._checkpoints = self._initialize_checkpoints()
+        self._files = self._config.get_log_files(self._checkpoints)
+        self._sources = self._config.get_log_sources(self._checkpoints)
 
-        buf = cStringIO.StringIO()
         poller = self._initialize_read(self._files)
 
-        read_data = False
+        num_workers = self._config.get_int(
+            'file2log', plog.CFG_OPT_WORKERS, 0)
+        if num_workers > 1:
+            self._run_pool(num_workers)
+        elif self._config.get_bool(
+            'file2log', plog.CFG_OPT_SEND_THREAD, '0'):
+            self._run_threaded()
+        else:
+            self._run()
+
+        if self._checkpoints is not None:
+            self._checkpoints.flush_sent(self._logger, True)
+        self._logger.close()
+
+    def _run(self):
+        """
+        Read, parse and log in this process until stopped.
+        """
+        reader = plog.file2log.reader.Reader(
+            self._config, self._files, self._handle_entries, self._sources)
         while self._do_run():
-            # Iterate over files looking for changes, not using poll
-            # here as files can change name and thus following path
-            # names will not work using the stat approach.
-            for f_obj in self._files:
-                # Re-open file if it has been truncated or been replaced.
-                if f_obj.is_changed():
-                    f_obj.reopen()
-                if not f_obj.has_data():
-                    continue
-
-                # Try to read data, continue if nothing was returned
-                data = f_obj.read(plog.READ_MAX)
-                if not data:
-                    continue
-
-                # Clears out buffer and reads all the new data in.
-                read_data = True
-                self._add_data(buf, data)
-
-                # Parse, format and send to logger
-                self._logger.log(f_obj.name, f_obj.parser.feed(buf.getvalue()))
-
-            # Wait and do another round
-            if not read_data:
-                time.sleep(plog.READ_INTERVAL)
-            read_data = False
+            reader.run_once()
+            # Send pending batch before waiting for more data.
+            if reader.is_idle():
+                self._logger.flush()
+            if self._checkpoints is not None:
+                self._checkpoints.flush_sent(self._logger)
+        reader.close()
+
+    def _run_threaded(self):
+        """
+        Read and parse in this thread until stopped, sending from a
+        sender thread so slow sends and reconnects do not stall reading.
+        """
+        self._binary = plog.file2log.logger.is_binary(self._config)
+        self._sender = plog.file2log.sender.Sender(
+            self._logger, self._handle_messages, self._checkpoints)
+        self._sender.start()
+
+        reader = plog.file2log.reader.Reader(
+            self._config, self._files, self._queue_entries, self._sources)
+        while self._do_run() and self._sender.is_alive():
+            reader.run_once()
+        reader.close()
+
+        self._sender.stop()
+        if self._sender.stats_blocked:
+            logging.info('reading blocked %d times on a full send queue'
+                         % (self._sender.stats_blocked, ))
+
+    def _run_pool(self, num_workers):
+        """
+        Read and parse in num_workers worker processes, sending the
+        messages they produce until stopped.
+        """
+        pool = plog.file2log.pool.WorkerPool(
+            self._config, self._files, self._sources, num_workers)
+        pool.start()
+
+        # Workers have their own copies of the files, close them here
+        # to not keep rotated files open.
+        for f_obj in self._files:
+            f_obj.close()
+
+        while self._do_run() and pool.is_alive():
+            timeout = self._logger.get_timeout()
+            if timeout is None:
+                timeout = plog.WATCH_TIMEOUT
+            items = pool.get(timeout)
+            if items:
+                self._handle_messages(items)
+            else:
+                self._logger.flush()
+            if self._checkpoints is not None:
+                self._checkpoints.flush_sent(self._logger)
+        self._handle_messages(pool.stop())
+
+    def _handle_entries(self, f_obj, entries):
+        """
+        Format and send entries parsed from f_obj to logger. The
+        checkpoint is only written once the logger has sent the
+        entries, see CheckpointStore.flush_sent.
+        """
+        self._logger.log(f_obj.name, entries, f_obj.source, f_obj.path)
+        f_obj.checkpoint()
 
-    def _initialize_read(self, files):
+    def _queue_entries(self, f_obj, entries):
         """
-        Initialize reading of files, resetting position, mtimes etc.
+        Encode entries parsed from f_obj and queue them for the sender
+        thread, blocks while the send queue is full.
         """
-        # FIXME: Implement Reader._initialize_read
+        if f_obj.checkpoints is not None:
+            checkpoint = f_obj.get_checkpoint()
+        else:
+            checkpoint = None
+
+        if entries or checkpoint is not None:
+            self._sender.put(
+                (f_obj.source, f_obj.path,
+                 plog.file2log.logger.encode(f_obj.name, entries,
+                                             self._binary),
+                 checkpoint))
+
+    def _handle_messages(self, items):
+        """
+        Send (source, path, messages, checkpoint) tuples from workers
+        or the reader thread to logger.
+        """
+        for source, path, messages, checkpoint in items:
+            self._logger.send(messages, source, path)
+            if checkpoint is not None and self._checkpoints is not None:
+                self._checkpoints.set(*checkpoint)
 
-    def _add_data(self, buf, data):
+    def _initialize_checkpoints(self):
         """
-        Read to end of file appending data read to buf.
+        Create checkpoint store if a checkpoint path is configured.
         """
-        # Reset buffer before starting to read.
-        buf.reset()
-        buf.truncate()
+        path = self._config.get('file2log', plog.CFG_OPT_CHECKPOINT_PATH)
+        if path is None:
+            return None
+        interval = self._config.get_int(
+            'file2log', plog.CFG_OPT_CHECKPOINT_INTERVAL,
+            plog.CHECKPOINT_INTERVAL)
+        return plog.file2log.checkpoint.CheckpointStore(path, interval)
 
-        # Read data up until READ_MAX and return 
-        buf.write(data)
+    def _initialize_read(self, files):
+        """
+        Initialize reading of files, resetting position, mtimes etc.
+        """
+        # FIXME: Implement Reader._initialize_read
 
 def main():
     """
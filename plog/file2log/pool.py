@@ -0,0 +1,191 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Worker processes reading and parsing files in parallel, each file is
+handled by a single worker to keep the order of its entries.
+"""
+
+import logging
+import multiprocessing
+import signal
+import zlib
+import Queue
+import plog
+import plog.file2log.logger
+import plog.file2log.reader
+
+class Worker(multiprocessing.Process):
+    """
+    Worker process reading and parsing its share of the files, puts
+    (source, path, messages, checkpoint) tuples on the queue for the
+    main process to send.
+    """
+
+    def __init__(self, config, files, foreign_files, sources, shard,
+                 num_workers, queue, stop_event):
+        """
+        Initialize worker for files, foreign_files are files of other
+        workers which are closed when the worker starts. Of the files
+        discovered by sources the worker reads the ones in its shard.
+        """
+        multiprocessing.Process.__init__(self)
+        self.daemon = True
+
+        # Configuration
+        self._config = config
+        # Files read by this worker
+        self._files = files
+        # Files inherited from the main process but not read
+        self._foreign_files = foreign_files
+        # Sources discovering files
+        self._sources = sources
+        # Shard number of this worker and total number of workers
+        self._shard = shard
+        self._num_workers = num_workers
+        # Queue to main process
+        self._queue = queue
+        # Event set when worker should shut down
+        self._stop_event = stop_event
+        # Encoding entries in the binary wire format
+        self._binary = plog.file2log.logger.is_binary(config)
+
+    def run(self):
+        """
+        Worker main routine, read until stop event is set.
+        """
+        # Main process handles signals and sets the stop event.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        for f_obj in self._foreign_files:
+            f_obj.close()
+
+        reader = plog.file2log.reader.Reader(
+            self._config, self._files, self._handle_entries,
+            self._sources, self._is_own_path)
+        try:
+            while not self._stop_event.is_set():
+                reader.run_once()
+        finally:
+            # Queues the entries held back by the parsers.
+            reader.close()
+            self._queue.close()
+
+    def _is_own_path(self, path):
+        """
+        Check if discovered path belongs to this worker.
+        """
+        return WorkerPool.get_shard(path, self._num_workers) == self._shard
+
+    def _handle_entries(self, f_obj, entries):
+        """
+        Encode entries and pass them to the main process.
+        """
+        if f_obj.checkpoints is not None:
+            checkpoint = f_obj.get_checkpoint()
+        else:
+            checkpoint = None
+
+        if entries or checkpoint is not None:
+            self._queue.put(
+                (f_obj.source, f_obj.path,
+                 plog.file2log.logger.encode(f_obj.name, entries,
+                                             self._binary),
+                 checkpoint))
+
+class WorkerPool(object):
+    """
+    Pool of worker processes sharing the files between them.
+    """
+
+    def __init__(self, config, files, sources, num_workers):
+        """
+        Initialize pool of num_workers workers, files and files
+        discovered by sources are sharded across workers by path.
+        """
+        # Queue from workers
+        self._queue = multiprocessing.Queue(plog.WORKER_QUEUE_MAX)
+        # Event set when workers should shut down
+        self._stop_event = multiprocessing.Event()
+
+        shards = [[] for _ in xrange(num_workers)]
+        for f_obj in files:
+            shards[self.get_shard(f_obj.path, num_workers)].append(f_obj)
+
+        # List of worker processes
+        self._workers = []
+        for num, shard in enumerate(shards):
+            foreign = [f_obj for f_obj in files if f_obj not in shard]
+            self._workers.append(Worker(
+                config, shard, foreign, sources, num, num_workers,
+                self._queue, self._stop_event))
+
+    @staticmethod
+    def get_shard(path, num_workers):
+        """
+        Get worker number for path.
+        """
+        return (zlib.crc32(path) & 0xffffffff) % num_workers
+
+    def start(self):
+        """
+        Start all workers.
+        """
+        for worker in self._workers:
+            worker.start()
+
+    def is_alive(self):
+        """
+        Check that all workers are running.
+        """
+        for worker in self._workers:
+            if not worker.is_alive():
+                logging.error('file2log worker %s exited with code %s'
+                              % (worker.pid, worker.exitcode))
+                return False
+        return True
+
+    def get(self, timeout=plog.WATCH_TIMEOUT):
+        """
+        Get list of (source, path, messages, checkpoint) tuples from
+        the workers, waits at most timeout seconds for the first one.
+        """
+        items = []
+        try:
+            items.append(self._queue.get(True, timeout))
+            while len(items) < plog.WORKER_QUEUE_MAX:
+                items.append(self._queue.get_nowait())
+        except Queue.Empty:
+            pass
+        except IOError:
+            # Interrupted by signal.
+            pass
+        return items
+
+    def stop(self):
+        """
+        Stop workers, returns items queued by them before exiting.
+        """
+        self._stop_event.set()
+
+        items = []
+        while [worker for worker in self._workers if worker.is_alive()]:
+            items.extend(self.get(plog.READ_INTERVAL))
+        items.extend(self.get(0))
+
+        for worker in self._workers:
+            worker.join()
+        return items
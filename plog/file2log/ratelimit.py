@@ -0,0 +1,95 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Rate limiting of sent messages.
+"""
+
+import time
+
+class TokenBucket(object):
+    """
+    Token bucket allowing rate messages per second on average and
+    bursts of up to burst messages.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Initialize full bucket, burst defaults to one second worth of
+        messages.
+        """
+        if burst is None or burst < 1:
+            burst = max(rate, 1)
+
+        # Tokens added per second
+        self.rate = float(rate)
+        # Maximum number of tokens
+        self.burst = float(burst)
+        # Tokens currently available
+        self._tokens = self.burst
+        # Time tokens were last added
+        self._last = time.time()
+
+    def take(self):
+        """
+        Take one token, returns number of seconds to wait before it
+        may be used. The token is taken even if the bucket is empty.
+        """
+        now = time.time()
+        self._tokens = min(self._tokens + (now - self._last) * self.rate,
+                           self.burst)
+        self._last = now
+
+        self._tokens -= 1.0
+        if self._tokens >= 0.0:
+            return 0.0
+        return -self._tokens / self.rate
+
+class RateLimiter(object):
+    """
+    Global and per source rate limits, shared by loggers sending to
+    different receivers.
+    """
+
+    def __init__(self, rate=0, burst=None, source_rates=None):
+        """
+        Initialize limiter allowing rate messages per second in total,
+        0 for no limit, and source_rates {source: (rate, burst)} per
+        source.
+        """
+        # Global rate limit, None if not limited
+        if rate > 0:
+            self._bucket = TokenBucket(rate, burst)
+        else:
+            self._bucket = None
+        # Map from source name to rate limit
+        self._source_buckets = {}
+        for source, (source_rate, source_burst) in \
+                (source_rates or {}).iteritems():
+            self._source_buckets[source] = TokenBucket(source_rate,
+                                                       source_burst)
+
+    def take(self, source):
+        """
+        Take a token for a message from source, returns number of
+        seconds to wait before sending it.
+        """
+        wait = 0.0
+        if self._bucket is not None:
+            wait = self._bucket.take()
+        source_bucket = self._source_buckets.get(source)
+        if source_bucket is not None:
+            wait = max(wait, source_bucket.take())
+        return wait
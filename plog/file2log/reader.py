@@ -0,0 +1,189 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+File reader combining the watcher and scheduler, shared between the
+file2log main process and its workers.
+"""
+
+import logging
+import time
+import plog
+import plog.file2log.scheduler
+import plog.file2log.watcher
+
+class Reader(object):
+    """
+    Reads files reported as changed by the watcher using the
+    scheduler, parsed entries kept by the entry filter of the file are
+    passed to handle(f_obj, entries).
+    """
+
+    def __init__(self, config, files, handle, sources=None,
+                 path_filter=None):
+        """
+        Initialize reader for files and files discovered by sources,
+        only discovered paths accepted by path_filter are read.
+        """
+        # List of file information objects
+        self._files = files
+        # Callback receiving parsed entries
+        self._handle = handle
+        # Sources discovering files
+        self._sources = sources or []
+        # Function returning True for discovered paths to read
+        self._path_filter = path_filter
+        # Map from discovered path to file
+        self._discovered = {}
+        # Discovered files no longer matching, closed when drained
+        self._retired = []
+
+        # Watcher reporting changed files
+        self._watcher = plog.file2log.watcher.get_watcher(
+            config.get('file2log', plog.CFG_OPT_WATCHER,
+                       plog.DEFAULT_WATCHER), files)
+        # Scheduler sharing reads between files
+        self._scheduler = plog.file2log.scheduler.Scheduler(
+            config.get_int('file2log', plog.CFG_OPT_READ_BUDGET,
+                           plog.READ_BUDGET))
+
+        # Files that had data on the last round, these are checked
+        # again without waiting for the watcher.
+        self._active = list(files)
+
+        # Seconds between source discovery runs
+        self._discover_interval = config.get_int(
+            'file2log', plog.CFG_OPT_DISCOVER_INTERVAL,
+            plog.DISCOVER_INTERVAL)
+        # Time of the last discovery run
+        self._last_discover = time.time()
+        # Time parsers were last checked for idle multi-line entries
+        self._last_idle = time.time()
+        # Files existing at startup are treated like configured files.
+        self.discover(True)
+
+        # Seconds between statistics reports
+        self._stats_interval = config.get_int(
+            'file2log', plog.CFG_OPT_STATS_INTERVAL, plog.STATS_INTERVAL)
+        # Time of the last statistics report
+        self._last_stats = time.time()
+
+    def run_once(self):
+        """
+        Wait for files to change and run one scheduler round.
+        """
+        # Watching paths and not descriptors as files can change
+        # name, is_changed follows the path.
+        changed = self._watcher.wait(self._active)
+        self._active = self._scheduler.run(changed, self._handle_entries)
+
+        if (self._sources
+            and time.time() - self._last_discover >= self._discover_interval):
+            self.discover()
+            self._last_discover = time.time()
+
+        now = time.time()
+        if now - self._last_idle >= plog.WATCH_TIMEOUT:
+            self.flush_idle(now)
+            self._last_idle = now
+
+        if time.time() - self._last_stats >= self._stats_interval:
+            self.log_stats()
+            self._last_stats = time.time()
+
+    def flush_idle(self, now):
+        """
+        Pass on multi-line entries held back by parsers of files that
+        have not had data for a while.
+        """
+        for f_obj in self._files:
+            entries = f_obj.parser.flush_idle(now)
+            if entries:
+                self._handle_entries(f_obj, entries)
+
+    def _handle_entries(self, f_obj, entries):
+        """
+        Pass entries parsed from f_obj kept by its filter on to handle.
+        """
+        if f_obj.entry_filter is not None and entries:
+            entries = f_obj.entry_filter.apply(entries)
+        self._handle(f_obj, entries)
+
+    def is_idle(self):
+        """
+        Check if no file had data left, the next run_once blocks.
+        """
+        return not self._active
+
+    def discover(self, seek_end=False):
+        """
+        Update sources adding newly discovered files and removing
+        drained files that no longer match. New files are read from the
+        beginning unless seek_end is set.
+        """
+        for source in self._sources:
+            added, removed = source.update()
+            for path in added:
+                if (self._path_filter is not None
+                    and not self._path_filter(path)):
+                    continue
+                f_obj = source.create_file(path, seek_end)
+                logging.info('discovered file %s at %s' % (f_obj.name, path))
+                self._discovered[path] = f_obj
+                self._files.append(f_obj)
+                self._watcher.add(f_obj)
+                self._active.append(f_obj)
+            for path in removed:
+                f_obj = self._discovered.pop(path, None)
+                if f_obj is not None:
+                    self._retired.append(f_obj)
+
+        for f_obj in [f_obj for f_obj in self._retired
+                      if f_obj.get_backlog() == 0]:
+            logging.info('file %s at %s is gone' % (f_obj.name, f_obj.path))
+            self._handle_entries(f_obj, f_obj.parser.flush())
+            self._retired.remove(f_obj)
+            self._files.remove(f_obj)
+            self._watcher.remove(f_obj)
+            if f_obj in self._active:
+                self._active.remove(f_obj)
+            f_obj.close()
+
+    def log_stats(self):
+        """
+        Log per file read statistics, a growing backlog or exhausted
+        count shows the file does not get enough read budget.
+        """
+        for f_obj in self._files:
+            logging.info('file %s: backlog %d bytes, read %d bytes, '
+                         'budget exhausted %d rounds, chunk size %d'
+                         % (f_obj.name, f_obj.get_backlog(), f_obj.stats_read,
+                            f_obj.stats_exhausted, f_obj.chunk_size))
+            if f_obj.entry_filter is not None:
+                logging.info('file %s: dropped %d entries, sampled out %d'
+                             % (f_obj.name, f_obj.entry_filter.stats_dropped,
+                                f_obj.entry_filter.stats_sampled))
+
+    def close(self):
+        """
+        Pass on entries held back by the parsers, partial lines and
+        open multi-line entries, and release resources held by the
+        reader.
+        """
+        for f_obj in self._files:
+            entries = f_obj.parser.flush()
+            if entries:
+                self._handle_entries(f_obj, entries)
+        self._watcher.close()
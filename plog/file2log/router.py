@@ -0,0 +1,206 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Distribution of sources across several receivers.
+"""
+
+import bisect
+import logging
+import time
+import zlib
+import plog
+import plog.file2log.logger
+
+def get_logger(config):
+    """
+    Get logger for the configured receivers, a Router if more than
+    one receiver is configured.
+    """
+    receivers = plog.file2log.logger.get_receivers(config)
+    if len(receivers) == 1:
+        return plog.file2log.logger.Logger(config, receivers[0])
+    return Router(config, receivers)
+
+class Router(object):
+    """
+    Logger interface sending each file to one of several receivers
+    picked by consistent hashing on the source name and file path. All
+    messages of a file go to the same receiver, keeping their order,
+    files matched by a glob source are spread across receivers, and
+    adding or removing a receiver only moves the files of that
+    receiver.
+
+    Files of an unhealthy receiver are sent to the next healthy
+    receiver on the ring until it is healthy again. Only the current
+    batch is sent before a file moves, frames already spooled or
+    queued for reconnecting to the old receiver are sent when it
+    recovers, after newer entries went to the new receiver. Entries
+    of a file may thus reach the database out of order across a move.
+    """
+
+    def __init__(self, config, receivers, replicas=plog.RING_REPLICAS):
+        """
+        Initialize router for list of (host, port) receivers, each
+        placed replicas times on the hash ring.
+        """
+        limiter = plog.file2log.logger.get_limiter(config)
+        # List of loggers, one per receiver
+        self._loggers = [plog.file2log.logger.Logger(config, address, limiter)
+                         for address in receivers]
+        # Sending entries in the binary wire format
+        self._binary = plog.file2log.logger.is_binary(config)
+
+        # Sorted list of (hash, logger index) ring points
+        self._ring = []
+        for num, logger in enumerate(self._loggers):
+            for replica in xrange(replicas):
+                self._ring.append(
+                    (self._hash('%s-%d' % (logger.name, replica)), num))
+        self._ring.sort()
+        # Ring point hashes, for bisecting
+        self._points = [point for point, _ in self._ring]
+        # Map from (source, path) to list of loggers in ring order
+        self._preferences = {}
+        # Map from (source, path) to the logger it was last sent to
+        self._current = {}
+
+        # Number of times a file moved to another receiver
+        self.stats_moved = 0
+        # Seconds between statistics reports
+        self._stats_interval = config.get_int(
+            'file2log', plog.CFG_OPT_STATS_INTERVAL, plog.STATS_INTERVAL)
+        # Time of the last statistics report
+        self._last_stats = time.time()
+
+    @staticmethod
+    def _hash(value):
+        """
+        Get ring position of value.
+        """
+        return zlib.crc32(value) & 0xffffffff
+
+    def _get_preferences(self, key):
+        """
+        Get list of loggers for (source, path) key in ring order, the
+        first is the receiver owning the file.
+        """
+        preferences = self._preferences.get(key)
+        if preferences is not None:
+            return preferences
+
+        preferences = []
+        start = bisect.bisect(
+            self._points, self._hash('%s:%s' % (key[0] or '', key[1] or '')))
+        for pos in xrange(len(self._ring)):
+            num = self._ring[(start + pos) % len(self._ring)][1]
+            logger = self._loggers[num]
+            if logger not in preferences:
+                preferences.append(logger)
+                if len(preferences) == len(self._loggers):
+                    break
+        self._preferences[key] = preferences
+        return preferences
+
+    def _route(self, source, path):
+        """
+        Get logger for file path of source, the first healthy one in
+        ring order. If no receiver is healthy the owner is used.
+        """
+        key = (source, path)
+        preferences = self._get_preferences(key)
+        logger = preferences[0]
+        for candidate in preferences:
+            if candidate.is_healthy():
+                logger = candidate
+                break
+
+        current = self._current.get(key)
+        if current is not logger:
+            if current is not None:
+                logging.info('source %s file %s moved from %s to %s'
+                             % (source, path, current.name, logger.name))
+                self.stats_moved += 1
+                # Send what is batched for the file before switching,
+                # spooled and queued frames follow later, out of order.
+                current.flush()
+            self._current[key] = logger
+        return logger
+
+    def log(self, name, entries, source=None, path=None):
+        """
+        Write entries from source name, see Logger.log.
+        """
+        self.send(plog.file2log.logger.encode(name, entries, self._binary),
+                  source or name, path)
+
+    def send(self, messages, source=None, path=None):
+        """
+        Write encoded messages from file path of source to the
+        receiver of the file, see Logger.send.
+        """
+        self._route(source, path).send(messages, source)
+
+        if time.time() - self._last_stats >= self._stats_interval:
+            self.log_stats()
+            self._last_stats = time.time()
+
+    def flush(self):
+        """
+        Send the current batch of all receivers.
+        """
+        for logger in self._loggers:
+            logger.flush()
+
+    def is_sent(self):
+        """
+        Check if all receivers have sent their messages, see
+        Logger.is_sent.
+        """
+        for logger in self._loggers:
+            if not logger.is_sent():
+                return False
+        return True
+
+    def get_timeout(self):
+        """
+        Get seconds until a batch must be sent, None if no batch is
+        pending.
+        """
+        timeouts = [timeout for timeout in
+                    [logger.get_timeout() for logger in self._loggers]
+                    if timeout is not None]
+        if not timeouts:
+            return None
+        return min(timeouts)
+
+    def log_stats(self):
+        """
+        Log routing statistics, receivers report their own.
+        """
+        counts = dict([(logger, 0) for logger in self._loggers])
+        for logger in self._current.itervalues():
+            counts[logger] += 1
+        logging.info('router: %d file moves, files per receiver %s'
+                     % (self.stats_moved,
+                        ', '.join(['%s %d' % (logger.name, counts[logger])
+                                   for logger in self._loggers])))
+
+    def close(self):
+        """
+        Send pending frames and close all loggers.
+        """
+        for logger in self._loggers:
+            logger.close()
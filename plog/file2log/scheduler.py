@@ -0,0 +1,85 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Read scheduler sharing read bandwidth between files.
+"""
+
+import plog
+
+class Scheduler(object):
+    """
+    Deficit round robin scheduler, each round a file is given a byte
+    budget of quantum times its weight and is drained in adaptively
+    sized chunks until it reaches end of file or the budget is
+    used. Unused budget is kept while a file is backlogged so heavy
+    weighted files catch up without starving others.
+    """
+
+    def __init__(self, quantum=plog.READ_BUDGET):
+        """
+        Initialize scheduler giving files quantum bytes per round.
+        """
+        # Bytes given to a file with weight 1.0 each round
+        self._quantum = quantum
+
+    def run(self, files, handle):
+        """
+        Run one round over files, calling handle(f_obj, entries) with
+        the entries parsed from each chunk read. Returns list of files
+        still having data.
+        """
+        active = []
+
+        for f_obj in files:
+            # Re-open file if it has been replaced, the old file has
+            # been drained so flush what is left in the parser.
+            if f_obj.is_changed():
+                handle(f_obj, f_obj.parser.flush())
+                f_obj.reopen()
+            if not f_obj.has_data():
+                f_obj.deficit = 0
+                continue
+
+            f_obj.deficit += int(self._quantum * f_obj.weight)
+            while f_obj.deficit > 0 and f_obj.has_data():
+                chunk_size = min(f_obj.chunk_size, f_obj.deficit)
+                data = f_obj.read(chunk_size)
+                if not data:
+                    break
+
+                f_obj.deficit -= len(data)
+                f_obj.stats_read += len(data)
+                self._adapt_chunk_size(f_obj, chunk_size, len(data))
+
+                handle(f_obj, f_obj.parser.feed(data))
+
+            if f_obj.has_data():
+                f_obj.stats_exhausted += 1
+                active.append(f_obj)
+            else:
+                f_obj.deficit = 0
+
+        return active
+
+    def _adapt_chunk_size(self, f_obj, chunk_size, read_size):
+        """
+        Grow chunk size while reads fill up the chunk, shrink it when
+        reads return little data.
+        """
+        if read_size == chunk_size == f_obj.chunk_size:
+            f_obj.chunk_size = min(f_obj.chunk_size * 2, plog.READ_CHUNK_MAX)
+        elif read_size < f_obj.chunk_size / 4:
+            f_obj.chunk_size = max(f_obj.chunk_size / 2, plog.READ_MAX)
@@ -0,0 +1,107 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Sender thread decoupling network sends from reading and parsing.
+"""
+
+import threading
+import Queue
+import plog
+
+class Sender(threading.Thread):
+    """
+    Thread sending messages queued by the reader. The queue is
+    bounded, when the receiver is slow the reader blocks in put once
+    queue_max items are waiting instead of buffering without limit.
+    """
+
+    def __init__(self, logger, handle, checkpoints=None,
+                 queue_max=plog.SEND_QUEUE_MAX):
+        """
+        Initialize sender, queued lists of (source, path, messages,
+        checkpoint) items are passed to handle. The logger and
+        checkpoints are only used from the sender thread once started.
+        """
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+        # Logger flushed when the queue is empty
+        self._logger = logger
+        # Callback sending list of queued items
+        self._handle = handle
+        # Checkpoint store flushed once the logger has sent
+        self._checkpoints = checkpoints
+        # Queue of (source, path, messages, checkpoint) items, None
+        # stops
+        self._queue = Queue.Queue(queue_max)
+
+        # Number of times put blocked on a full queue
+        self.stats_blocked = 0
+
+    def put(self, item):
+        """
+        Queue (source, path, messages, checkpoint) item, blocks while
+        the queue is full. Returns False if the sender has stopped.
+        """
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except Queue.Full:
+            self.stats_blocked += 1
+
+        while self.is_alive():
+            try:
+                self._queue.put(item, True, plog.WATCH_TIMEOUT)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def run(self):
+        """
+        Sender main routine, sends queued items until None is queued.
+        """
+        running = True
+        while running:
+            timeout = self._logger.get_timeout()
+            if timeout is None:
+                timeout = plog.WATCH_TIMEOUT
+
+            items = []
+            try:
+                items.append(self._queue.get(True, timeout))
+                while len(items) < plog.SEND_QUEUE_MAX:
+                    items.append(self._queue.get_nowait())
+            except Queue.Empty:
+                pass
+
+            if None in items:
+                items = items[:items.index(None)]
+                running = False
+            if items:
+                self._handle(items)
+            else:
+                # Send pending batch before waiting for more data.
+                self._logger.flush()
+            if self._checkpoints is not None:
+                self._checkpoints.flush_sent(self._logger)
+
+    def stop(self):
+        """
+        Send queued items and stop the sender thread.
+        """
+        self.put(None)
+        self.join()
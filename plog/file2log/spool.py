@@ -0,0 +1,237 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Disk backed spool holding frames while the receiver is unreachable.
+"""
+
+import logging
+import os
+import time
+import plog
+import plog.wire
+
+# Suffix of spool segment files
+SEGMENT_SUFFIX = '.spool'
+
+class Spool(object):
+    """
+    First in first out queue of frames stored in segment files in a
+    directory. Frames are appended to the newest segment and read
+    sequentially from the oldest, segments are removed when read.
+
+    Frames read but not consumed when file2log stops are read again
+    after a restart, delivery is at least once.
+    """
+
+    def __init__(self, path, segment_size=plog.SPOOL_SEGMENT_SIZE,
+                 max_size=plog.SPOOL_MAX_SIZE, max_age=plog.SPOOL_MAX_AGE):
+        """
+        Initialize spool in directory path, picking up segments left
+        by a previous run. Oldest segments are dropped when the spool
+        grows beyond max_size bytes or segments get older than max_age
+        seconds.
+        """
+        # Directory holding segment files
+        self._path = path
+        # Size in bytes at which a new segment is started
+        self._segment_size = segment_size
+        # Maximum size in bytes of all segments
+        self._max_size = max_size
+        # Maximum age in seconds of segments
+        self._max_age = max_age
+
+        # List of [sequence, size] of segments, oldest first
+        self._segments = []
+        # Segment file being appended to
+        self._write_obj = None
+        # Segment file being read from
+        self._read_obj = None
+        # Read position in the oldest segment
+        self._read_pos = 0
+        # On disk sizes of frames returned by the last read
+        self._read_sizes = []
+
+        # Number of frames added
+        self.stats_spooled = 0
+        # Number of frames consumed
+        self.stats_replayed = 0
+        # Number of bytes dropped due to size and age limits
+        self.stats_dropped = 0
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        for name in os.listdir(path):
+            if name.endswith(SEGMENT_SUFFIX):
+                try:
+                    seq = int(name[:-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+                self._segments.append(
+                    [seq, os.path.getsize(self._get_path(seq))])
+        self._segments.sort()
+        if self._segments:
+            logging.info('spool %s has %d bytes in %d segments'
+                         % (path, self.get_depth(), len(self._segments)))
+
+    def _get_path(self, seq):
+        """
+        Get path to segment seq.
+        """
+        return os.path.join(self._path, '%020d%s' % (seq, SEGMENT_SUFFIX))
+
+    def get_depth(self):
+        """
+        Return number of bytes in the spool.
+        """
+        return sum([size for _, size in self._segments]) - self._read_pos
+
+    def get_segments(self):
+        """
+        Return number of segment files.
+        """
+        return len(self._segments)
+
+    def append(self, frames):
+        """
+        Append frames to the newest segment.
+        """
+        if not frames:
+            return
+
+        if (self._write_obj is None
+            or self._segments[-1][1] >= self._segment_size):
+            self._start_segment()
+
+        data = ''.join([plog.wire.encode_frame(frame) for frame in frames])
+        self._write_obj.write(data)
+        self._write_obj.flush()
+        self._segments[-1][1] += len(data)
+        self.stats_spooled += len(frames)
+
+        self._expire()
+
+    def _start_segment(self):
+        """
+        Close the current segment and start a new one.
+        """
+        if self._write_obj is not None:
+            self._write_obj.close()
+        if self._segments:
+            seq = self._segments[-1][0] + 1
+        else:
+            seq = 0
+        self._write_obj = open(self._get_path(seq), 'ab')
+        self._segments.append([seq, 0])
+
+    def read(self, max_size):
+        """
+        Read frames from the oldest segment, at least one frame and at
+        most max_size bytes if possible. Frames stay in the spool until
+        consumed.
+        """
+        self._read_sizes = []
+        while self._segments:
+            if self._read_obj is None:
+                self._read_obj = open(self._get_path(self._segments[0][0]),
+                                      'rb')
+
+            size = max_size
+            while True:
+                self._read_obj.seek(self._read_pos)
+                data = self._read_obj.read(size)
+                try:
+                    frames = plog.wire.decode_frames(data)[0]
+                except ValueError, exc:
+                    logging.error('corrupt spool segment %d: %s'
+                                  % (self._segments[0][0], exc))
+                    self.stats_dropped += (
+                        self._segments[0][1] - self._read_pos)
+                    frames = []
+                    data = ''
+                if frames or len(data) < size:
+                    break
+                # Frame larger than max_size, read it whole.
+                size *= 2
+
+            if frames:
+                self._read_sizes = [len(plog.wire.encode_frame(frame))
+                                    for frame in frames]
+                return frames
+
+            if len(self._segments) == 1 and data:
+                # Partial frame at the end of the newest segment.
+                return []
+            self._remove_oldest()
+        return []
+
+    def consume(self, count):
+        """
+        Remove the first count frames returned by the last read.
+        """
+        self._read_pos += sum(self._read_sizes[:count])
+        self._read_sizes = self._read_sizes[count:]
+        self.stats_replayed += count
+        if self._segments and self._read_pos >= self._segments[0][1]:
+            self._remove_oldest()
+
+    def _remove_oldest(self):
+        """
+        Remove the oldest segment.
+        """
+        seq = self._segments.pop(0)[0]
+        if self._read_obj is not None:
+            self._read_obj.close()
+            self._read_obj = None
+        if not self._segments and self._write_obj is not None:
+            self._write_obj.close()
+            self._write_obj = None
+        self._read_pos = 0
+        self._read_sizes = []
+        try:
+            os.unlink(self._get_path(seq))
+        except OSError, exc:
+            logging.error('failed to remove spool segment %d: %s'
+                          % (seq, exc))
+
+    def _expire(self):
+        """
+        Drop oldest segments beyond the size and age limits, the
+        segment being written is never dropped.
+        """
+        oldest = time.time() - self._max_age
+        while len(self._segments) > 1:
+            seq, size = self._segments[0]
+            if self.get_depth() <= self._max_size:
+                try:
+                    if os.path.getmtime(self._get_path(seq)) >= oldest:
+                        break
+                except OSError:
+                    pass
+            logging.warning('dropping spool segment %d with %d bytes'
+                            % (seq, size - self._read_pos))
+            self.stats_dropped += size - self._read_pos
+            self._remove_oldest()
+
+    def close(self):
+        """
+        Close segment files, remaining frames are kept on disk.
+        """
+        if self._write_obj is not None:
+            self._write_obj.close()
+            self._write_obj = None
+        if self._read_obj is not None:
+            self._read_obj.close()
+            self._read_obj = None
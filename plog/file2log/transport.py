@@ -0,0 +1,221 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+TCP syslog transport using RFC 6587 octet counted framing.
+"""
+
+import errno
+import logging
+import os
+import random
+import select
+import socket
+import time
+import plog
+
+class TcpClient(object):
+    """
+    Persistent TCP connection to a syslog server, frames are written
+    in large writes and kept while the connection is down. The
+    connection is re-established automatically with exponential back
+    off, connects do not block the caller.
+    """
+
+    def __init__(self, address, buffer_max=plog.TCP_BUFFER_MAX):
+        """
+        Initialize client for address, at most buffer_max bytes are
+        kept while disconnected.
+        """
+        # (host, port) of server
+        self.address = address
+        # Maximum bytes of unsent frames
+        self._buffer_max = buffer_max
+
+        # Connected socket, None if disconnected
+        self._socket = None
+        # Socket with a connect in progress, None if not connecting
+        self._connecting = None
+        # Time the connect in progress started
+        self._connect_start = 0.0
+        # Frames not yet sent
+        self._frames = []
+        # Size of frames not yet sent
+        self._frames_len = 0
+        # Time of next connect attempt
+        self._next_connect = 0.0
+        # Current reconnect back off in seconds
+        self._backoff = plog.TCP_RECONNECT_MIN
+
+        # Number of frames dropped due to a full buffer
+        self.stats_dropped = 0
+        # Number of connects
+        self.stats_connects = 0
+
+    def is_connected(self):
+        """
+        Check if connected to the server.
+        """
+        return self._socket is not None
+
+    def is_healthy(self):
+        """
+        Check if frames can be sent, connects if not connected and
+        the reconnect back off has passed and sends frames kept while
+        disconnected.
+        """
+        if self._socket is None and not self._connect():
+            return False
+        return self.flush()
+
+    def get_pending(self):
+        """
+        Return number of bytes not yet sent.
+        """
+        return self._frames_len
+
+    def send_frames(self, frames):
+        """
+        Send frames, frames are kept if the server is not reachable.
+        Returns True if all frames pending have been sent.
+        """
+        self._frames.extend(frames)
+        self._frames_len += sum([len(frame) for frame in frames])
+        self._limit_buffer()
+        return self.flush()
+
+    def flush(self):
+        """
+        Write pending frames, returns True if nothing is left pending.
+        """
+        if not self._frames:
+            return True
+        if self._socket is None and not self._connect():
+            return False
+
+        data = ''.join(self._frames)
+        sent = 0
+        try:
+            while sent < len(data):
+                sent += self._socket.send(buffer(data, sent))
+        except socket.error, exc:
+            logging.warning('lost connection to %s:%d: %s'
+                            % (self.address[0], self.address[1], exc))
+            self._drop_sent(sent)
+            self._disconnect()
+            return False
+
+        self._frames = []
+        self._frames_len = 0
+        return True
+
+    def take_pending(self):
+        """
+        Return and forget frames not yet sent.
+        """
+        frames = self._frames
+        self._frames = []
+        self._frames_len = 0
+        return frames
+
+    def _connect(self):
+        """
+        Start or complete a non-blocking connect to the server unless
+        waiting for back off, returns True once connected.
+        """
+        now = time.time()
+        if self._connecting is None:
+            if now < self._next_connect:
+                return False
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(0)
+            try:
+                err = sock.connect_ex(self.address)
+            except socket.error, exc:
+                return self._connect_failed(sock, now, exc)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                return self._connect_failed(sock, now, os.strerror(err))
+            self._connecting = sock
+            self._connect_start = now
+
+        sock = self._connecting
+        if select.select([], [sock], [], 0)[1]:
+            err = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                return self._connect_failed(sock, now, os.strerror(err))
+        elif now - self._connect_start >= plog.TCP_TIMEOUT:
+            return self._connect_failed(sock, now, 'timed out')
+        else:
+            return False
+
+        self._connecting = None
+        sock.settimeout(plog.TCP_TIMEOUT)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._socket = sock
+        self._backoff = plog.TCP_RECONNECT_MIN
+        self.stats_connects += 1
+        return True
+
+    def _connect_failed(self, sock, now, reason):
+        """
+        Close socket of a failed connect and schedule the next attempt,
+        returns False.
+        """
+        sock.close()
+        self._connecting = None
+        logging.warning('failed to connect to %s:%d: %s, retry in %.1fs'
+                        % (self.address[0], self.address[1], reason,
+                           self._backoff))
+        # Spread reconnects of many senders after a receiver failover.
+        self._next_connect = now + self._backoff * random.uniform(0.5, 1.0)
+        self._backoff = min(self._backoff * 2, plog.TCP_RECONNECT_MAX)
+        return False
+
+    def _disconnect(self):
+        """
+        Close connection, reconnect is attempted after back off.
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        if self._connecting is not None:
+            self._connecting.close()
+            self._connecting = None
+        self._next_connect = time.time() + self._backoff
+
+    def _drop_sent(self, sent):
+        """
+        Drop frames completely sent, a partially sent frame is sent
+        again in full on the next connection.
+        """
+        while self._frames and len(self._frames[0]) <= sent:
+            frame = self._frames.pop(0)
+            sent -= len(frame)
+            self._frames_len -= len(frame)
+
+    def _limit_buffer(self):
+        """
+        Drop oldest frames while more than buffer_max bytes pending.
+        """
+        while self._frames_len > self._buffer_max and len(self._frames) > 1:
+            self._frames_len -= len(self._frames.pop(0))
+            self.stats_dropped += 1
+
+    def close(self):
+        """
+        Flush pending frames and close connection.
+        """
+        self.flush()
+        self._disconnect()
@@ -0,0 +1,298 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+File watchers used by file2log to find out which files should be read.
+"""
+
+import errno
+import logging
+import os
+import select
+import struct
+import time
+import plog
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+# Events watched for on directories holding watched files
+IN_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO
+                 | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+                 | IN_ONLYDIR)
+
+# Size of the inotify_event header, wd, mask, cookie and len
+IN_EVENT_HEADER = struct.Struct('iIII')
+# Maximum amount of event data read in one go
+IN_READ_MAX = 65536
+
+class Watcher(object):
+    """
+    Base class for watchers, keeps track of the watched files and
+    returns the files that are worth reading.
+    """
+
+    def __init__(self, files):
+        """
+        Initialize watcher watching files.
+        """
+        # List of watched files
+        self._files = []
+
+        for f_obj in files:
+            self.add(f_obj)
+
+    def add(self, f_obj):
+        """
+        Add file to the set of watched files.
+        """
+        self._files.append(f_obj)
+
+    def remove(self, f_obj):
+        """
+        Remove file from the set of watched files.
+        """
+        self._files.remove(f_obj)
+
+    def wait(self, active):
+        """
+        Wait for files to change, returns list of files that should
+        be checked. active is a list of files that still have unread
+        data, if not empty the watcher must not block.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Release resources held by the watcher.
+        """
+
+class PollWatcher(Watcher):
+    """
+    Watcher sleeping plog.READ_INTERVAL between sweeps and returning
+    all files, used where inotify is not available.
+    """
+
+    def wait(self, active):
+        """
+        Sleep if no file is active and return all files.
+        """
+        if not active:
+            time.sleep(plog.READ_INTERVAL)
+        return self._files
+
+class InotifyWatcher(Watcher):
+    """
+    Watcher using inotify on the directories of the watched files,
+    sleeps until a file in one of the directories changes. Watching
+    directories instead of files makes renames and creates visible
+    which is required to follow log rotation.
+    """
+
+    def __init__(self, files, timeout=plog.WATCH_TIMEOUT):
+        """
+        Initialize inotify instance and watch directories of files.
+        """
+        # Lazy import, ctypes is only required when using inotify
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                 use_errno=True)
+        self._get_errno = ctypes.get_errno
+
+        # inotify file descriptor
+        self._fd = self._libc.inotify_init()
+        if self._fd == -1:
+            raise OSError(self._get_errno(), 'inotify_init failed')
+
+        # Maximum time to wait for events, all files are returned
+        # when it expires to catch up with missed events.
+        self._timeout = timeout
+        # Map from directory path to watch descriptor.
+        self._dir_to_wd = {}
+        # Map from watch descriptor to dict of file name to files.
+        self._wd_to_files = {}
+
+        Watcher.__init__(self, files)
+
+    def add(self, f_obj):
+        """
+        Add file watching its directory.
+        """
+        Watcher.add(self, f_obj)
+        self._watch(f_obj)
+
+    def remove(self, f_obj):
+        """
+        Remove file, removing the directory watch if it was the last
+        file in the directory.
+        """
+        Watcher.remove(self, f_obj)
+
+        dir_path, name = os.path.split(os.path.abspath(f_obj.path))
+        wd = self._dir_to_wd.get(dir_path)
+        if wd is None:
+            return
+
+        names = self._wd_to_files[wd]
+        if f_obj in names.get(name, []):
+            names[name].remove(f_obj)
+            if not names[name]:
+                del names[name]
+        if not names:
+            self._libc.inotify_rm_watch(self._fd, wd)
+            del self._wd_to_files[wd]
+            del self._dir_to_wd[dir_path]
+
+    def _watch(self, f_obj):
+        """
+        Add watch for the directory of f_obj, return False if the
+        directory could not be watched.
+        """
+        dir_path, name = os.path.split(os.path.abspath(f_obj.path))
+
+        wd = self._dir_to_wd.get(dir_path)
+        if wd is None:
+            wd = self._libc.inotify_add_watch(self._fd, dir_path,
+                                              IN_WATCH_MASK)
+            if wd == -1:
+                logging.debug('failed to watch %s: %s'
+                              % (dir_path,
+                                 os.strerror(self._get_errno())))
+                return False
+            self._dir_to_wd[dir_path] = wd
+            self._wd_to_files.setdefault(wd, {})
+
+        names = self._wd_to_files[wd]
+        if f_obj not in names.get(name, []):
+            names.setdefault(name, []).append(f_obj)
+        return True
+
+    def wait(self, active):
+        """
+        Wait for inotify events, returns active files and files
+        changed according to the received events. All files are
+        returned if the timeout expires or events have been lost.
+        """
+        if active:
+            timeout = 0
+        else:
+            timeout = self._timeout
+
+        try:
+            readable = select.select([self._fd], [], [], timeout)[0]
+        except select.error, exc:
+            if exc[0] != errno.EINTR:
+                raise
+            readable = []
+
+        if not readable:
+            if active:
+                return active
+            # Timeout, re-try watching directories that did not exist
+            # and let the caller look at all files.
+            for f_obj in self._files:
+                self._watch(f_obj)
+            return self._files
+
+        changed = self._read_events()
+        if changed is None:
+            return self._files
+
+        for f_obj in active:
+            if f_obj not in changed:
+                changed.append(f_obj)
+        return changed
+
+    def _read_events(self):
+        """
+        Read pending events, return list of changed files or None if
+        the event queue has overflowed.
+        """
+        try:
+            data = os.read(self._fd, IN_READ_MAX)
+        except OSError, exc:
+            if exc.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        changed = []
+        pos = 0
+        while pos + IN_EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_len = IN_EVENT_HEADER.unpack_from(data, pos)
+            pos += IN_EVENT_HEADER.size
+            name = data[pos:pos + name_len].rstrip('\0')
+            pos += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                logging.warning('inotify event queue overflow')
+                return None
+            elif mask & IN_IGNORED:
+                # Directory was removed, re-added on timeout.
+                self._drop_wd(wd)
+                continue
+
+            for f_obj in self._wd_to_files.get(wd, {}).get(name, []):
+                if f_obj not in changed:
+                    changed.append(f_obj)
+
+        return changed
+
+    def _drop_wd(self, wd):
+        """
+        Forget about watch descriptor removed by the kernel.
+        """
+        self._wd_to_files.pop(wd, None)
+        for dir_path, dir_wd in self._dir_to_wd.items():
+            if dir_wd == wd:
+                del self._dir_to_wd[dir_path]
+
+    def close(self):
+        """
+        Close inotify file descriptor.
+        """
+        if self._fd != -1:
+            os.close(self._fd)
+            self._fd = -1
+
+def get_watcher(name, files):
+    """
+    Get watcher from name, auto selects inotify if available and
+    falls back to polling.
+    """
+    name = name.lower()
+    if name in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(files)
+        except (AttributeError, OSError, TypeError), exc:
+            if name == 'inotify':
+                logging.warning('inotify not available (%s), falling back '
+                                'to polling' % (exc, ))
+            return PollWatcher(files)
+    elif name == 'poll':
+        return PollWatcher(files)
+    else:
+        raise ValueError('unknown watcher named %s' % (name, ))
@@ -18,8 +18,256 @@ Log file parsing routines.
 """
 
 import logging
+import re
+import time
 import cStringIO
+import plog
 import plog.entry
+import plog.timestamp
+
+# Map from entry parser option to class of entries created by parsers
+# configured from options
+ENTRY_CLASSES = {
+    'appserver': plog.entry.AppserverEntry,
+    'request': plog.entry.RequestEntry,
+    'plain': plog.entry.Entry
+    }
+
+# Map from duration_unit parser option to (multiplier, divisor) giving
+# milliseconds
+DURATION_UNITS = {'s': (1000, 1), 'ms': (1, 1), 'us': (1, 1000)}
+
+def split_lines(buf, pos, end):
+    """
+    Return iterator over lines of buf from pos up to end, including
+    the newline. The last line is not terminated if end is not after
+    a newline.
+    """
+    find = buf.find
+    while pos < end:
+        line_end = find('\n', pos, end) + 1
+        if line_end == 0:
+            line_end = end
+        yield buf[pos:line_end]
+        pos = line_end
+
+class LineFramer(object):
+    """
+    Splits data into complete lines, keeping a trailing partial line
+    until the rest of it is fed. Complete lines are sliced directly
+    from the fed data, only the partial line is copied.
+    """
+
+    def __init__(self, max_size=plog.READ_LOG_MAX):
+        """
+        Initialize framer, partial lines longer than max_size are
+        returned as a line of their own.
+        """
+        # Trailing data not yet terminated by a newline.
+        self._partial = bytearray()
+        # Maximum size of a partial line.
+        self._max_size = max_size
+
+    def get_pending(self):
+        """
+        Return number of bytes buffered in the partial line.
+        """
+        return len(self._partial)
+
+    def chunk(self, data):
+        """
+        Return (buf, end) where buf up to end holds the complete lines
+        found in the partial line and data.
+        """
+        end = data.rfind('\n') + 1
+        if end == 0:
+            self._partial += data
+            if len(self._partial) >= self._max_size:
+                line = self.flush()
+                return line, len(line)
+            return '', 0
+
+        if self._partial:
+            self._partial += memoryview(data)[:end]
+            buf = str(self._partial)
+            buf_end = len(buf)
+            del self._partial[:]
+        else:
+            buf = data
+            buf_end = end
+        if end < len(data):
+            self._partial += memoryview(data)[end:]
+        return buf, buf_end
+
+    def lines(self, data):
+        """
+        Return iterator over complete lines, including the newline,
+        found in the partial line and data.
+        """
+        buf, end = self.chunk(data)
+        return split_lines(buf, 0, end)
+
+    def flush(self):
+        """
+        Return and clear the partial line.
+        """
+        line = str(self._partial)
+        del self._partial[:]
+        return line
+
+class TimestampExtractor(object):
+    """
+    Finds and parses timestamps in log lines. The expression and
+    format are either configured or detected by sampling the first
+    lines of the file, the format matching most sampled lines is kept
+    for the rest of the file. Lines are never tried against formats
+    other than the chosen one, so files without timestamps only cost
+    the sampling.
+    """
+
+    # List of (expression, format) tried when detecting, the
+    # expression captures the timestamp in group 1
+    FORMATS = [
+        # 2009-05-15 00:00:00, log4j and plog.LOG_TIME_FORMAT
+        ('(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)', '%Y-%m-%d %H:%M:%S'),
+        # 2009-05-15T00:00:00, ISO 8601
+        ('(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)', '%Y-%m-%dT%H:%M:%S'),
+        # May 15, 2009 12:00:00 AM, java.util.logging SimpleFormatter
+        ('([A-Z][a-z]{2} \d\d?, \d{4} \d\d?:\d\d:\d\d [AP]M)',
+         '%b %d, %Y %I:%M:%S %p'),
+        # 15-May-2009 00:00:00, Tomcat OneLineFormatter
+        ('(\d\d-[A-Z][a-z]{2}-\d{4} \d\d:\d\d:\d\d)',
+         '%d-%b-%Y %H:%M:%S'),
+        # 15/May/2009:00:00:00, Apache common log format
+        ('(\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:\d\d)',
+         '%d/%b/%Y:%H:%M:%S'),
+        # Fri May 15 00:00:00 2009, Apache error log
+        ('([A-Z][a-z]{2} [A-Z][a-z]{2} \d\d \d\d:\d\d:\d\d \d{4})',
+         '%a %b %d %H:%M:%S %Y')
+        ]
+
+    def __init__(self, pattern=None, fmt=None,
+                 sample_lines=plog.TIMESTAMP_DETECT_LINES):
+        """
+        Initialize extractor for timestamps captured by group 1 of
+        pattern in format fmt. Without pattern the known formats, or
+        only those in format fmt if given, are detected from the first
+        sample_lines lines. Raises ValueError on invalid pattern or an
+        unknown fmt without pattern.
+        """
+        # Candidate (compiled expression, format) while detecting
+        self._candidates = []
+        # Expression of chosen format, None if not known
+        self._regex = None
+        # Chosen format
+        self._format = None
+        # Number of lines left to sample, 0 when done detecting
+        self._sample_left = 0
+        # Last (string, timestamp) found by search
+        self._last = (None, None)
+
+        if pattern is not None:
+            if fmt is None:
+                raise ValueError('timestamp expression %s without format'
+                                 % (pattern, ))
+            try:
+                self._regex = re.compile(pattern)
+            except re.error, exc:
+                raise ValueError('invalid timestamp expression %s: %s'
+                                 % (pattern, exc))
+            if self._regex.groups < 1:
+                raise ValueError('timestamp expression %s has no group'
+                                 % (pattern, ))
+            self._format = fmt
+            return
+
+        self._candidates = [(re.compile(candidate_pattern), candidate_fmt)
+                            for candidate_pattern, candidate_fmt
+                            in TimestampExtractor.FORMATS
+                            if fmt is None or candidate_fmt == fmt]
+        if not self._candidates:
+            raise ValueError('no known timestamp expression for format %s'
+                             % (fmt, ))
+        self._sample_left = sample_lines
+
+    @classmethod
+    def from_options(cls, options):
+        """
+        Create extractor from the timestamp and timestamp_format
+        parser options.
+        """
+        return cls(options.get('timestamp'), options.get('timestamp_format'))
+
+    def get_format(self):
+        """
+        Return chosen format, None if not known.
+        """
+        return self._format
+
+    def get_pattern(self):
+        """
+        Return expression of chosen format, None if not known.
+        """
+        if self._regex is None:
+            return None
+        return self._regex.pattern
+
+    def is_detecting(self):
+        """
+        Check if the format is still being detected.
+        """
+        return self._sample_left > 0
+
+    def sample(self, buf, end):
+        """
+        Sample lines of buf up to end for detecting the format, the
+        format matching most lines is chosen once any line matched.
+        Detection gives up after sample_lines lines without a match.
+        """
+        votes = [0] * len(self._candidates)
+        for line in split_lines(buf, 0, end):
+            if self._sample_left <= 0:
+                break
+            self._sample_left -= 1
+            for index, (regex, fmt) in enumerate(self._candidates):
+                match = regex.search(line)
+                if (match is not None
+                    and self._parse(fmt, match.group(1)) is not None):
+                    votes[index] += 1
+
+        if max(votes) > 0:
+            regex, fmt = self._candidates[votes.index(max(votes))]
+            self._regex = regex
+            self._format = fmt
+            self._sample_left = 0
+        if self._sample_left <= 0:
+            self._candidates = []
+
+    def search(self, text):
+        """
+        Return timestamp found anywhere in text, None if not found.
+        """
+        if self._regex is None:
+            return None
+        match = self._regex.search(text)
+        if match is None:
+            return None
+        value = match.group(1)
+        if value == self._last[0]:
+            return self._last[1]
+        timestamp = self._parse(self._format, value)
+        self._last = (value, timestamp)
+        return timestamp
+
+    def _parse(self, fmt, value):
+        """
+        Parse timestamp string value, None if value is not a valid
+        timestamp.
+        """
+        try:
+            return plog.timestamp.parse(value, fmt)
+        except ValueError:
+            return None
 
 class Parser(object):
     """
@@ -30,33 +278,68 @@ class Parser(object):
 
     def __init__(self, options):
         """
-        Initialize parser setting up a write buffer.
+        Initialize parser setting up the line framer.
         """
         assert isinstance(options, dict)
 
-        # Write buffer used when feeding the parser with data.
-        self.buf = cStringIO.StringIO()
+        # Line framer splitting fed data into lines.
+        self.framer = LineFramer()
         # Buffer for storing partially parsed log entries
         self.log_buf = cStringIO.StringIO()
+        # Timestamp extractor, None if the parser finds timestamps on
+        # its own
+        self.timestamps = None
 
     def feed(self, data):
         """
-        Feed parser with data, return a list of parsed entries.
+        Feed parser with data, return a list of parsed entries. A line
+        is not parsed until it is complete.
+        """
+        buf, end = self.framer.chunk(data)
+        if not end:
+            return []
+        if self.timestamps is not None and self.timestamps.is_detecting():
+            self.timestamps.sample(buf, end)
+        return self.parse_chunk(buf, end)
+
+    def get_pending(self):
+        """
+        Return number of fed bytes not yet parsed.
         """
-        self.buf.write(data)
-        self.buf.seek(0)
+        return self.framer.get_pending()
 
-        return self.parse_buf()
+    def discard_pending(self):
+        """
+        Drop the partial line pending in the parser, the rest of it is
+        gone as the file has been truncated.
+        """
+        self.framer.flush()
 
-    def parse_buf(self):
+    def flush(self):
         """
-        Parse content of the buffer and return a list of parsed entries.
+        Parse data pending in the parser as the end of the input has
+        been reached, return list of parsed entries.
+        """
+        if not self.framer.get_pending():
+            return []
+        line = self.framer.flush()
+        return self.parse_chunk(line, len(line))
+
+    def parse_chunk(self, buf, end):
+        """
+        Parse lines of buf up to end and return a list of parsed
+        entries. Parsers matching many lines with a single expression
+        override this to avoid the per line overhead of parse_buf.
+        """
+        return self.parse_buf(split_lines(buf, 0, end))
+
+    def parse_buf(self, lines):
+        """
+        Parse lines and return a list of parsed entries.
         """
         entries = []
 
-        # Read buffer line by line, remember last position entry was
-        # successfully parsed at.
-        for line in self.buf:
+        for line in lines:
             try:
                 entry = self.parse_line(line)
                 if entry is not None:
@@ -65,12 +348,16 @@ class Parser(object):
                 # FIXME: Add parser name here
                 logging.debug('failed parsing line: %s' % (line, ))
 
-        # Truncate buffer.
-        self.buf.reset()
-        self.buf.truncate()
-
         return entries
 
+    def flush_idle(self, now):
+        """
+        Return list of entries held back waiting for more lines if no
+        data has been fed for a while, parsers without multi-line
+        entries never hold entries back.
+        """
+        return []
+
     def parse_line(self, line):
         """
         Parse single line of data, this should be overridden by
@@ -79,17 +366,318 @@ class Parser(object):
         """
         raise NotImplementedError()
 
+class MultilineAssembler(object):
+    """
+    Assembles multi-line log events from lines. An event begins with a
+    line matching start and ends before the next line matching start,
+    with a line matching end or with a line not matching continuation.
+    Lines outside events are dropped. Events are capped at max_size
+    bytes, lines past the cap are dropped.
+
+    Lines are sliced from the fed data once and joined once per event,
+    no buffer is grown while an event is assembled.
+    """
+
+    def __init__(self, start, end=None, continuation=None,
+                 max_size=plog.MULTILINE_MAX_SIZE):
+        """
+        Initialize assembler with compiled start, end and continuation
+        regular expressions searched in each line, end and
+        continuation are optional.
+        """
+        # Expression of first lines
+        self._start = start
+        # Expression of last lines, None if events end at next start
+        self._end = end
+        # Expression of continuation lines, None if any line continues
+        self._continuation = continuation
+        # Maximum event size
+        self._max_size = max_size
+
+        # Lines of the open event, None if no event is open
+        self._lines = None
+        # Size of lines kept
+        self._size = 0
+        # Size of all lines fed to the open event, including dropped
+        self._pending = 0
+        # True if the open event has been truncated
+        self._truncated = False
+
+        # Number of events truncated
+        self.stats_truncated = 0
+
+    def is_open(self):
+        """
+        Check if an event is being assembled.
+        """
+        return self._lines is not None
+
+    def get_pending(self):
+        """
+        Return number of bytes fed to the open event.
+        """
+        return self._pending
+
+    def set_start(self, start):
+        """
+        Set compiled expression of first lines.
+        """
+        self._start = start
+
+    def add(self, buf, pos, end, events):
+        """
+        Add lines of buf from pos up to end, appending events completed
+        by the lines to events.
+        """
+        start_search = self._start.search
+        end_search = self._end is not None and self._end.search
+        continuation_search = (self._continuation is not None
+                               and self._continuation.search)
+        find = buf.find
+        while pos < end:
+            line_end = find('\n', pos, end) + 1
+            if line_end == 0:
+                line_end = end
+            line = buf[pos:line_end]
+            pos = line_end
+
+            if start_search(line) is not None:
+                if self._lines is not None:
+                    events.append(self.close())
+                self._open(line)
+            elif self._lines is None:
+                continue
+            elif (continuation_search
+                  and continuation_search(line) is None):
+                events.append(self.close())
+                continue
+            else:
+                self._pending += len(line)
+                if self._size + len(line) <= self._max_size:
+                    self._lines.append(line)
+                    self._size += len(line)
+                else:
+                    self._truncate(line)
+
+            if end_search and end_search(line) is not None:
+                events.append(self.close())
+
+    def _truncate(self, line):
+        """
+        Add the head of line fitting in the open event.
+        """
+        room = self._max_size - self._size
+        if room > 0:
+            self._lines.append(line[:room])
+            self._size = self._max_size
+        if not self._truncated:
+            self._truncated = True
+            self.stats_truncated += 1
+
+    def _open(self, line):
+        """
+        Open event starting with line.
+        """
+        self._lines = [line[:self._max_size]]
+        self._size = len(self._lines[0])
+        self._pending = len(line)
+        self._truncated = self._size < len(line)
+        if self._truncated:
+            self.stats_truncated += 1
+
+    def peek(self):
+        """
+        Return the open event without closing it, None if no event is
+        open.
+        """
+        if self._lines is None:
+            return None
+        return ''.join(self._lines)
+
+    def close(self):
+        """
+        Close and return the open event, None if no event is open.
+        """
+        if self._lines is None:
+            return None
+        event = ''.join(self._lines)
+        self._lines = None
+        self._size = 0
+        self._pending = 0
+        return event
+
+class MultilineParser(Parser):
+    """
+    Base class for parsers of multi-line entries assembled with a
+    MultilineAssembler. Sub-classes set START, END and CONTINUATION
+    and implement _create_entry for assembled events.
+
+    The start, end and continuation parser options override the
+    expressions, max_size caps the event size and idle_timeout sets the
+    seconds an event waits for more lines before it is completed
+    without seeing the start of the next event.
+    """
+
+    # Expression of first lines of entries
+    START = None
+    # Expression of last lines of entries, None if entries end at the
+    # start of the next
+    END = None
+    # Expression of continuation lines, None if any line continues
+    CONTINUATION = None
+    # Expression searched in events open for idle_timeout, they are
+    # only completed if it is found. None completes any idle event.
+    IDLE_END = None
+
+    def __init__(self, options):
+        """
+        Initialize parser and assembler from options.
+        """
+        Parser.__init__(self, options)
+
+        expressions = []
+        for name, default in (('start', self.START), ('end', self.END),
+                              ('continuation', self.CONTINUATION)):
+            pattern = options.get(name)
+            if pattern is None:
+                expressions.append(default)
+                continue
+            try:
+                expressions.append(re.compile(pattern))
+            except re.error, exc:
+                raise ValueError('invalid %s expression %s: %s'
+                                 % (name, pattern, exc))
+
+        # Assembler of multi-line events
+        self.assembler = MultilineAssembler(
+            expressions[0], expressions[1], expressions[2],
+            int(options.get('max_size', plog.MULTILINE_MAX_SIZE)))
+        # Seconds an open event waits for more lines
+        self._idle_timeout = float(
+            options.get('idle_timeout', plog.MULTILINE_IDLE_TIMEOUT))
+        # Time data was last fed
+        self._last_feed = time.time()
+        # Time data was last fed when the open event was found not
+        # ready for completing when idle
+        self._idle_checked = None
+
+    def feed(self, data):
+        """
+        Feed parser with data, see Parser.feed.
+        """
+        self._last_feed = time.time()
+        return Parser.feed(self, data)
+
+    def get_pending(self):
+        """
+        Return number of fed bytes not yet in a parsed entry, including
+        the open event.
+        """
+        return Parser.get_pending(self) + self.assembler.get_pending()
+
+    def flush(self):
+        """
+        Parse pending data and complete the open event as the end of
+        the input has been reached.
+        """
+        entries = Parser.flush(self)
+        self._add_entries(entries, (self.assembler.close(), ))
+        return entries
+
+    def flush_idle(self, now):
+        """
+        Complete the open event if no data has been fed for
+        idle_timeout seconds and it matches IDLE_END.
+        """
+        if (not self.assembler.is_open()
+            or now - self._last_feed < self._idle_timeout
+            or self._idle_checked == self._last_feed):
+            return []
+        if (self.IDLE_END is not None
+            and self.IDLE_END.search(self.assembler.peek()) is None):
+            # Still in progress, checked again once data is fed.
+            self._idle_checked = self._last_feed
+            return []
+        entries = []
+        self._add_entries(entries, (self.assembler.close(), ))
+        return entries
+
+    def parse_chunk(self, buf, end):
+        """
+        Assemble lines of buf up to end into events and return list of
+        parsed entries.
+        """
+        events = []
+        self.assembler.add(buf, 0, end, events)
+        entries = []
+        self._add_entries(entries, events)
+        return entries
+
+    def parse_buf(self, lines):
+        """
+        Assemble lines into events and return list of parsed entries.
+        """
+        events = []
+        for line in lines:
+            self.assembler.add(line, 0, len(line), events)
+        entries = []
+        self._add_entries(entries, events)
+        return entries
+
+    def _add_entries(self, entries, events):
+        """
+        Create entries from events adding them to entries.
+        """
+        for event in events:
+            if not event:
+                continue
+            try:
+                entry = self._create_entry(event)
+                if entry is not None:
+                    entries.append(entry)
+            except:
+                # FIXME: Add parser name here
+                logging.debug('failed parsing entry: %s' % (event, ))
+
+    def _create_entry(self, msg):
+        """
+        Create entry from assembled event msg, returns None if msg is
+        not a valid entry.
+        """
+        raise NotImplementedError()
+
 class PlainParser(Parser):
     """
     Plain text parser, does nothing but returning one log entry per
     line of text.
     """
 
+    # Regular expression matching lines, including the newline
+    RE_LINE = re.compile('[^\n]*\n|[^\n]+')
+
+    def __init__(self, options):
+        """
+        Initialize parser and timestamp extractor from options.
+        """
+        Parser.__init__(self, options)
+        self.timestamps = TimestampExtractor.from_options(options)
+
     def parse_line(self, line):
         """
         Parse line, return single log entry.
         """
-        return plog.entry.Entry(line)
+        return plog.entry.Entry(line, None, self.timestamps.search(line))
+
+    def parse_chunk(self, buf, end):
+        """
+        Parse lines of buf up to end, one entry per line.
+        """
+        entry_class = plog.entry.Entry
+        lines = PlainParser.RE_LINE.findall(buf, 0, end)
+        if self.timestamps.get_format() is None:
+            return [entry_class(line) for line in lines]
+        search = self.timestamps.search
+        return [entry_class(line, None, search(line)) for line in lines]
 
 def get_parser(name, options):
     """
@@ -109,5 +697,11 @@ def get_parser(name, options):
     elif name.lower() == 'rails':
         import plog.file_parsers.rails
         return plog.file_parsers.rails.RailsParser(options)
+    elif name.lower() == 'json':
+        import plog.file_parsers.jsonlog
+        return plog.file_parsers.jsonlog.JsonParser(options)
+    elif name.lower() == 'grok':
+        import plog.file_parsers.grok
+        return plog.file_parsers.grok.GrokParser(options)
     else:
         raise ValueError('unknown parser named %s' % (name, ))
@@ -17,33 +17,171 @@
 Apache log-file parser.
 """
 
-import re, time
+import logging
+import operator
+import re
 import plog, plog.entry, plog.file_parsers
+import plog.timestamp
+
+class LogFormat(object):
+    """
+    Apache LogFormat string compiled into regular expressions. Each
+    directive used for request entries is captured by a group, see
+    get_index, other directives are matched but not captured.
+
+    Two expressions with the same groups are compiled, regex matches
+    complete lines assuming quoted values contain no escaped quotes
+    and request lines are well formed, tolerant_regex does not assume
+    either and allows trailing data. Lines not matching regex are
+    matched with tolerant_regex. chunk_regex is regex matching lines
+    anywhere in a buffer of many lines.
+    """
+
+    # Regular expression matching a directive, condition, redirect
+    # modifier, argument and directive letter
+    RE_DIRECTIVE = re.compile(
+        r'%!?[0-9,]*[<>]?(?:\{([^}]*)\})?[<>]?([a-zA-Z%])')
+
+    # Pattern of values in quotes
+    QUOTED = r'([^"\n]*)'
+    # Pattern of values in quotes, with backslash escapes
+    QUOTED_ESCAPED = r'([^"\\]*(?:\\.[^"\\]*)*)'
+    # Pattern of values not in quotes
+    UNQUOTED = r'(\S*)'
+
+    # Map from directive to (field, pattern) of captured values,
+    # pattern None uses the quoted or unquoted default
+    DIRECTIVES = {
+        'h': ('ip', r'(\S+)'),
+        'a': ('ip', r'(\S+)'),
+        't': ('time', r'\[([^\] \n]+)[^\]\n]*\]'),
+        'm': ('method', r'(\S*)'),
+        'U': ('path', r'(\S*)'),
+        'q': ('query', r'(\S*)'),
+        's': ('status', r'(\S+)'),
+        'b': ('size', r'(-|[0-9]+)'),
+        'B': ('size', r'([0-9]+)'),
+        'D': ('us_time', r'(-?[0-9]+)'),
+        'T': ('s_time', r'(-?[0-9]+)')
+        }
+
+    # Map from %{unit}T unit to request time field
+    TIME_UNITS = {'s': 's_time', 'ms': 'ms_time', 'us': 'us_time'}
+
+    # Map from lower case %{header}i header to field
+    HEADERS = {'user-agent': 'user_agent'}
+
+    def __init__(self, log_format):
+        """
+        Compile log_format, raises ValueError on invalid formats.
+        """
+        # Log format string
+        self.log_format = log_format
+        # Map from field to group index
+        self._indexes = {}
+
+        patterns = ['^']
+        tolerant_patterns = ['^']
+        num_groups = 0
+        pos = 0
+        for match in LogFormat.RE_DIRECTIVE.finditer(log_format):
+            literal = re.escape(log_format[pos:match.start()])
+            patterns.append(literal)
+            tolerant_patterns.append(literal)
+            pos = match.end()
+
+            arg, directive = match.groups()
+            if directive == '%':
+                patterns.append('%')
+                tolerant_patterns.append('%')
+                continue
+
+            quoted = literal.endswith('"')
+            if directive == 'r':
+                # Request line, method, URI and protocol.
+                fields = ('method', 'uri', 'proto')
+                if quoted:
+                    pattern = r'(\S*) (\S*) ([^"\n]*)'
+                    tolerant = r'(\S*)(?: (\S*))?(?: %s)?' % (
+                        LogFormat.QUOTED_ESCAPED, )
+                else:
+                    pattern = tolerant = r'(\S*) (\S*) (\S*)'
+            else:
+                field, pattern = self._get_directive(arg, directive)
+                fields = (field, )
+                tolerant = pattern
+                if pattern is None and quoted:
+                    pattern = LogFormat.QUOTED
+                    tolerant = LogFormat.QUOTED_ESCAPED
+                elif pattern is None:
+                    pattern = tolerant = LogFormat.UNQUOTED
+
+            if fields == (None, ):
+                # Match values not used in entries without capturing.
+                pattern = pattern.replace('(', '(?:', 1)
+                tolerant = tolerant.replace('(', '(?:', 1)
+            else:
+                for field in fields:
+                    self._indexes.setdefault(field, num_groups)
+                    num_groups += 1
+            patterns.append(pattern)
+            tolerant_patterns.append(tolerant)
+        literal = re.escape(log_format[pos:].rstrip('\n'))
+        patterns.append(literal)
+        tolerant_patterns.append(literal)
+
+        try:
+            # Regular expression matching common lines of the format
+            self.regex = re.compile(''.join(patterns) + '$')
+            # Regular expression matching all lines of the format
+            self.tolerant_regex = re.compile(''.join(tolerant_patterns))
+            # Regular expression matching common lines of the format
+            # including the newline, in multi line buffers
+            self.chunk_regex = re.compile(
+                ''.join(patterns) + '$\n?', re.MULTILINE)
+        except re.error, exc:
+            raise ValueError('invalid log format %s: %s' % (log_format, exc))
+
+    def _get_directive(self, arg, directive):
+        """
+        Get (field, pattern) of directive with optional argument, field
+        is None for values not used in entries.
+        """
+        if arg is not None:
+            if directive == 'i':
+                return LogFormat.HEADERS.get(arg.lower()), None
+            elif directive == 'T':
+                return LogFormat.TIME_UNITS.get(arg), r'(-?[0-9]+)'
+            elif directive == 't':
+                # Custom time formats are matched but not parsed.
+                return None, r'\[([^\]\n]+)\]'
+            elif directive == 'a':
+                return 'ip', r'(\S+)'
+            return None, None
+        return LogFormat.DIRECTIVES.get(directive, (None, None))
+
+    def get_index(self, field):
+        """
+        Get group index of field, None if not in the format.
+        """
+        return self._indexes.get(field)
 
 class ApacheParser(plog.file_parsers.Parser):
     """
-    Parser for Apache common log files, outputs request log files.
+    Parser for Apache access and error log files, outputs request log
+    entries. Access lines are parsed using the LogFormat string given
+    with the format parser option, defaulting to the combined format.
+    Percent signs must be doubled in the configuration file.
     """
 
     # Access entries
 
-    # Regular expression parsing access log entries
-    RE_ACCESS = re.compile('^([0-9\.]+) - - \[([^\]]+)\] "([^ ]+) ([^ ]+) ([^"]+)" ([0-9-]+) ([0-9-]+) "([^"]+)?" "([^"]+)"')
+    # Default access log format, the Apache combined format
+    DEFAULT_FORMAT = '%h %l %u %t "%r" %>s %b "%{Referer}i" "%{User-agent}i"'
 
     # Time format used for access entries
     TIME_FORMAT = '%d/%b/%Y:%H:%M:%S'
 
-    # Fields for access regexp
-    FIELD_IP = 0
-    FIELD_DATETIME = 1
-    FIELD_METHOD = 2
-    FIELD_URI = 3
-    FIELD_PROTO = 4
-    FIELD_STATUS = 5
-    FIELD_SIZE = 6
-    FIELD_REQ_TIME = 7
-    FIELD_UA = 8
-
     # Error entries
 
     # Regular expression parsing error log entries
@@ -64,62 +202,132 @@ class ApacheParser(plog.file_parsers.Parser):
         """
         plog.file_parsers.Parser.__init__(self, options)
 
+        # Compiled access log format
+        self._format = LogFormat(
+            options.get('format', ApacheParser.DEFAULT_FORMAT))
+        # Regular expressions matching access log lines
+        self._re_access = self._format.regex
+        self._re_access_tolerant = self._format.tolerant_regex
+        self._re_access_chunk = self._format.chunk_regex
+
+        # Request time field and multiplier and divisor converting it
+        # to milliseconds, None if request time is not logged
+        time_field, self._time_scale = 'ms_time', None
+        for field, scale in (('us_time', (1, 1000)), ('ms_time', (1, 1)),
+                             ('s_time', (1000, 1))):
+            if self._format.get_index(field) is not None:
+                time_field, self._time_scale = field, scale
+                break
+        uri_field = 'uri'
+        if self._format.get_index('uri') is None:
+            uri_field = 'path'
+        # Group index of query string appended to the URI, None if the
+        # URI is logged with %r or no query string is logged
+        self._index_query = None
+        if uri_field == 'path':
+            self._index_query = self._format.get_index('query')
+
+        # Getter of (ip, time, method, uri, status, size, user agent,
+        # request time) from match groups followed by defaults, fields
+        # not in the format are taken from the defaults.
+        num_groups = self._re_access.groups
+        indexes = []
+        self._defaults = ()
+        for field, default in (('ip', ''), ('time', None), ('method', ''),
+                               (uri_field, ''), ('status', '200'),
+                               ('size', '0'),
+                               ('user_agent', plog.USER_AGENT_UNKNOWN),
+                               (time_field, 0)):
+            index = self._format.get_index(field)
+            if index is None:
+                index = num_groups + len(self._defaults)
+                self._defaults += (default, )
+            indexes.append(index)
+        self._get_fields = operator.itemgetter(*indexes)
+
     def parse_line(self, line):
         """
         Parse line, return a an entry or None.
         """
-        entry = None
-
-        access = ApacheParser.RE_ACCESS.search(line)
+        access = self._re_access.match(line)
+        if access is None:
+            access = self._re_access_tolerant.match(line)
         if access is not None:
-            entry = self._create_access_entry(access.groups())
-        else:
-            error = ApacheParser.RE_ERROR.search(line)
-            if error is not None:
-                entry = self._create_error_entry(error.groups())
-            else:
-                print "FAILED"
-                print line
+            return self._create_access_entry(access.groups())
 
-        return entry
+        error = ApacheParser.RE_ERROR.search(line)
+        if error is not None:
+            return self._create_error_entry(error.groups())
+
+        logging.debug('unable to parse apache line %s' % (line.rstrip(), ))
+        return None
+
+    def parse_chunk(self, buf, end):
+        """
+        Parse lines of buf up to end, common access lines are matched
+        in a single pass over buf and only the lines in between are
+        parsed line by line.
+        """
+        entries = []
+        append = entries.append
+        create = self._create_access_entry
+        pos = 0
+        for access in self._re_access_chunk.finditer(buf, 0, end):
+            start = access.start()
+            if start != pos:
+                entries.extend(self.parse_buf(
+                    plog.file_parsers.split_lines(buf, pos, start)))
+            pos = access.end()
+            try:
+                append(create(access.groups()))
+            except ValueError:
+                logging.debug('failed parsing line: %s' % (access.group(), ))
+        if pos < end:
+            entries.extend(self.parse_buf(
+                plog.file_parsers.split_lines(buf, pos, end)))
+        return entries
 
     def _create_access_entry(self, access):
         """
         Create log entry for access request.
         """
-        # FIXME: Handle timezone
-        time_str = access[ApacheParser.FIELD_DATETIME].split()[0]
-        timestamp = time.strptime(time_str, ApacheParser.TIME_FORMAT)
+        ip_addr, time_str, method, uri, status, size, user_agent, \
+            ms_time = self._get_fields(access + self._defaults)
+
+        if time_str is not None:
+            # FIXME: Handle timezone
+            timestamp = plog.timestamp.parse(
+                time_str, ApacheParser.TIME_FORMAT)
+        else:
+            timestamp = None
+
+        if uri is None:
+            uri = ''
+        elif self._index_query is not None:
+            uri += access[self._index_query]
 
-        # FIXME: Add utility value_form_str or similar that falls back
-        #        to default value if parsing fails.
         try:
-            size = int(access[ApacheParser.FIELD_SIZE])
+            size = int(size)
         except ValueError:
             size = 0
         try:
-            status = int(access[ApacheParser.FIELD_STATUS])
+            status = int(status)
         except ValueError:
             status = 200
-
-        # FIXME: Support request time parsing, can be specified in
-        #        usec and what other formats?
-        ms_time = 0
-
-        # FIXME: Move to common code Map HTTP code into level
-        if status in plog.HTTP_CODES_OK:
-            level = plog.entry.LEVEL_INFO
-        elif status in plog.HTTP_CODES_WARNING:
-            level = plog.entry.LEVEL_WARNING
+        if self._time_scale is not None:
+            try:
+                ms_time = int(ms_time) * self._time_scale[0] \
+                    // self._time_scale[1]
+            except ValueError:
+                ms_time = 0
         else:
-            level = plog.entry.LEVEL_ERROR
+            ms_time = 0
+
+        level = plog.entry.get_status_level(status)
 
         return plog.entry.RequestEntry(
-            access[ApacheParser.FIELD_URI], None, timestamp,
-            plog.DEFAULT_FACILITY, level,
-            [access[ApacheParser.FIELD_IP], access[ApacheParser.FIELD_METHOD],
-             access[ApacheParser.FIELD_UA], size, status, ms_time,
-             access[ApacheParser.FIELD_URI]])
+            uri, None, timestamp, plog.DEFAULT_FACILITY, level,
+            [ip_addr, method, user_agent, size, status, ms_time, uri])
 
     def _create_error_entry(self, error):
         """
@@ -127,7 +335,8 @@ class ApacheParser(plog.file_parsers.Parser):
         """
         # FIXME: Handle timezone
         time_str = error[ApacheParser.FIELD_ERROR_DATETIME]
-        timestamp = time.strptime(time_str, ApacheParser.ERROR_TIME_FORMAT)
+        timestamp = plog.timestamp.parse(
+            time_str, ApacheParser.ERROR_TIME_FORMAT)
 
         size = 0
         status = 503
@@ -19,15 +19,15 @@ Application server log file parsing for glassfish, tomcat etc.
 
 import logging
 import re
-import time
-import cStringIO
 import plog
 import plog.entry
 import plog.file_parsers
+import plog.timestamp
 
-class GlassfishParser(plog.file_parsers.Parser):
+class GlassfishParser(plog.file_parsers.MultilineParser):
     """
-    Parser for Glassfish log files.
+    Parser for Glassfish log files, entries are enclosed in [#| and
+    |#] and may span several lines.
     """
 
     # Field number specifications
@@ -40,42 +40,9 @@ class GlassfishParser(plog.file_parsers.Parser):
     # dropping the timezone and sub second granularity.
     LOG_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
 
-    def __init__(self, options):
-        """
-        Initialize parser state.
-        """
-        plog.file_parsers.Parser.__init__(self, options)
-
-        # Parser flag, in message parsing
-        self.in_message = False
-        # Parser message buffer.
-        self.msg_buf = cStringIO.StringIO()
-
-    def parse_line(self, line):
-        """
-        Parse line, return a an entry or None.
-        """
-        entry = None
-
-        if self.in_message:
-            self.msg_buf.write(line)
-            # Parse log data
-            if line == '|#]\n':
-                self.in_message = False
-                entry = self._create_entry(self.msg_buf.getvalue())
-                self.msg_buf = cStringIO.StringIO()
-
-        elif line.startswith('[#|'):
-            if line.endswith('|#]\n'):
-                # Single line message
-                entry = self._create_entry(line)
-            else:
-                # Multi line message
-                self.in_message = True
-                self.msg_buf = cStringIO.StringIO()
-                self.msg_buf.write(line)
-
-        return entry
+    # Start and end of entries
+    START = re.compile('^\[#\|')
+    END = re.compile('\|#\]$')
 
     def _create_entry(self, msg):
         """
@@ -94,7 +61,7 @@ class GlassfishParser(plog.file_parsers.Parser):
             # Get timestamp removing sub second and timezone info.
             timestamp_str = fields[GlassfishParser.FIELD_TIME]
             timestamp_str = timestamp_str[:timestamp_str.rfind('.')]
-            timestamp = time.strptime(
+            timestamp = plog.timestamp.parse(
                 timestamp_str, GlassfishParser.LOG_TIME_FORMAT)
         except ValueError:
             logging.debug('unable to parse glassfish timestamp %s'
@@ -106,11 +73,17 @@ class GlassfishParser(plog.file_parsers.Parser):
             fields[GlassfishParser.FIELD_TEXT_EXTRA],
             timestamp, plog.DEFAULT_FACILITY, level)
 
-class TomcatParser(plog.file_parsers.Parser):
+class TomcatParser(plog.file_parsers.MultilineParser):
     """
     Parser for tomcat catalina.out style log files. As the rules for
     such log files are not very strict this parser is not 100%
     accurate.
+
+    Timestamps are found with a TimestampExtractor, see the timestamp
+    and timestamp_format options. java.util.logging writes the
+    timestamp on a header line before the line holding the level, such
+    header lines start entries of their own and their timestamp is
+    used for the entry that follows.
     """
 
     # Regular expression for matching start of a log message
@@ -119,37 +92,34 @@ class TomcatParser(plog.file_parsers.Parser):
     FIELD_MESSAGE = 0
     FIELD_TRACEBACK = 1
 
+    # Entries start with a line holding the level and end at the next
+    START = RE_LINE
+
     def __init__(self, options):
         """
-        Initialize parser state.
+        Initialize parser and timestamp extractor from options.
         """
-        plog.file_parsers.Parser.__init__(self, options)
+        plog.file_parsers.MultilineParser.__init__(self, options)
+        self.timestamps = plog.file_parsers.TimestampExtractor.from_options(
+            options)
 
-        # Parser flag, in message parsing
-        self.in_message = False
-        # Parser message buffer.
-        self.msg_buf = cStringIO.StringIO()        
+        # True if header lines are still to be added to the start
+        # expression, user defined start expressions are kept as is
+        self._add_header_start = 'start' not in options
+        # Timestamp of the last header line, None if not seen
+        self._header_timestamp = None
 
-    def parse_line(self, line):
+    def parse_chunk(self, buf, end):
         """
-        Parse line, return log entry if a complete entry is found.
+        Parse lines of buf up to end, see MultilineParser.parse_chunk.
         """
-        entry = None
-
-        if self.in_message:
-            # Parse log data
-            if TomcatParser.RE_LINE.search(line):
-                self.in_message = False
-                entry = self._create_entry(self.msg_buf.getvalue())
-                self.msg_buf = cStringIO.StringIO()
-            self.msg_buf.write(line)
-
-        elif TomcatParser.RE_LINE.search(line):
-            self.in_message = True
-            self.msg_buf = cStringIO.StringIO()
-            self.msg_buf.write(line)
-
-        return entry
+        if self._add_header_start:
+            pattern = self.timestamps.get_pattern()
+            if pattern is not None:
+                self.assembler.set_start(re.compile(
+                    '^(?:%s)|%s' % (pattern, TomcatParser.RE_LINE.pattern)))
+                self._add_header_start = False
+        return plog.file_parsers.MultilineParser.parse_chunk(self, buf, end)
 
     def _create_entry(self, msg):
         """
@@ -167,19 +137,18 @@ class TomcatParser(plog.file_parsers.Parser):
         else:
             msg_extra = None
 
-        # Get level, continue parsing "severe" enough
-        level_name = TomcatParser.RE_LINE.search(msg).group(1)
-        level = plog.entry.get_level(level_name)
+        timestamp = self.timestamps.search(msg)
 
-        # FIXME: Support user defined timstamp formats.
-        timestamp_str = ''
-        try:
-            timestamp = time.strptime(timestamp_str, plog.LOG_TIME_FORMAT)
-        except ValueError:
-            logging.debug('unable to parse tomcat timestamp %s'
-                          % (timestamp_str, ))
-            timestamp = None
+        # Get level, lines without one are headers of the next entry
+        match = TomcatParser.RE_LINE.search(msg)
+        if match is None:
+            self._header_timestamp = timestamp
+            return None
+        level = plog.entry.get_level(match.group(1))
+
+        if timestamp is None:
+            timestamp = self._header_timestamp
+        self._header_timestamp = None
 
         return plog.entry.AppserverEntry(
             msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level)
-
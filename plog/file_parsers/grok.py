@@ -0,0 +1,346 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Regular expression parser configured from the source section, with
+grok style %{MACRO:field} patterns.
+"""
+
+import logging
+import operator
+import re
+import sre_constants
+import sre_parse
+import plog
+import plog.entry
+import plog.file_parsers
+import plog.timestamp
+
+# Regular expression matching macro references, %{NAME} or
+# %{NAME:group}
+RE_MACRO = re.compile('%\{(\w+)(?::(\w+))?\}')
+
+# Maximum depth of macros referencing macros
+MACRO_DEPTH_MAX = 16
+
+# Map from name to expression of built-in macros
+MACROS = {
+    'WORD': '\w+',
+    'NOTSPACE': '\S+',
+    'SPACE': '\s*',
+    'DATA': '.*?',
+    'GREEDYDATA': '.*',
+    'INT': '[+-]?\d+',
+    'NUMBER': '[+-]?\d+(?:\.\d+)?',
+    'IPV4': '\d{1,3}(?:\.\d{1,3}){3}',
+    'IPV6': '[0-9A-Fa-f]*:[0-9A-Fa-f:.]*',
+    'IP': '%{IPV4}|%{IPV6}',
+    'HOSTNAME': '[0-9A-Za-z][0-9A-Za-z.-]*',
+    'IPORHOST': '%{IP}|%{HOSTNAME}',
+    'USER': '[\w.@-]+',
+    'LOGLEVEL': '[A-Za-z]+',
+    'URIPATH': '/[^\s?#]*',
+    'URIPATHPARAM': '/[^\s#]*',
+    'QS': '[^"\n]*',
+    'HTTPDATE': '\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:\d\d [+-]\d{4}',
+    'HAPROXYDATE': '\d\d/[A-Z][a-z]{2}/\d{4}:\d\d:\d\d:\d\d\.\d+',
+    'TIMESTAMP_ISO8601':
+        '\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?(?:Z|[+-]\d\d:?\d\d)?',
+    'DATESTAMP': '\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:[.,]\d+)?'
+    }
+
+# Map from name of timestamp macros to (format, length) where length
+# is the length of the value parsed with format, sub seconds and zone
+# are dropped
+TIME_MACROS = {
+    'HTTPDATE': ('%d/%b/%Y:%H:%M:%S', 20),
+    'HAPROXYDATE': ('%d/%b/%Y:%H:%M:%S', 20),
+    'TIMESTAMP_ISO8601': ('%Y-%m-%dT%H:%M:%S', 19),
+    'DATESTAMP': (plog.LOG_TIME_FORMAT, 19)
+    }
+
+# Entry fields in the order returned by the field getter
+FIELDS = ('msg', 'msg_extra', 'level', 'timestamp', 'ip', 'method',
+          'user_agent', 'size', 'status', 'duration', 'uri')
+
+# Map from (pattern, macros) to compiled Pattern
+_compiled = {}
+
+def expand(pattern, macros, groups, depth=0):
+    """
+    Replace macro references in pattern with the expressions in
+    macros, references with a group name become named groups. groups
+    is filled with a map from group name to macro name. Raises
+    ValueError on unknown or too deeply nested macros.
+    """
+    if depth > MACRO_DEPTH_MAX:
+        raise ValueError('macros nested more than %d levels'
+                         % (MACRO_DEPTH_MAX, ))
+
+    def replace(match):
+        """
+        Get expression of macro reference match.
+        """
+        name, group = match.group(1).upper(), match.group(2)
+        if name not in macros:
+            raise ValueError('unknown macro %s' % (name, ))
+        expression = expand(macros[name], macros, groups, depth + 1)
+        if group is None:
+            return '(?:%s)' % (expression, )
+        groups[group] = name
+        return '(?P<%s>%s)' % (group, expression)
+    return RE_MACRO.sub(replace, pattern)
+
+def _get_prefix(items):
+    """
+    Get (prefix, complete) of parsed expression items where complete
+    is True if all items are literal.
+    """
+    prefix = []
+    for op, arg in items:
+        if op == sre_constants.LITERAL:
+            prefix.append(chr(arg))
+        elif (op == sre_constants.AT and not prefix
+              and arg == sre_constants.AT_BEGINNING):
+            continue
+        elif op == sre_constants.SUBPATTERN:
+            sub_prefix, complete = _get_prefix(arg[-1])
+            prefix.append(sub_prefix)
+            if not complete:
+                return ''.join(prefix), False
+        else:
+            return ''.join(prefix), False
+    return ''.join(prefix), True
+
+def get_literal_prefix(regex):
+    """
+    Get literal string every match of compiled regex starts with,
+    empty if there is none.
+    """
+    if regex.flags & re.IGNORECASE:
+        return ''
+    return _get_prefix(sre_parse.parse(regex.pattern, regex.flags))[0]
+
+class Pattern(object):
+    """
+    Compiled parser pattern, shared by all parsers configured with
+    the same pattern and macros.
+    """
+
+    def __init__(self, pattern, macros):
+        """
+        Expand macros in pattern and compile it, raises ValueError on
+        invalid pattern or macros.
+        """
+        all_macros = MACROS.copy()
+        for name, expression in macros.iteritems():
+            all_macros[name.upper()] = expression
+
+        # Map from group name to macro name of macro groups
+        self.macro_groups = {}
+        # Expanded expression
+        self.expression = expand(pattern, all_macros, self.macro_groups)
+        try:
+            # Lines are matched in place in the read buffer, ^ and $
+            # must match at line boundaries.
+            self.regex = re.compile(self.expression, re.MULTILINE)
+        except re.error, exc:
+            raise ValueError('invalid pattern %s: %s' % (pattern, exc))
+        # Literal string matching lines start with
+        self.prefix = get_literal_prefix(self.regex)
+
+    @classmethod
+    def get(cls, pattern, macros):
+        """
+        Get compiled pattern, compiling it only once per pattern and
+        macros.
+        """
+        key = (pattern, tuple(sorted(macros.items())))
+        compiled = _compiled.get(key)
+        if compiled is None:
+            compiled = cls(pattern, macros)
+            _compiled[key] = compiled
+        return compiled
+
+class GrokParser(plog.file_parsers.Parser):
+    """
+    Parser for line based log files described by a regular expression
+    in the pattern option. %{MACRO:field} references a macro capturing
+    its match as group field, %{MACRO} matches without capturing.
+    Options named macro-NAME add macros. Percent signs must be doubled
+    in the configuration file, i.e. %%{IP:ip}.
+
+    Groups named as the entry fields msg, msg_extra, level, timestamp,
+    ip, method, user_agent, size, status, duration and uri fill them,
+    a field option maps the field to another group name. The entry,
+    duration_unit and timestamp_format options are as for the JSON
+    parser, timestamp_format defaults to the format of the timestamp
+    macro used.
+
+    Lines not starting with the literal prefix of the pattern are
+    rejected without running the expression, lines not matching are
+    dropped.
+    """
+
+    def __init__(self, options):
+        """
+        Initialize parser from options, raises ValueError on invalid
+        options.
+        """
+        plog.file_parsers.Parser.__init__(self, options)
+
+        if not options.get('pattern'):
+            raise ValueError('pattern option missing')
+        macros = dict([(name[len('macro-'):], expression)
+                       for name, expression in options.iteritems()
+                       if name.startswith('macro-')])
+        pattern = Pattern.get(options['pattern'], macros)
+        # Expression matching lines
+        self._regex = pattern.regex
+        # Literal string matching lines start with
+        self._prefix = pattern.prefix
+
+        entry_name = options.get('entry', 'appserver')
+        if entry_name not in plog.file_parsers.ENTRY_CLASSES:
+            raise ValueError('unknown entry type %s' % (entry_name, ))
+        # Class of created entries
+        self._entry_class = plog.file_parsers.ENTRY_CLASSES[entry_name]
+        # True if request entries are created
+        self._is_request = entry_name == 'request'
+
+        unit = options.get('duration_unit', 'ms')
+        if unit not in plog.file_parsers.DURATION_UNITS:
+            raise ValueError('unknown duration unit %s' % (unit, ))
+        # Multiplier and divisor converting duration to milliseconds
+        self._duration_scale = plog.file_parsers.DURATION_UNITS[unit]
+
+        # Getter of fields from match groups followed by None, fields
+        # without a group are taken from the None.
+        group_index = self._regex.groupindex
+        indexes = []
+        for field in FIELDS:
+            index = group_index.get(options.get(field, field))
+            if index is None:
+                index = self._regex.groups + 1
+            indexes.append(index - 1)
+        self._get_fields = operator.itemgetter(*indexes)
+
+        # Format and length of timestamp values
+        self._time_format = None
+        time_group = options.get('timestamp', 'timestamp')
+        if time_group in group_index:
+            macro = pattern.macro_groups.get(time_group)
+            if 'timestamp_format' in options:
+                self._time_format = (options['timestamp_format'], None)
+            elif macro in TIME_MACROS:
+                self._time_format = TIME_MACROS[macro]
+            else:
+                raise ValueError('timestamp_format option missing')
+
+    def parse_chunk(self, buf, end):
+        """
+        Parse lines of buf up to end, lines are matched in place
+        without copying them.
+        """
+        entries = []
+        append = entries.append
+        match = self._regex.match
+        prefix = self._prefix
+        find = buf.find
+        pos = 0
+        while pos < end:
+            line_end = find('\n', pos, end)
+            if line_end == -1:
+                line_end = end
+            if buf.startswith(prefix, pos, line_end):
+                groups = match(buf, pos, line_end)
+                if groups is not None:
+                    try:
+                        append(self._create_entry(groups.groups() + (None, ),
+                                                  groups.group()))
+                    except ValueError:
+                        logging.debug('failed parsing line: %s'
+                                      % (groups.group(), ))
+                    pos = line_end + 1
+                    continue
+            logging.debug('unable to parse line %s' % (buf[pos:line_end], ))
+            pos = line_end + 1
+        return entries
+
+    def parse_line(self, line):
+        """
+        Parse line, return an entry or None.
+        """
+        entries = self.parse_chunk(line, len(line))
+        if entries:
+            return entries[0]
+        return None
+
+    def _get_timestamp(self, value):
+        """
+        Get timestamp of timestamp group value, None if not valid.
+        """
+        fmt, length = self._time_format
+        try:
+            return plog.timestamp.parse(value[:length], fmt)
+        except ValueError:
+            logging.debug('unable to parse timestamp %s' % (value, ))
+            return None
+
+    def _create_entry(self, groups, line):
+        """
+        Create entry from match groups followed by None.
+        """
+        msg, msg_extra, level, timestamp, ip_addr, method, user_agent, \
+            size, status, duration, uri = self._get_fields(groups)
+
+        if timestamp is not None:
+            timestamp = self._get_timestamp(timestamp)
+        if level is not None:
+            level = plog.entry.get_level(level)
+
+        if not self._is_request:
+            if msg is None:
+                msg = line
+            if level is None:
+                level = plog.entry.LEVEL_NONE
+            return self._entry_class(
+                msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level)
+
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            status = 200
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            size = 0
+        try:
+            ms_time = int(float(duration) * self._duration_scale[0]
+                          / self._duration_scale[1])
+        except (TypeError, ValueError):
+            ms_time = 0
+        if uri is None:
+            uri = ''
+        if msg is None:
+            msg = uri or line
+        if level is None:
+            level = plog.entry.get_status_level(status)
+
+        return plog.entry.RequestEntry(
+            msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level,
+            [ip_addr or '', method or '',
+             user_agent or plog.USER_AGENT_UNKNOWN, size, status, ms_time,
+             uri])
@@ -0,0 +1,256 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+JSON lines log file parser, one JSON object per line. The fastest
+decoder installed is used, ujson, simplejson or the json module.
+"""
+
+import logging
+import operator
+import time
+import plog
+import plog.entry
+import plog.file_parsers
+import plog.timestamp
+
+try:
+    import ujson as json
+except ImportError:
+    try:
+        import simplejson as json
+    except ImportError:
+        import json
+
+def compile_path(path):
+    """
+    Get accessor function returning the value at dot separated key
+    path of a decoded object, None if any key is missing.
+    """
+    keys = path.split('.')
+    if len(keys) == 1:
+        return operator.methodcaller('get', keys[0])
+
+    def get_value(record):
+        """
+        Get value at keys of record.
+        """
+        for key in keys:
+            if not isinstance(record, dict):
+                return None
+            record = record.get(key)
+        return record
+    return get_value
+
+def get_missing(record):
+    """
+    Accessor of fields not mapped, always None.
+    """
+    return None
+
+def to_str(value):
+    """
+    Get value as an UTF-8 encoded string, objects and arrays are
+    encoded as JSON. None is kept.
+    """
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    elif isinstance(value, str) or value is None:
+        return value
+    elif isinstance(value, (dict, list)):
+        return to_str(json.dumps(value))
+    return str(value)
+
+def to_int(value, default):
+    """
+    Get value as an integer, default if not a number.
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+class JsonParser(plog.file_parsers.Parser):
+    """
+    Parser for JSON lines log files. Parser options map keys of the
+    logged objects onto entry fields, nested keys are separated with
+    dots:
+
+      msg, msg_extra, level, timestamp   all entry types
+      ip, method, user_agent, size,      request entries
+      status, duration, uri
+
+    The entry option selects appserver (default), request or plain
+    entries. Timestamps are strings in timestamp_format, ISO 8601 by
+    default, or seconds since the epoch. duration_unit is one of s, ms
+    (default) and us. Lines without msg are sent as the message, or the
+    URI for request entries, lines that are not JSON objects are
+    dropped.
+    """
+
+    # Map from field to default key
+    DEFAULT_KEYS = {'msg': 'msg', 'level': 'level', 'timestamp': 'time'}
+
+    # Fields valid for all entries
+    FIELDS = ('msg', 'msg_extra', 'level', 'timestamp')
+    # Fields valid for request entries
+    REQUEST_FIELDS = ('ip', 'method', 'user_agent', 'size', 'status',
+                      'duration', 'uri')
+
+    # Default timestamp format, sub seconds and zone are dropped
+    TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__(self, options):
+        """
+        Initialize parser compiling the field mapping, raises
+        ValueError on invalid options.
+        """
+        plog.file_parsers.Parser.__init__(self, options)
+
+        entry_name = options.get('entry', 'appserver')
+        if entry_name not in plog.file_parsers.ENTRY_CLASSES:
+            raise ValueError('unknown JSON entry type %s' % (entry_name, ))
+        # Class of created entries
+        self._entry_class = plog.file_parsers.ENTRY_CLASSES[entry_name]
+
+        # Accessor functions of fields, fields not mapped or not valid
+        # for the entry type always give None
+        getters = []
+        for field in JsonParser.FIELDS + JsonParser.REQUEST_FIELDS:
+            path = options.get(field, JsonParser.DEFAULT_KEYS.get(field))
+            if path and (entry_name == 'request'
+                         or field in JsonParser.FIELDS):
+                getters.append(compile_path(path))
+            else:
+                getters.append(get_missing)
+        self._get_msg, self._get_msg_extra, self._get_level, \
+            self._get_time, self._get_ip, self._get_method, \
+            self._get_user_agent, self._get_size, self._get_status, \
+            self._get_duration, self._get_uri = getters
+
+        unit = options.get('duration_unit', 'ms')
+        if unit not in plog.file_parsers.DURATION_UNITS:
+            raise ValueError('unknown duration unit %s' % (unit, ))
+        # Multiplier and divisor converting duration to milliseconds
+        self._duration_scale = plog.file_parsers.DURATION_UNITS[unit]
+        # Format of string timestamps, None for the default
+        self._time_format = options.get('timestamp_format')
+        # Last (string, timestamp) parsed
+        self._last_time = (None, None)
+
+        # Function creating entry from decoded object and line
+        if entry_name == 'request':
+            self._create_entry = self._create_request_entry
+        else:
+            self._create_entry = self._create_log_entry
+
+    def parse_line(self, line):
+        """
+        Parse line, return entry or None if line is not a JSON
+        object.
+        """
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if not isinstance(record, dict):
+            logging.debug('unable to parse JSON line %s' % (line, ))
+            return None
+        return self._create_entry(record, line)
+
+    def _get_timestamp(self, record):
+        """
+        Get timestamp of record, None if missing or invalid.
+        """
+        value = self._get_time(record)
+        if isinstance(value, (int, long, float)):
+            try:
+                return time.localtime(value)
+            except ValueError:
+                return None
+        elif not isinstance(value, basestring):
+            return None
+
+        if self._time_format is None:
+            value = value[:19]
+        if value == self._last_time[0]:
+            return self._last_time[1]
+        try:
+            if self._time_format is not None:
+                timestamp = plog.timestamp.parse(
+                    to_str(value), self._time_format)
+            else:
+                timestamp = plog.timestamp.parse(
+                    to_str(value).replace(' ', 'T'), JsonParser.TIME_FORMAT)
+        except ValueError:
+            logging.debug('unable to parse JSON timestamp %s' % (value, ))
+            timestamp = None
+        self._last_time = (value, timestamp)
+        return timestamp
+
+    def _get_common(self, record):
+        """
+        Get (msg, msg_extra, timestamp, level) of record, msg and level
+        are None if not mapped or missing.
+        """
+        msg = to_str(self._get_msg(record))
+        level = self._get_level(record)
+        if level is not None:
+            level = plog.entry.get_level(to_str(level))
+        return (msg, to_str(self._get_msg_extra(record)),
+                self._get_timestamp(record), level)
+
+    def _create_log_entry(self, record, line):
+        """
+        Create plain or appserver entry from record.
+        """
+        msg, msg_extra, timestamp, level = self._get_common(record)
+        if msg is None:
+            msg = line
+        if level is None:
+            level = plog.entry.LEVEL_NONE
+        return self._entry_class(
+            msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level)
+
+    def _create_request_entry(self, record, line):
+        """
+        Create request entry from record, the message defaults to the
+        URI and the level follows the status unless mapped.
+        """
+        msg, msg_extra, timestamp, level = self._get_common(record)
+
+        status = to_int(self._get_status(record), 200)
+        size = to_int(self._get_size(record), 0)
+        try:
+            ms_time = int(float(self._get_duration(record))
+                          * self._duration_scale[0] / self._duration_scale[1])
+        except (TypeError, ValueError):
+            ms_time = 0
+        uri = to_str(self._get_uri(record)) or ''
+        if msg is None:
+            msg = uri or line
+        user_agent = to_str(self._get_user_agent(record)) \
+            or plog.USER_AGENT_UNKNOWN
+        if level is None:
+            level = plog.entry.get_status_level(status)
+
+        return plog.entry.RequestEntry(
+            msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level,
+            [to_str(self._get_ip(record)) or '',
+             to_str(self._get_method(record)) or '', user_agent, size,
+             status, ms_time, uri])
@@ -17,14 +17,14 @@
 Rails log-file parser.
 """
 
+import logging
 import re
-import time
-import cStringIO
 import plog
 import plog.entry
 import plog.file_parsers
+import plog.timestamp
 
-class RailsParser(plog.file_parsers.Parser):
+class RailsParser(plog.file_parsers.MultilineParser):
     """
     Parser for Rails production log files, outputs request log files
     and not appserver as one might think as rails log files include
@@ -41,60 +41,21 @@ class RailsParser(plog.file_parsers.Parser):
     RE_STATUS = re.compile(
         'Completed in ([0-9]+)ms[^|]+\| ([0-9]+)[^\[]+\[([^\]]+)')
 
-    def __init__(self, options):
-        """
-        Initialize parser state.
-        """
-        plog.file_parsers.Parser.__init__(self, options)
-
-        # Parser flag, in message parsing.
-        self.in_message = False
-        # Boolean flag set if last line was a newline.
-        self.last_is_newline = False
-        # Parser state detecting end of entry.
-        self.has_rendered_or_completed = False
-        # Parser message buffer.
-        self.msg_buf = cStringIO.StringIO()
-
-    def parse_line(self, line):
-        """
-        Parse line, return a an entry or None.
-        """
-        entry = None
-
-        if self.in_message:
-            self.msg_buf.write(line)
-
-            if line == '\n':
-                if self.last_is_newline and self.has_rendered_or_completed:
-                    entry = self._create_entry(self.msg_buf.getvalue())
-                    self.msg_buf.reset()
-                    self.msg_buf.truncate()
-                    self.has_rendered_or_completed = False
-
-                # Toggle last_is_newline, if it was previously set a
-                # new entry has begun it should be enabled or else it
-                # should be flagged.
-                self.last_is_newline = not self.last_is_newline
-            else:
-                if self.last_is_newline and line.startswith('Rendering'):
-                    self.has_rendered_or_completed = True
-                elif line.startswith('Completed'):
-                    self.has_rendered_or_completed = True
-                self.last_is_newline = False
-
-        elif line == '\n':
-            self.in_message = self.last_is_newline
-            self.last_is_newline = True
-        else:
-            self.last_is_newline = False
-
-        return entry
+    # Entries start with the request line and end with the status
+    # line. Failed requests have no status line, they end at the next
+    # request line with the blank lines separating entries kept at the
+    # end.
+    START = re.compile('^Processing ')
+    END = re.compile('^Completed in ')
+    # Entries without a status line are in progress until the blank
+    # line before a traceback shows the request failed, slow requests
+    # are not completed idle and reported as failed.
+    IDLE_END = re.compile('\n\n')
 
     def _create_entry(self, msg):
         """
-        Create entry for message text, the entry is formatted starting
-        with 2 newlines, 2 ending newlines.
+        Create entry for message text, the entry starts with the
+        request line and ends with the newlines before the next entry.
 
         The first line is request information, second is parameters if
         errors occur a blank line is presented and then a traceback
@@ -104,8 +65,8 @@ class RailsParser(plog.file_parsers.Parser):
         if not msg:
             return
 
-        # Drop starting and ending newlines
-        msg_full = msg[0:-3]
+        # Drop ending newlines
+        msg_full = msg.rstrip('\n')
         msg_lines = msg.split('\n')
         
         # First line is request info, in form:
@@ -124,7 +85,7 @@ class RailsParser(plog.file_parsers.Parser):
             return None
 
         # Convert string timestamp into datetime
-        timestamp = time.strptime(timestamp, plog.TIME_FORMAT)
+        timestamp = plog.timestamp.parse(timestamp, plog.LOG_TIME_FORMAT)
 
         # User agent and size is empty as it is not logged
         size = 0
@@ -154,22 +115,18 @@ class RailsParser(plog.file_parsers.Parser):
             #
             try:
                 ms_time, status, uri = self.RE_STATUS.search(status).groups()
-                status = int(status)
-            except:
-                print status
-                raise
+                ms_time, status = int(ms_time), int(status)
+            except (AttributeError, ValueError):
+                logging.debug('failed to parse rails status line: %s'
+                              % (status, ))
+                return None
         else:
             ms_time = 0
             status = 500
             uri = plog.URI_ERROR
 
         # Map HTTP code into level
-        if status in plog.HTTP_CODES_OK:
-            level = plog.entry.LEVEL_INFO
-        elif status in plog.HTTP_CODES_WARNING:
-            level = plog.entry.LEVEL_WARNING
-        else:
-            level = plog.entry.LEVEL_ERROR
+        level = plog.entry.get_status_level(status)
 
         return plog.entry.RequestEntry(
             msg, msg_extra, timestamp, plog.DEFAULT_FACILITY, level,
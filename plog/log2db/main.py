@@ -18,12 +18,16 @@ System log to database writer module, includes the Log2DbDaemon
 application.
 """
 
+import logging
+import select
 import socket
 import re
 import plog
+import plog.codec
 import plog.daemon
 import plog.entry
-import plog.log2db.writer
+import plog.log2db.reassembly
+import plog.wire
 
 # Rules identifying log message
 CLASSIFY_RULES = (
@@ -32,6 +36,10 @@ CLASSIFY_RULES = (
     (re.compile('^.'), plog.entry.Entry)
     )
 
+# Signatures of the wire layers wrapping records
+WIRE_SIGNATURES = (plog.wire.FRAGMENT_SIGNATURE,
+                   plog.wire.COMPRESS_SIGNATURE, plog.wire.BATCH_SIGNATURE)
+
 class Log2DbDaemon(plog.daemon.Daemon):
     """
     Log2Db daemon application, reads syslog events from the network,
@@ -44,8 +52,15 @@ class Log2DbDaemon(plog.daemon.Daemon):
         """
         plog.daemon.Daemon.__init__(self, 'log2db')
 
-        # Network socket
+        # Network socket receiving datagrams, None if not bound
         self._socket = None
+        # Listening TCP socket, None if not bound
+        self._listener = None
+        # Map from TCP socket to (address, list of buffered chunks,
+        # buffered bytes, bytes needed to complete the next frame)
+        self._clients = {}
+        # Reassembly table of fragmented messages
+        self._reassembler = plog.log2db.reassembly.Reassembler()
         # Writer thread
         self._writer = None
 
@@ -54,63 +69,234 @@ class Log2DbDaemon(plog.daemon.Daemon):
         Daemon main, recv events and add them to the writer.
         """
         # Initialize network listening
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
         address = self._config.get('log2db', 'bind_address', '0.0.0.0')
         port = int(self._config.get('log2db', 'bind_port', '514'))
+        transport = self._config.get('log2db', plog.CFG_OPT_BIND_TRANSPORT,
+                                     plog.DEFAULT_TRANSPORT)
 
-        self._socket.bind((address, port))
+        if transport in ('udp', 'both'):
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._socket.bind((address, port))
+        if transport in ('tcp', 'both'):
+            self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._listener.setsockopt(
+                socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._listener.bind((address, port))
+            self._listener.listen(socket.SOMAXCONN)
 
         # Drop privileges after binding
         self._drop_privileges()
 
         # FIXME: Support other database writer types
 
-        # Create and start writer
+        # Create and start writer, imported here as the database
+        # driver is only needed by the running daemon.
+        import plog.log2db.writer
         self._writer = plog.log2db.writer.MySQLDBWriter(self._config)
         self._writer.start()
 
         while self._do_run():
             # FIXME: Check for configuration re-loading
-            data, addr = self._recv_event()
-            if data is not None:
-                # Create event from syslog traffic
-                event = self._construct_event(data, addr)
-                self._writer.add(event)
+            for data, addr in self._recv_events():
+                # Create events from syslog traffic
+                events = self._construct_events(data, addr)
+                if events:
+                    self._writer.add_many(events)
 
+        for client in self._clients.keys():
+            self._close_client(client)
         self._writer.stop()
 
+    def _recv_events(self):
+        """
+        Get list of (data, addr) syslog events from the network.
+        """
+        sockets = self._clients.keys()
+        if self._socket is not None:
+            sockets.append(self._socket)
+        if self._listener is not None:
+            sockets.append(self._listener)
+
+        try:
+            readable = select.select(sockets, [], [], plog.WATCH_TIMEOUT)[0]
+        except select.error:
+            # Interrupted by signal.
+            return []
+
+        events = []
+        for sock in readable:
+            if sock is self._socket:
+                data, addr = self._recv_event()
+                if data is not None:
+                    events.append((data, addr))
+            elif sock is self._listener:
+                self._accept_client()
+            else:
+                events.extend(self._recv_client(sock))
+        return events
+
     def _recv_event(self):
         """
         Get syslog event from the network.
         """
         try:
-            data, addr = self._socket.recvfrom(plog.READ_LOG_MAX)
+            data, addr = self._socket.recvfrom(plog.DATAGRAM_MAX)
         except socket.error:
             # FIXME: Debug logging
             data = addr = None
 
         return (data, addr)
 
-    def _construct_event(self, data, addr):
+    def _accept_client(self):
+        """
+        Accept new TCP connection.
+        """
+        try:
+            client, addr = self._listener.accept()
+        except socket.error:
+            return
+
+        if len(self._clients) >= plog.TCP_CLIENTS_MAX:
+            logging.warning('too many connections, rejecting %s' % (addr[0], ))
+            client.close()
+            return
+        self._clients[client] = (addr, [], 0, 0)
+
+    def _recv_client(self, client):
+        """
+        Read from TCP connection, returns list of (data, addr) for
+        the complete frames received. Chunks are only joined and
+        decoded once the next frame is complete.
+        """
+        addr, chunks, size, needed = self._clients[client]
+        try:
+            data = client.recv(plog.TCP_COALESCE)
+        except socket.error, exc:
+            logging.warning('connection from %s failed: %s' % (addr[0], exc))
+            data = ''
+        if not data:
+            self._close_client(client)
+            return []
+
+        chunks.append(data)
+        size += len(data)
+        if size < needed:
+            self._clients[client] = (addr, chunks, size, needed)
+            return []
+
+        buf = ''.join(chunks)
+        try:
+            frames, consumed = plog.wire.decode_frames(
+                buf, plog.TCP_FRAME_MAX)
+            buf = buf[consumed:]
+            needed = plog.wire.get_frame_end(buf)
+        except ValueError, exc:
+            logging.warning('invalid frame from %s: %s' % (addr[0], exc))
+            self._close_client(client)
+            return []
+
+        self._clients[client] = (addr, [buf], len(buf), needed)
+        return [(frame, addr) for frame in frames]
+
+    def _close_client(self, client):
+        """
+        Close TCP connection, a partially received frame is dropped.
+        """
+        del self._clients[client]
+        client.close()
+
+    def _construct_events(self, data, addr):
         """
-        Construct event from syslog data.
+        Construct list of events from syslog data. Invalid data is
+        dropped with a warning.
         """
-        message =  self._decode_syslog(data)
-        if message is not None:
+        try:
+            return self._decode_layers(data, addr)
+        except ValueError, exc:
+            logging.warning('dropping invalid message from %s: %s'
+                            % (addr[0], exc))
+            return []
+
+    def _decode_layers(self, data, addr):
+        """
+        Construct list of events from syslog data, decoding the wire
+        layers in their fixed order, reassembling fragments,
+        decompressing, unpacking batches and decoding records. Raises
+        ValueError on invalid data and layers nested out of order.
+        """
+        message = self._decode_syslog(data)
+        if message is None:
+            return []
+
+        facility, priority, msg = message
+        if msg.startswith(plog.wire.FRAGMENT_SIGNATURE):
+            data = self._reassembler.add(addr, msg)
+            if data is None:
+                return []
+            # The reassembled message was never sent on its own, a
+            # zero byte ending it is data and not a syslog terminator.
+            message = self._decode_syslog(data, False)
+            if message is None:
+                return []
             facility, priority, msg = message
-            event_class = self._classify_event(msg, addr)
-            event = event_class(msg, None, None, facility, priority, None, addr)
-            event.from_syslog()
-            return event
+            if msg.startswith((plog.wire.FRAGMENT_SIGNATURE,
+                               plog.wire.BATCH_SIGNATURE)):
+                raise ValueError('nested %s message' % (msg[:4], ))
+
+        if msg.startswith(plog.wire.COMPRESS_SIGNATURE):
+            frames = plog.wire.decode_frames(
+                plog.wire.decompress(msg, plog.DECOMPRESS_MAX))[0]
+        elif msg.startswith(plog.wire.BATCH_SIGNATURE):
+            frames = plog.wire.decode_frames(
+                msg[len(plog.wire.BATCH_SIGNATURE):])[0]
+        else:
+            frames = None
+        if frames is None:
+            self._check_layer(msg)
+            return self._decode_records(facility, priority, msg, addr)
+
+        events = []
+        for frame in frames:
+            message = self._decode_syslog(frame)
+            if message is not None:
+                self._check_layer(message[2])
+                events.extend(self._decode_records(
+                    message[0], message[1], message[2], addr))
+        return events
+
+    def _check_layer(self, msg):
+        """
+        Check that records msg is not a fragment, compressed message or
+        batch nested inside another layer, raises ValueError if it is.
+        """
+        if msg.startswith(WIRE_SIGNATURES):
+            raise ValueError('nested %s message' % (msg[:4], ))
+
+    def _decode_records(self, facility, priority, msg, addr):
+        """
+        Construct list of events from a text or binary message.
+        """
+        if msg.startswith(plog.codec.BINARY_SIGNATURE):
+            return plog.codec.decode_message(msg, addr)
+        return [self._construct_event(facility, priority, msg, addr)]
+
+    def _construct_event(self, facility, priority, msg, addr):
+        """
+        Construct event from decoded syslog message.
+        """
+        event_class = self._classify_event(msg, addr)
+        event = event_class(msg, None, None, facility, priority, None, addr)
+        event.from_syslog()
+        return event
 
-    def _decode_syslog(self, data):
+    def _decode_syslog(self, data, terminated=True):
         """
         Decode syslog format <X>message\000 returning a three element tuple
-        including (facility, priority, message)
+        including (facility, priority, message). The zero terminator is
+        optional, it is only removed if terminated is set.
         """
         # Make sure log starts with < >
-        if data[0] != '<':
+        if not data or data[0] != '<':
             return None
         log_start = data.find('>')
         if log_start == -1:
@@ -124,7 +310,7 @@ class Log2DbDaemon(plog.daemon.Daemon):
         except ValueError:
             return None
 
-        if data[-1] == '\000':
+        if terminated and data[-1] == '\000':
             msg = data[log_start+1:-1]
         else:
             msg = data[log_start+1:]
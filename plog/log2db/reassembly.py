@@ -0,0 +1,118 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Reassembly of messages split in fragments by file2log.
+"""
+
+import collections
+import logging
+import time
+import plog
+import plog.wire
+
+class Reassembler(object):
+    """
+    Bounded table of partially received messages. Messages not
+    completed within timeout seconds are dropped, and the oldest
+    message is dropped when max_messages are pending.
+    """
+
+    def __init__(self, max_messages=plog.FRAGMENT_TABLE_MAX,
+                 timeout=plog.FRAGMENT_TIMEOUT,
+                 max_size=plog.FRAGMENT_MESSAGE_MAX):
+        """
+        Initialize empty reassembly table.
+        """
+        # Maximum number of pending messages
+        self._max_messages = max_messages
+        # Seconds a message may take to complete
+        self._timeout = timeout
+        # Maximum size of a reassembled message
+        self._max_size = max_size
+        # Maximum number of fragments of a message
+        self._max_count = max(max_size // plog.FRAGMENT_DATA_MIN, 1)
+        # Map from (host, message id) to [created, size, count,
+        # fragments] where fragments maps index to data, oldest first
+        self._messages = collections.OrderedDict()
+
+        # Number of messages reassembled
+        self.stats_completed = 0
+        # Number of messages dropped incomplete
+        self.stats_dropped = 0
+
+    def add(self, addr, msg):
+        """
+        Add fragment message from addr, returns the reassembled syslog
+        data when the last fragment is added and None otherwise.
+        """
+        try:
+            msg_id, index, count, data = plog.wire.decode_fragment(msg)
+        except ValueError, exc:
+            logging.warning('invalid fragment from %s: %s' % (addr[0], exc))
+            return None
+        if count > self._max_count:
+            logging.warning('invalid fragment from %s: count %d too large'
+                            % (addr[0], count))
+            return None
+
+        now = time.time()
+        self._expire(now)
+
+        key = (addr[0], msg_id)
+        message = self._messages.get(key)
+        if message is None:
+            if len(self._messages) >= self._max_messages:
+                self._drop(self._messages.iterkeys().next(), 'table full')
+            message = [now, 0, count, {}]
+            self._messages[key] = message
+        elif message[2] != count:
+            self._drop(key, 'fragment count mismatch')
+            return None
+
+        fragments = message[3]
+        if index not in fragments:
+            fragments[index] = data
+            message[1] += len(data)
+        if message[1] > self._max_size:
+            self._drop(key, 'message too large')
+            return None
+
+        if len(fragments) < count:
+            return None
+        del self._messages[key]
+        self.stats_completed += 1
+        return ''.join([fragments[index] for index in xrange(count)])
+
+    def _expire(self, now):
+        """
+        Drop messages not completed within timeout.
+        """
+        oldest = now - self._timeout
+        while self._messages:
+            key, message = self._messages.iteritems().next()
+            if message[0] >= oldest:
+                break
+            self._drop(key, 'timed out')
+
+    def _drop(self, key, reason):
+        """
+        Drop incomplete message.
+        """
+        message = self._messages.pop(key)
+        self.stats_dropped += 1
+        logging.warning('dropping message %x from %s, %s with %d of %d '
+                        'fragments' % (key[1], key[0], reason,
+                                       len(message[3]), message[2]))
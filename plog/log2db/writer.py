@@ -56,6 +56,15 @@ class Writer(threading.Thread):
         self._event_queue_cond.notify()
         self._event_queue_cond.release()
 
+    def add_many(self, entries):
+        """
+        Add list of classified and parsed log entries.
+        """
+        self._event_queue_cond.acquire()
+        self._event_queue.extend(entries)
+        self._event_queue_cond.notify()
+        self._event_queue_cond.release()
+
     def stop(self):
         """
         Signal the writer to shut down.
@@ -203,6 +212,10 @@ class MySQLDBWriter(DBWriter):
             'host_id': host.id, 'source_id': source.id
             }
 
+        # Only sampled entries set the weight, the column defaults to 1.
+        if entry.weight != 1:
+            log_data['weight'] = entry.weight
+
         # Add extra data to log entry
         if entry.extra_values:
             extra_fields = entry.get_extra_fields()
@@ -0,0 +1,197 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Cached timestamp parsing and formatting.
+
+Log lines arrive in timestamp order with many lines per second, so
+the same timestamp string is parsed and formatted over and over. Each
+function keeps the last value per format and a bounded map of recent
+values, and the fixed layout formats used by the parsers and the wire
+format are converted without going through time.strptime.
+"""
+
+import calendar
+import datetime
+import time
+import plog
+
+# Month abbreviations as parsed by %b in the C locale
+_MONTHS = dict([(name, num + 1) for num, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+     'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))])
+
+# Map from format to last (string, timestamp) parsed
+_last_parsed = {}
+# Map from (string, format) to parsed timestamp
+_parsed = {}
+# Map from format to last (timestamp, string) formatted
+_last_formatted = {}
+# Map from (timestamp, format) to formatted string
+_formatted = {}
+# Last (timestamp, seconds) converted by to_seconds
+_last_seconds = (None, None)
+# Last (seconds, timestamp) converted by from_seconds
+_last_gmtime = (None, None)
+
+def _to_struct(year, month, day, hour, minute, second):
+    """
+    Get struct_time as returned by time.strptime, raises ValueError if
+    any value is out of range.
+    """
+    if hour > 23 or minute > 59 or second > 61:
+        raise ValueError('time out of range')
+    date = datetime.date(year, month, day)
+    return time.struct_time((year, month, day, hour, minute, second,
+                             date.weekday(), date.timetuple()[7], -1))
+
+def _parse_iso(value, separator):
+    """
+    Parse YYYY-mm-dd?HH:MM:SS with ? being separator.
+    """
+    if (len(value) != 19 or value[4] != '-' or value[7] != '-'
+        or value[10] != separator or value[13] != ':' or value[16] != ':'):
+        raise ValueError('layout mismatch')
+    digits = value[:4] + value[5:7] + value[8:10] \
+        + value[11:13] + value[14:16] + value[17:]
+    if not digits.isdigit():
+        raise ValueError('layout mismatch')
+    return _to_struct(int(value[:4]), int(value[5:7]), int(value[8:10]),
+                      int(value[11:13]), int(value[14:16]),
+                      int(value[17:]))
+
+def _parse_log(value):
+    """
+    Parse plog.LOG_TIME_FORMAT.
+    """
+    return _parse_iso(value, ' ')
+
+def _parse_iso_t(value):
+    """
+    Parse ISO 8601 timestamp without sub seconds and zone.
+    """
+    return _parse_iso(value, 'T')
+
+def _parse_clf(value):
+    """
+    Parse Apache common log format timestamp, dd/Mon/YYYY:HH:MM:SS.
+    """
+    if (len(value) != 20 or value[2] != '/' or value[6] != '/'
+        or value[11] != ':' or value[14] != ':' or value[17] != ':'):
+        raise ValueError('layout mismatch')
+    digits = value[:2] + value[7:11] + value[12:14] \
+        + value[15:17] + value[18:]
+    if not digits.isdigit():
+        raise ValueError('layout mismatch')
+    try:
+        month = _MONTHS[value[3:6]]
+    except KeyError:
+        raise ValueError('layout mismatch')
+    return _to_struct(int(value[7:11]), month, int(value[:2]),
+                      int(value[12:14]), int(value[15:17]),
+                      int(value[18:]))
+
+def _format_log(timestamp):
+    """
+    Format timestamp with plog.LOG_TIME_FORMAT.
+    """
+    return '%04d-%02d-%02d %02d:%02d:%02d' % tuple(timestamp[:6])
+
+# Map from format to parse function for fixed layout formats
+_PARSERS = {
+    plog.LOG_TIME_FORMAT: _parse_log,
+    '%Y-%m-%dT%H:%M:%S': _parse_iso_t,
+    '%d/%b/%Y:%H:%M:%S': _parse_clf
+    }
+# Map from format to format function for fixed layout formats
+_FORMATTERS = {
+    plog.LOG_TIME_FORMAT: _format_log
+    }
+
+def parse(value, fmt):
+    """
+    Parse timestamp string value in format fmt, see time.strptime.
+    Raises ValueError if value does not match fmt.
+    """
+    last = _last_parsed.get(fmt)
+    if last is not None and last[0] == value:
+        return last[1]
+
+    timestamp = _parsed.get((value, fmt))
+    if timestamp is None:
+        parser = _PARSERS.get(fmt)
+        if parser is not None:
+            try:
+                timestamp = parser(value)
+            except ValueError:
+                # Let strptime decide on values not in the plain layout.
+                pass
+        if timestamp is None:
+            timestamp = time.strptime(value, fmt)
+
+        if len(_parsed) >= plog.TIMESTAMP_CACHE_MAX:
+            _parsed.clear()
+        _parsed[(value, fmt)] = timestamp
+
+    _last_parsed[fmt] = (value, timestamp)
+    return timestamp
+
+def to_string(timestamp, fmt=plog.LOG_TIME_FORMAT):
+    """
+    Format struct_time timestamp in format fmt, see time.strftime.
+    """
+    last = _last_formatted.get(fmt)
+    if last is not None and last[0] == timestamp:
+        return last[1]
+
+    value = _formatted.get((timestamp, fmt))
+    if value is None:
+        formatter = _FORMATTERS.get(fmt)
+        if formatter is not None:
+            value = formatter(timestamp)
+        else:
+            value = time.strftime(fmt, timestamp)
+
+        if len(_formatted) >= plog.TIMESTAMP_CACHE_MAX:
+            _formatted.clear()
+        _formatted[(timestamp, fmt)] = value
+
+    _last_formatted[fmt] = (timestamp, value)
+    return value
+
+def to_seconds(timestamp):
+    """
+    Get seconds since the epoch of struct_time timestamp read as UTC,
+    see calendar.timegm.
+    """
+    global _last_seconds
+    last = _last_seconds
+    if last[0] == timestamp:
+        return last[1]
+    seconds = calendar.timegm(timestamp)
+    _last_seconds = (timestamp, seconds)
+    return seconds
+
+def from_seconds(seconds):
+    """
+    Get UTC struct_time of seconds since the epoch, see time.gmtime.
+    """
+    global _last_gmtime
+    last = _last_gmtime
+    if last[0] == seconds:
+        return last[1]
+    timestamp = time.gmtime(seconds)
+    _last_gmtime = (seconds, timestamp)
+    return timestamp
@@ -0,0 +1,198 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Wire framing shared between file2log and log2db.
+
+Frames use RFC 6587 octet counting, the frame length in decimal
+followed by a space and the frame data. A batch is a syslog message
+with the batch signature followed by frames each holding a complete
+<priority>message syslog message.
+
+Messages too large for a datagram are split in fragments, syslog
+messages with the fragment signature followed by the message id, the
+fragment index and count and a piece of the <priority>message syslog
+message.
+
+Batches may be compressed, syslog messages with the compression
+signature followed by the codec and the compressed frames. zlib is
+always available, zstd if the zstd module is installed.
+
+Layers nest in one fixed order, a datagram is a fragment, a compressed
+message, a batch or a single message. Reassembled fragments hold a
+compressed message or a single message, and compressed messages and
+batches hold single messages only.
+"""
+
+import zlib
+
+try:
+    import zstd
+except ImportError:
+    zstd = None
+
+# Signature of batch messages
+BATCH_SIGNATURE = '!!BT '
+# Signature of fragment messages
+FRAGMENT_SIGNATURE = '!!FR '
+# Maximum size of the fragment header following the signature
+FRAGMENT_HEADER_MAX = 32
+# Signature of compressed messages
+COMPRESS_SIGNATURE = '!!CP '
+# End of compressed message marker, protects the compressed data from
+# syslog zero terminator stripping
+COMPRESS_END = '\n'
+# Codec identifiers following the compression signature
+CODEC_ZLIB = 'z'
+CODEC_ZSTD = 's'
+# Map from codec name to identifier
+CODEC_NAMES = {'zlib': CODEC_ZLIB, 'zstd': CODEC_ZSTD}
+
+def encode_frame(data):
+    """
+    Encode data as an octet counted frame.
+    """
+    return '%d %s' % (len(data), data)
+
+def encode_syslog(facility, priority, msg):
+    """
+    Encode message in syslog <priority>message format, without the
+    zero terminator.
+    """
+    return '<%d>%s' % ((facility << 3) | priority, msg)
+
+def get_datagram_message(frame):
+    """
+    Get message of frames sent in a datagram of their own, fragments
+    and compressed messages are not carried in batches. Returns None
+    for frames sent in batches.
+    """
+    start = frame.find('>', 0, 24) + 1
+    if start and frame.startswith((FRAGMENT_SIGNATURE, COMPRESS_SIGNATURE),
+                                  start):
+        return frame[start:]
+    return None
+
+def decode_frames(data, max_size=None):
+    """
+    Decode octet counted frames from data, returns tuple with list of
+    complete frames and the number of bytes consumed. Raises
+    ValueError on invalid frames or frames larger than max_size.
+    """
+    frames = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        space = data.find(' ', pos, pos + 12)
+        if space == -1:
+            if end - pos >= 12:
+                raise ValueError('invalid frame length at %d' % (pos, ))
+            break
+
+        size = int(data[pos:space])
+        if size < 0 or (max_size is not None and size > max_size):
+            raise ValueError('invalid frame length %d' % (size, ))
+        frame_end = space + 1 + size
+        if frame_end > end:
+            break
+
+        frames.append(data[space + 1:frame_end])
+        pos = frame_end
+
+    return frames, pos
+
+def get_frame_end(data):
+    """
+    Get number of bytes of data needed to complete the first octet
+    counted frame, 0 if its length is not yet received. Raises
+    ValueError on an invalid frame length.
+    """
+    space = data.find(' ', 0, 12)
+    if space == -1:
+        return 0
+    return space + 1 + int(data[:space])
+
+def encode_fragments(msg_id, data, max_size):
+    """
+    Split data in fragment messages of at most max_size bytes, not
+    counting the signature, for message msg_id.
+    """
+    chunk_size = max_size - FRAGMENT_HEADER_MAX
+    count = (len(data) + chunk_size - 1) / chunk_size
+    return ['%s%x %d %d %s' % (FRAGMENT_SIGNATURE, msg_id, index, count,
+                               data[index * chunk_size:
+                                    (index + 1) * chunk_size])
+            for index in xrange(count)]
+
+def decode_fragment(msg):
+    """
+    Decode fragment message, returns tuple with message id, index,
+    count and data. Raises ValueError on invalid fragments.
+    """
+    try:
+        msg_id, index, count, data = \
+            msg[len(FRAGMENT_SIGNATURE):].split(' ', 3)
+        msg_id, index, count = int(msg_id, 16), int(index), int(count)
+    except ValueError:
+        raise ValueError('invalid fragment header')
+    if not 0 <= index < count:
+        raise ValueError('invalid fragment index %d of %d' % (index, count))
+    return msg_id, index, count, data
+
+def has_codec(codec):
+    """
+    Check if compression codec is available.
+    """
+    return codec == CODEC_ZLIB or (codec == CODEC_ZSTD and zstd is not None)
+
+def compress(codec, data, level):
+    """
+    Compress data, returns compressed message.
+    """
+    if codec == CODEC_ZSTD:
+        compressed = zstd.compress(data, level)
+    else:
+        compressed = zlib.compress(data, level)
+    return '%s%s%s%s' % (COMPRESS_SIGNATURE, codec, compressed, COMPRESS_END)
+
+def decompress(msg, max_size):
+    """
+    Decompress compressed message, returns the data. Raises ValueError
+    on invalid messages and data larger than max_size.
+    """
+    start = len(COMPRESS_SIGNATURE) + 1
+    if len(msg) <= start or msg[-1] != COMPRESS_END:
+        raise ValueError('truncated compressed message')
+    codec = msg[start - 1]
+    compressed = msg[start:-len(COMPRESS_END)]
+
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(compressed, max_size)
+        except zlib.error, exc:
+            raise ValueError('invalid zlib data: %s' % (exc, ))
+        if decompressor.unconsumed_tail:
+            raise ValueError('decompressed data larger than %d' % (max_size, ))
+    elif codec == CODEC_ZSTD and zstd is not None:
+        try:
+            data = zstd.decompress(compressed)
+        except zstd.Error, exc:
+            raise ValueError('invalid zstd data: %s' % (exc, ))
+        if len(data) > max_size:
+            raise ValueError('decompressed data larger than %d' % (max_size, ))
+    else:
+        raise ValueError('unsupported codec %r' % (codec, ))
+    return data
@@ -0,0 +1,97 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the read offset checkpoint store.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import plog.file2log.checkpoint
+
+class SendingLogger(object):
+    """
+    Logger holding frames until sent is set.
+    """
+
+    def __init__(self):
+        """
+        Initialize logger with nothing sent.
+        """
+        # True if flush hands frames to the socket
+        self.sent = False
+        # Number of flushes
+        self.flushes = 0
+
+    def flush(self):
+        """
+        Count flush.
+        """
+        self.flushes += 1
+
+    def is_sent(self):
+        """
+        Check if frames have been sent.
+        """
+        return self.sent
+
+class CheckpointStoreTest(unittest.TestCase):
+    """
+    Tests of CheckpointStore.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'checkpoints')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        store = plog.file2log.checkpoint.CheckpointStore(self.path)
+        store.set(1, 2, 100, '100:abc', '/var/log/test.log')
+        store.flush(True)
+        store = plog.file2log.checkpoint.CheckpointStore(self.path)
+        self.assertEqual(store.get(1, 2), (100, '100:abc'))
+        self.assertTrue(store.has_path('/var/log/test.log'))
+        self.assertEqual(store.get(1, 3), None)
+
+    def test_interval(self):
+        store = plog.file2log.checkpoint.CheckpointStore(self.path, 3600)
+        store.set(1, 2, 100, '100:abc', '/var/log/test.log')
+        store.flush()
+        self.assertFalse(os.path.exists(self.path))
+        store.flush(True)
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_flush_sent(self):
+        # Offsets of entries the logger still holds are not written.
+        logger = SendingLogger()
+        store = plog.file2log.checkpoint.CheckpointStore(self.path, 0)
+        store.set(1, 2, 100, '100:abc', '/var/log/test.log')
+        store.flush_sent(logger)
+        self.assertEqual(logger.flushes, 1)
+        self.assertFalse(os.path.exists(self.path))
+        logger.sent = True
+        store.flush_sent(logger)
+        self.assertTrue(os.path.exists(self.path))
+        # Nothing changed, the logger is not flushed.
+        store.flush_sent(logger)
+        self.assertEqual(logger.flushes, 2)
+
+if __name__ == '__main__':
+    unittest.main()
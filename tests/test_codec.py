@@ -0,0 +1,152 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the binary wire format for entries.
+"""
+
+import time
+import unittest
+import plog
+import plog.codec
+import plog.entry
+
+# Address of the sender of test messages
+ADDR = ('192.0.2.1', 514)
+# Timestamp of test entries
+TIMESTAMP = time.strptime('2009-05-15 12:30:45', '%Y-%m-%d %H:%M:%S')
+# User agent longer than the literal values
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64)'
+
+def request(ip_addr='10.0.0.1', method='GET', user_agent=USER_AGENT,
+            size=512, status=200, ms_time=12, uri='/index.html'):
+    """
+    Return request entry with extra values.
+    """
+    return plog.entry.RequestEntry(
+        'GET %s' % (uri, ), None, TIMESTAMP, plog.DEFAULT_FACILITY,
+        plog.entry.get_status_level(status),
+        [ip_addr, method, user_agent, size, status, ms_time, uri])
+
+def encode(entries, name='source'):
+    """
+    Encode entries in a binary message.
+    """
+    table = plog.codec.StringTable()
+    return plog.codec.encode_message(
+        [plog.codec.encode_record(plog.codec.get_record(entry, name), table)
+         for entry in entries])
+
+class CodecTest(unittest.TestCase):
+    """
+    Tests of encoding and decoding binary messages.
+    """
+
+    def assertEntry(self, decoded, entry, name='source'):
+        # The extra message is sent as formatted by the text format.
+        self.assertEqual(decoded.__class__, entry.__class__)
+        self.assertEqual((decoded.msg, decoded.msg_extra,
+                          decoded.timestamp[:6], decoded.level,
+                          list(decoded.extra_values), decoded.weight,
+                          decoded.name, decoded.ip_addr),
+                         (entry.msg, str(entry.msg_extra),
+                          entry.timestamp[:6], entry.level,
+                          list(entry.extra_values), entry.weight, name,
+                          ADDR[0]))
+
+    def test_round_trip(self):
+        entries = [
+            plog.entry.Entry('plain message\n', 'extra', TIMESTAMP),
+            request(),
+            request(ip_addr='2001:db8:0:0:0:0:0:1', method='PROPFIND',
+                    status=404, ms_time=0, uri='/' + 'x' * 1000),
+            plog.entry.AppserverEntry('appserver message', 'traceback',
+                                      TIMESTAMP, level=3)]
+        msg = encode(entries)
+        self.assertTrue(msg.startswith(plog.codec.BINARY_SIGNATURE))
+        decoded = plog.codec.decode_message(msg, ADDR)
+        self.assertEqual(len(decoded), len(entries))
+        for decoded_entry, entry in zip(decoded, entries):
+            self.assertEntry(decoded_entry, entry)
+
+    def test_literal_values(self):
+        short = 'x' * plog.codec._LITERAL_MAX
+        long_value = 'x' * (plog.codec._LITERAL_MAX + 1)
+        entries = [request(ip_addr=short, user_agent=long_value),
+                   request(ip_addr=long_value, user_agent=short)]
+        msg = encode(entries)
+        # Only the long value is defined in the dictionary.
+        self.assertEqual(msg.count(long_value), 1)
+        decoded = plog.codec.decode_message(msg, ADDR)
+        self.assertEqual([entry.extra_values[0] for entry in decoded],
+                         [short, long_value])
+        self.assertEqual([entry.extra_values[2] for entry in decoded],
+                         [long_value, short])
+
+    def test_dictionary(self):
+        entries = [request(), request(status=304), request()]
+        msg = encode(entries)
+        self.assertEqual(msg.count(USER_AGENT), 1)
+        self.assertEqual(msg.count('source'), 1)
+        decoded = plog.codec.decode_message(msg, ADDR)
+        for decoded_entry, entry in zip(decoded, entries):
+            self.assertEntry(decoded_entry, entry)
+
+    def test_converted_values(self):
+        entry = request(ip_addr=None, user_agent=u'agent' * 4, size='64',
+                        status='bad')
+        decoded = plog.codec.decode_message(encode([entry]), ADDR)[0]
+        self.assertEqual(decoded.extra_values[:5],
+                         ['None', 'GET', 'agent' * 4, 64, 0])
+
+    def test_weight(self):
+        entries = [request(), request(), request()]
+        entries[1].weight = 10
+        decoded = plog.codec.decode_message(encode(entries), ADDR)
+        self.assertEqual([entry.weight for entry in decoded], [1, 10, 1])
+
+    def test_version_1(self):
+        # Messages without literal values are the same in version 1.
+        entry = request(ip_addr='192.168.100.100', method='PROPPATCH' * 2)
+        msg = encode([entry])
+        pos = len(plog.codec.BINARY_SIGNATURE)
+        msg = msg[:pos] + chr(1) + msg[pos + 1:]
+        self.assertEntry(plog.codec.decode_message(msg, ADDR)[0], entry)
+
+    def test_malformed(self):
+        msg = encode([request(), request(status=500)])
+        pos = len(plog.codec.BINARY_SIGNATURE)
+        for bad in (plog.codec.BINARY_SIGNATURE,
+                    msg[:pos] + chr(3) + msg[pos + 1:],
+                    msg[:-1], msg[:-10] + plog.codec.BINARY_END,
+                    msg[:pos + 1] + chr(0x80) + msg[pos + 2:]):
+            self.assertRaises(ValueError, plog.codec.decode_message,
+                              bad, ADDR)
+
+    def test_table_full(self):
+        table = plog.codec.StringTable()
+        records = []
+        while not table.is_full():
+            records.append(plog.codec.encode_record(plog.codec.get_record(
+                request(user_agent='agent %d %s' % (len(records), 'x' * 16)),
+                'source'), table))
+        decoded = plog.codec.decode_message(
+            plog.codec.encode_message(records), ADDR)
+        self.assertEqual(len(decoded), len(records))
+        self.assertEqual(decoded[-1].extra_values[2],
+                         'agent %d %s' % (len(records) - 1, 'x' * 16))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of tailing files, rotation and copytruncate handling.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import plog
+import plog.file2log.file
+import plog.file_parsers
+
+class FileTest(unittest.TestCase):
+    """
+    Tests of File.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'test.log')
+        self.write('old line\n', 'w')
+        self.file_obj = plog.file2log.file.File(
+            'test', self.path, plog.file_parsers.PlainParser({}))
+
+    def tearDown(self):
+        self.file_obj.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, data, mode='a'):
+        """
+        Write data to the test file.
+        """
+        log_file = open(self.path, mode)
+        log_file.write(data)
+        log_file.close()
+
+    def read(self):
+        """
+        Read and parse available data, returns list of messages.
+        """
+        entries = []
+        while not self.file_obj.is_changed() and self.file_obj.has_data():
+            entries.extend(self.file_obj.parser.feed(
+                self.file_obj.read(plog.READ_MAX)))
+        return [entry.msg for entry in entries]
+
+    def test_seek_end(self):
+        self.assertEqual(self.read(), [])
+        self.write('new line\n')
+        self.assertEqual(self.read(), ['new line\n'])
+
+    def test_copytruncate(self):
+        self.write('first\nsecond\n')
+        self.assertEqual(self.read(), ['first\n', 'second\n'])
+        self.write('', 'w')
+        self.write('after\n')
+        self.assertEqual(self.read(), ['after\n'])
+        self.assertEqual(self.file_obj.offset, len('after\n'))
+
+    def test_copytruncate_partial_line(self):
+        self.write('complete\npartial')
+        self.assertEqual(self.read(), ['complete\n'])
+        self.assertEqual(self.file_obj.parser.get_pending(), len('partial'))
+        self.write('', 'w')
+        self.write('rotated\n')
+        self.assertEqual(self.read(), ['rotated\n'])
+        self.assertEqual(self.file_obj.parser.get_pending(), 0)
+
+    def test_copytruncate_empty(self):
+        # The file is rewound as soon as it is truncated, before it
+        # has new data.
+        self.write('first\n')
+        self.assertEqual(self.read(), ['first\n'])
+        self.write('', 'w')
+        self.assertEqual(self.read(), [])
+        self.assertEqual(self.file_obj.offset, 0)
+        self.write('rewritten line\n')
+        self.assertEqual(self.read(), ['rewritten line\n'])
+
+    def test_rename_rotation(self):
+        self.write('before\n')
+        os.rename(self.path, self.path + '.1')
+        self.write('new file\n', 'w')
+        self.assertEqual(self.read(), ['before\n'])
+        self.assertTrue(self.file_obj.is_changed())
+        self.file_obj.reopen()
+        self.assertEqual(self.read(), ['new file\n'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of multi-line entry assembly and completing idle entries.
+"""
+
+import re
+import unittest
+import plog.entry
+import plog.file_parsers
+import plog.file_parsers.rails
+
+# Rails request line
+RAILS_REQUEST = ('Processing PageController#show (for 10.0.0.1 at '
+                 '2009-05-15 12:00:00) [GET]\n')
+# Rails parameters line
+RAILS_PARAMETERS = '  Parameters: {"id"=>"1"}\n'
+# Rails status line
+RAILS_STATUS = ('Completed in 12ms (View: 5, DB: 3) | 200 OK '
+                '[http://example.com/page/1]\n')
+# Rails traceback and rescue template of a failed request
+RAILS_TRACEBACK = ('\n\nActiveRecord::RecordNotFound (not found):\n'
+                   '    app/controllers/page_controller.rb:3\n\n'
+                   'Rendering rescues/layout (not_found)\n\n\n')
+
+class LinesParser(plog.file_parsers.MultilineParser):
+    """
+    Parser of entries starting with a BEGIN line.
+    """
+
+    START = re.compile('^BEGIN')
+
+    def _create_entry(self, msg):
+        """
+        Create entry of the assembled lines.
+        """
+        return plog.entry.Entry(msg)
+
+class MultilineTest(unittest.TestCase):
+    """
+    Tests of MultilineParser.
+    """
+
+    def test_next_start(self):
+        parser = LinesParser({})
+        self.assertEqual(parser.feed('BEGIN 1\nmore\n'), [])
+        entries = parser.feed('BEGIN 2\n')
+        self.assertEqual([entry.msg for entry in entries],
+                         ['BEGIN 1\nmore\n'])
+        self.assertEqual(parser.get_pending(), len('BEGIN 2\n'))
+
+    def test_flush_idle(self):
+        parser = LinesParser({'idle_timeout': '5'})
+        parser.feed('BEGIN 1\nmore\n')
+        now = parser._last_feed
+        self.assertEqual(parser.flush_idle(now + 4), [])
+        entries = parser.flush_idle(now + 5)
+        self.assertEqual([entry.msg for entry in entries],
+                         ['BEGIN 1\nmore\n'])
+        self.assertEqual(parser.get_pending(), 0)
+        self.assertEqual(parser.flush_idle(now + 10), [])
+
+    def test_flush_idle_partial_line(self):
+        # Lines not yet terminated are not part of the idle entry.
+        parser = LinesParser({'idle_timeout': '5'})
+        parser.feed('BEGIN 1\npartial')
+        entries = parser.flush_idle(parser._last_feed + 5)
+        self.assertEqual([entry.msg for entry in entries], ['BEGIN 1\n'])
+        self.assertEqual(parser.get_pending(), len('partial'))
+
+    def test_flush(self):
+        parser = LinesParser({})
+        parser.feed('BEGIN 1\npartial')
+        self.assertEqual([entry.msg for entry in parser.flush()],
+                         ['BEGIN 1\npartial'])
+        self.assertEqual(parser.get_pending(), 0)
+
+class RailsTest(unittest.TestCase):
+    """
+    Tests of RailsParser entries and completing idle entries.
+    """
+
+    def setUp(self):
+        self.parser = plog.file_parsers.rails.RailsParser(
+            {'idle_timeout': '5'})
+
+    def test_completed(self):
+        entries = self.parser.feed(
+            RAILS_REQUEST + RAILS_PARAMETERS + RAILS_STATUS)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].extra_values,
+                         ['10.0.0.1', 'GET', plog.USER_AGENT_UNKNOWN, 0, 200,
+                          12, 'http://example.com/page/1'])
+        self.assertEqual(self.parser.get_pending(), 0)
+
+    def test_idle_in_progress(self):
+        # Slow requests are not reported as failed while idle.
+        self.parser.feed(RAILS_REQUEST + RAILS_PARAMETERS)
+        now = self.parser._last_feed
+        self.assertEqual(self.parser.flush_idle(now + 60), [])
+        self.assertEqual(self.parser.flush_idle(now + 120), [])
+        entries = self.parser.feed(RAILS_STATUS)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].extra_values[4], 200)
+
+    def test_idle_failed(self):
+        self.parser.feed(RAILS_REQUEST + RAILS_PARAMETERS + RAILS_TRACEBACK)
+        now = self.parser._last_feed
+        self.assertEqual(self.parser.flush_idle(now + 4), [])
+        entries = self.parser.flush_idle(now + 5)
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].extra_values[4], 500)
+        self.assertTrue('RecordNotFound' in entries[0].msg_extra)
+        self.assertEqual(self.parser.get_pending(), 0)
+
+    def test_idle_checked_again(self):
+        # An in-progress entry is checked again once more data is fed.
+        self.parser.feed(RAILS_REQUEST + RAILS_PARAMETERS)
+        self.assertEqual(
+            self.parser.flush_idle(self.parser._last_feed + 5), [])
+        self.parser.feed(RAILS_TRACEBACK)
+        entries = self.parser.flush_idle(self.parser._last_feed + 5)
+        self.assertEqual([entry.extra_values[4] for entry in entries],
+                         [500])
+
+    def test_failed_next_start(self):
+        entries = self.parser.feed(RAILS_REQUEST + RAILS_TRACEBACK
+                                   + RAILS_REQUEST + RAILS_STATUS)
+        self.assertEqual([entry.extra_values[4] for entry in entries],
+                         [500, 200])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the file reader.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+import plog.config
+import plog.entry
+import plog.file2log.file
+import plog.file2log.reader
+import plog.file_parsers
+
+class LinesParser(plog.file_parsers.MultilineParser):
+    """
+    Parser of entries starting with a BEGIN line.
+    """
+
+    START = re.compile('^BEGIN')
+
+    def _create_entry(self, msg):
+        """
+        Create entry of the assembled lines.
+        """
+        return plog.entry.Entry(msg)
+
+class ReaderTest(unittest.TestCase):
+    """
+    Tests of Reader.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        cfg_path = os.path.join(self.directory, 'plog.cfg')
+        open(cfg_path, 'w').write('[file2log]\nwatcher=poll\n')
+        self.config = plog.config.Config(cfg_path)
+        # List of (file name, entry message) handled
+        self.handled = []
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def handle(self, f_obj, entries):
+        self.handled.extend([(f_obj.name, entry.msg) for entry in entries])
+
+    def create_file(self, name, parser, data):
+        """
+        Create file name holding data, returns File reading it.
+        """
+        path = os.path.join(self.directory, name)
+        open(path, 'w').write(data)
+        return plog.file2log.file.File(name, path, parser, seek_end=False)
+
+    def test_close_flushes_parsers(self):
+        files = [self.create_file('plain', plog.file_parsers.PlainParser({}),
+                                  'line\npartial'),
+                 self.create_file('multi', LinesParser({}),
+                                  'BEGIN 1\nmore\n')]
+        reader = plog.file2log.reader.Reader(self.config, files, self.handle)
+        reader.run_once()
+        self.assertEqual(self.handled, [('plain', 'line\n')])
+        reader.close()
+        self.assertEqual(sorted(self.handled),
+                         [('multi', 'BEGIN 1\nmore\n'), ('plain', 'line\n'),
+                          ('plain', 'partial')])
+        for f_obj in files:
+            self.assertEqual(f_obj.parser.get_pending(), 0)
+            f_obj.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the reassembly of fragmented messages and its limits.
+"""
+
+import logging
+import unittest
+import plog
+import plog.wire
+import plog.log2db.reassembly
+
+# Address of the sender of test messages
+ADDR = ('192.0.2.1', 514)
+
+def fragment(msg_id, index, count, data):
+    """
+    Return fragment message.
+    """
+    return '%s%x %d %d %s' % (plog.wire.FRAGMENT_SIGNATURE, msg_id, index,
+                              count, data)
+
+class ReassemblerTest(unittest.TestCase):
+    """
+    Tests of Reassembler.
+    """
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_in_order(self):
+        reassembler = plog.log2db.reassembly.Reassembler()
+        data = 'x' * 1000 + 'y' * 1000
+        fragments = plog.wire.encode_fragments(1, data, 600)
+        for msg in fragments[:-1]:
+            self.assertEqual(reassembler.add(ADDR, msg), None)
+        self.assertEqual(reassembler.add(ADDR, fragments[-1]), data)
+        self.assertEqual(reassembler.stats_completed, 1)
+
+    def test_out_of_order(self):
+        reassembler = plog.log2db.reassembly.Reassembler()
+        data = ''.join([chr(value % 256) for value in xrange(2000)])
+        fragments = plog.wire.encode_fragments(1, data, 300)
+        fragments.reverse()
+        # Duplicates are ignored.
+        fragments.insert(1, fragments[0])
+        for msg in fragments[:-1]:
+            self.assertEqual(reassembler.add(ADDR, msg), None)
+        self.assertEqual(reassembler.add(ADDR, fragments[-1]), data)
+
+    def test_senders(self):
+        reassembler = plog.log2db.reassembly.Reassembler()
+        other = ('192.0.2.2', 514)
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 0, 2, 'a')), None)
+        self.assertEqual(reassembler.add(other, fragment(1, 1, 2, 'd')),
+                         None)
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 1, 2, 'b')), 'ab')
+        self.assertEqual(reassembler.add(other, fragment(1, 0, 2, 'c')),
+                         'cd')
+
+    def test_count_limit(self):
+        reassembler = plog.log2db.reassembly.Reassembler(
+            max_size=10 * plog.FRAGMENT_DATA_MIN)
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 0, 11, 'a')),
+                         None)
+        self.assertEqual(reassembler._messages, {})
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 0, 10, 'a')),
+                         None)
+        self.assertEqual(len(reassembler._messages), 1)
+
+    def test_size_limit(self):
+        reassembler = plog.log2db.reassembly.Reassembler(max_size=1000)
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 0, 3, 'x' * 600)),
+                         None)
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 1, 3, 'x' * 600)),
+                         None)
+        self.assertEqual(reassembler._messages, {})
+        self.assertEqual(reassembler.stats_dropped, 1)
+        # The rest of the dropped message starts a new one.
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 2, 3, 'x')), None)
+        self.assertEqual(len(reassembler._messages), 1)
+
+    def test_count_mismatch(self):
+        reassembler = plog.log2db.reassembly.Reassembler()
+        reassembler.add(ADDR, fragment(1, 0, 2, 'a'))
+        self.assertEqual(reassembler.add(ADDR, fragment(1, 1, 3, 'b')), None)
+        self.assertEqual(reassembler._messages, {})
+        self.assertEqual(reassembler.stats_dropped, 1)
+
+    def test_table_full(self):
+        reassembler = plog.log2db.reassembly.Reassembler(max_messages=2)
+        for msg_id in xrange(3):
+            reassembler.add(ADDR, fragment(msg_id, 0, 2, 'a'))
+        self.assertEqual(reassembler._messages.keys(),
+                         [(ADDR[0], 1), (ADDR[0], 2)])
+        self.assertEqual(reassembler.stats_dropped, 1)
+        self.assertEqual(reassembler.add(ADDR, fragment(0, 1, 2, 'b')), None)
+        self.assertEqual(reassembler.add(ADDR, fragment(2, 1, 2, 'b')), 'ab')
+
+    def test_timeout(self):
+        reassembler = plog.log2db.reassembly.Reassembler(timeout=10)
+        reassembler.add(ADDR, fragment(1, 0, 2, 'a'))
+        reassembler._messages[(ADDR[0], 1)][0] -= 11
+        reassembler.add(ADDR, fragment(2, 0, 2, 'a'))
+        self.assertEqual(reassembler._messages.keys(), [(ADDR[0], 2)])
+        self.assertEqual(reassembler.stats_dropped, 1)
+
+    def test_invalid(self):
+        reassembler = plog.log2db.reassembly.Reassembler()
+        for msg in ('!!FR 1 2 2 a', '!!FR 1 0', '!!FR z 0 1 a'):
+            self.assertEqual(reassembler.add(ADDR, msg), None)
+        self.assertEqual(reassembler._messages, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,336 @@
+# This file is part of plog.
+#
+# plog is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License.
+#
+# plog is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with plog.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Tests of the wire framing, batches, fragments and compression, and of
+the decoding of the wire layers in log2db.
+"""
+
+import logging
+import os
+import select
+import shutil
+import socket
+import tempfile
+import unittest
+import zlib
+import plog
+import plog.config
+import plog.entry
+import plog.file2log.logger
+import plog.file2log.syslog
+import plog.log2db.main
+import plog.wire
+
+# Address of the sender of test messages
+ADDR = ('192.0.2.1', 514)
+
+def datagram(msg):
+    """
+    Return msg as sent in a datagram by the syslog client, with the
+    zero terminator.
+    """
+    return plog.file2log.syslog.SyslogClient.log_format_string % (14, msg)
+
+def syslog(msg):
+    """
+    Return msg in syslog format as framed in batches and fragments.
+    """
+    return plog.wire.encode_syslog(1, 6, msg)
+
+def frames(msgs):
+    """
+    Return octet counted frames of syslog messages msgs.
+    """
+    return ''.join([plog.wire.encode_frame(msg) for msg in msgs])
+
+def batch(msgs):
+    """
+    Return batch message holding syslog messages msgs.
+    """
+    return plog.wire.BATCH_SIGNATURE + frames(msgs)
+
+class FrameTest(unittest.TestCase):
+    """
+    Tests of octet counted frames.
+    """
+
+    def test_round_trip(self):
+        msgs = ['<14>first', '', '<14>with space and\nnewline']
+        data = frames(msgs)
+        self.assertEqual(plog.wire.decode_frames(data), (msgs, len(data)))
+
+    def test_partial(self):
+        data = plog.wire.encode_frame('<14>complete')
+        partial = plog.wire.encode_frame('<14>partial')
+        for cut in (1, 3, len(partial) - 1):
+            received, consumed = plog.wire.decode_frames(
+                data + partial[:cut])
+            self.assertEqual(received, ['<14>complete'])
+            self.assertEqual(consumed, len(data))
+
+    def test_invalid_length(self):
+        self.assertRaises(ValueError, plog.wire.decode_frames, 'x1 a')
+        self.assertRaises(ValueError, plog.wire.decode_frames, '-1 a')
+        self.assertRaises(ValueError, plog.wire.decode_frames, '1' * 12)
+
+    def test_max_size(self):
+        data = plog.wire.encode_frame('x' * 100)
+        self.assertRaises(ValueError, plog.wire.decode_frames, data, 99)
+        self.assertEqual(len(plog.wire.decode_frames(data, 100)[0]), 1)
+
+    def test_frame_end(self):
+        data = plog.wire.encode_frame('x' * 100)
+        self.assertEqual(plog.wire.get_frame_end(data[:3]), 0)
+        self.assertEqual(plog.wire.get_frame_end(data[:4]), len(data))
+        self.assertRaises(ValueError, plog.wire.get_frame_end, 'x1 a')
+
+class FragmentTest(unittest.TestCase):
+    """
+    Tests of fragment messages.
+    """
+
+    def test_round_trip(self):
+        data = ''.join([chr(value % 256) for value in xrange(1000)])
+        fragments = plog.wire.encode_fragments(0xabc, data, 300)
+        self.assertEqual(len(fragments), 4)
+        parts = []
+        for index, fragment in enumerate(fragments):
+            self.assertTrue(len(fragment)
+                            <= 300 + len(plog.wire.FRAGMENT_SIGNATURE))
+            msg_id, frag_index, count, part = \
+                plog.wire.decode_fragment(fragment)
+            self.assertEqual((msg_id, frag_index, count),
+                             (0xabc, index, len(fragments)))
+            parts.append(part)
+        self.assertEqual(''.join(parts), data)
+
+    def test_malformed(self):
+        for msg in ('!!FR ', '!!FR 1 0', '!!FR x 0 1 data',
+                    '!!FR 1 a 1 data', '!!FR 1 1 1 data',
+                    '!!FR 1 -1 1 data', '!!FR 1 0 0 data'):
+            self.assertRaises(ValueError, plog.wire.decode_fragment, msg)
+
+    def test_datagram_message(self):
+        fragment = plog.wire.encode_fragments(1, 'x' * 10, 100)[0]
+        frame = plog.wire.encode_syslog(1, 6, fragment)
+        self.assertEqual(plog.wire.get_datagram_message(frame), fragment)
+        compressed = plog.wire.compress(plog.wire.CODEC_ZLIB, 'x', 6)
+        frame = plog.wire.encode_syslog(1, 6, compressed)
+        self.assertEqual(plog.wire.get_datagram_message(frame), compressed)
+        self.assertEqual(plog.wire.get_datagram_message('<14>!!RQ x'), None)
+        self.assertEqual(plog.wire.get_datagram_message('!!FR 1 0 1 x'),
+                         None)
+
+class CompressTest(unittest.TestCase):
+    """
+    Tests of compressed messages.
+    """
+
+    def test_round_trip(self):
+        data = frames(['<14>message %d' % (num, ) for num in xrange(100)])
+        for codec in (plog.wire.CODEC_ZLIB, plog.wire.CODEC_ZSTD):
+            if not plog.wire.has_codec(codec):
+                continue
+            msg = plog.wire.compress(codec, data, 3)
+            self.assertTrue(msg.startswith(plog.wire.COMPRESS_SIGNATURE))
+            self.assertEqual(plog.wire.decompress(msg, len(data)), data)
+
+    def test_max_size(self):
+        data = 'x' * 10000
+        msg = plog.wire.compress(plog.wire.CODEC_ZLIB, data, 6)
+        self.assertRaises(ValueError, plog.wire.decompress, msg, 9999)
+
+    def test_malformed(self):
+        msg = plog.wire.compress(plog.wire.CODEC_ZLIB, 'x' * 100, 6)
+        for bad in (plog.wire.COMPRESS_SIGNATURE, msg[:-1],
+                    msg[:-6] + 'xxxxx\n', msg[:5] + 'q' + msg[6:],
+                    plog.wire.COMPRESS_SIGNATURE + 'zgarbage\n'):
+            self.assertRaises(ValueError, plog.wire.decompress, bad, 1000)
+
+class DecodeLayersTest(unittest.TestCase):
+    """
+    Tests of decoding the wire layers of received datagrams.
+    """
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.daemon = plog.log2db.main.Log2DbDaemon()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def construct(self, msg):
+        """
+        Construct events from msg sent in a datagram.
+        """
+        return self.daemon._construct_events(datagram(msg), ADDR)
+
+    def test_single(self):
+        events = self.construct('plain message')
+        self.assertEqual([event.msg for event in events], ['plain message'])
+
+    def test_batch(self):
+        msgs = ['message %d' % (num, ) for num in xrange(3)]
+        events = self.construct(batch([syslog(msg) for msg in msgs]))
+        self.assertEqual([event.msg for event in events], msgs)
+
+    def test_compressed_fragments(self):
+        msgs = ['message %d %s' % (num, 'x' * 100) for num in xrange(50)]
+        compressed = plog.wire.compress(
+            plog.wire.CODEC_ZLIB, frames([syslog(msg) for msg in msgs]), 0)
+        fragments = plog.wire.encode_fragments(
+            7, syslog(compressed), plog.FRAGMENT_DATA_MIN + 100)
+        self.assertTrue(len(fragments) > 1)
+        for fragment in fragments[:-1]:
+            self.assertEqual(self.construct(fragment), [])
+        events = self.construct(fragments[-1])
+        self.assertEqual([event.msg for event in events], msgs)
+
+    def test_fragment_zero_byte(self):
+        fragments = plog.wire.encode_fragments(
+            8, syslog('message\000\000'), plog.wire.FRAGMENT_HEADER_MAX + 12)
+        self.assertTrue(fragments[0].endswith('\000'))
+        for fragment in fragments:
+            events = self.construct(fragment)
+        self.assertEqual([event.msg for event in events],
+                         ['message\000\000'])
+
+    def test_nested(self):
+        inner = syslog(batch([syslog('message')]))
+        for outer in (batch([inner]),
+                      batch([syslog(plog.wire.encode_fragments(
+                          1, syslog('message'), 100)[0])]),
+                      plog.wire.compress(plog.wire.CODEC_ZLIB,
+                                         frames([inner]), 6)):
+            self.assertEqual(self.construct(outer), [])
+
+    def test_nested_fragments(self):
+        inner = syslog(
+            plog.wire.encode_fragments(1, syslog('message'), 100)[0])
+        fragment = plog.wire.encode_fragments(2, inner, 1000)[0]
+        self.assertEqual(self.construct(fragment), [])
+        inner = syslog(batch([syslog('message')]))
+        fragment = plog.wire.encode_fragments(3, inner, 1000)[0]
+        self.assertEqual(self.construct(fragment), [])
+
+    def test_malformed(self):
+        compressed = plog.wire.compress(plog.wire.CODEC_ZLIB, 'x', 6)
+        for msg in (plog.wire.BATCH_SIGNATURE + 'x1 a',
+                    compressed[:-3] + '\n',
+                    plog.wire.FRAGMENT_SIGNATURE + 'x 0 1 a'):
+            self.assertEqual(self.construct(msg), [])
+
+class ClientTest(unittest.TestCase):
+    """
+    Tests of frames received over TCP connections in log2db.
+    """
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.daemon = plog.log2db.main.Log2DbDaemon()
+        self.sender, self.client = socket.socketpair()
+        self.daemon._clients[self.client] = (ADDR, [], 0, 0)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.sender.close()
+        self.client.close()
+
+    def recv(self, data):
+        """
+        Send data to the client connection and return the frames read.
+        """
+        self.sender.sendall(data)
+        return [frame for frame, addr in self.daemon._recv_client(self.client)]
+
+    def test_chunks(self):
+        msgs = [syslog('first'), syslog('x' * 10000), syslog('last')]
+        data = frames(msgs)
+        received = []
+        for start in xrange(0, len(data), 1000):
+            received.extend(self.recv(data[start:start + 1000]))
+            if start == 0:
+                self.assertEqual(received, msgs[:1])
+        self.assertEqual(received, msgs)
+        self.assertEqual(self.daemon._clients[self.client][2], 0)
+
+    def test_invalid(self):
+        self.assertEqual(self.recv('12 <14>message' + 'x' * 20), [])
+        self.assertFalse(self.client in self.daemon._clients)
+
+class RoundTripTest(unittest.TestCase):
+    """
+    Tests of entries sent by the file2log logger over UDP and decoded
+    by log2db.
+    """
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+        self.directory = tempfile.mkdtemp()
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.daemon = plog.log2db.main.Log2DbDaemon()
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.receiver.close()
+        shutil.rmtree(self.directory)
+
+    def round_trip(self, entries, **options):
+        """
+        Send entries with the file2log options and return the events
+        decoded from the datagrams received.
+        """
+        path = os.path.join(self.directory, 'plog.cfg')
+        cfg_file = open(path, 'w')
+        cfg_file.write('[file2log]\nsyslog_host=127.0.0.1\n'
+                       'syslog_port=%d\n' % (self.receiver.getsockname()[1], ))
+        for option in options.iteritems():
+            cfg_file.write('%s=%s\n' % option)
+        cfg_file.close()
+
+        logger = plog.file2log.logger.Logger(plog.config.Config(path))
+        logger.log('test', entries)
+        logger.close()
+        self.assertTrue(logger.stats_fragments > 1)
+
+        events = []
+        while select.select([self.receiver], [], [], 0.5)[0]:
+            data = self.receiver.recv(plog.DATAGRAM_MAX)
+            events.extend(self.daemon._construct_events(data, ADDR))
+        return events
+
+    def assertRoundTrip(self, **options):
+        # Traceback too large for a datagram, also when compressed.
+        traceback = ''.join(['%08x\n' % (zlib.crc32(str(num)) & 0xffffffff, )
+                             for num in xrange(700)])
+        entries = [plog.entry.AppserverEntry('failed', traceback),
+                   plog.entry.AppserverEntry('after', 'small')]
+        events = self.round_trip(entries, **options)
+        self.assertEqual([(event.msg, event.msg_extra) for event in events],
+                         [('failed', traceback), ('after', 'small')])
+
+    def test_fragments(self):
+        self.assertRoundTrip()
+
+    def test_compressed_fragments(self):
+        self.assertRoundTrip(compression='zlib')
+
+    def test_binary_fragments(self):
+        self.assertRoundTrip(wire_format='binary', compression='zlib')
+
+if __name__ == '__main__':
+    unittest.main()